@@ -0,0 +1,653 @@
+# benchmark_transcribe_pro.py
+# 後端效能基準測試 (不呼叫真實 API、不需 FFmpeg)。
+# 用法：
+#   python benchmark_transcribe_pro.py schedule [--trials 200] [--workers 4]
+#   python benchmark_transcribe_pro.py throughput [--chunks 24] [--workers 1,2,4,8] [--hedge]
+#   python benchmark_transcribe_pro.py startup [--jobs 5] [--client genai|standin]
+#   python benchmark_transcribe_pro.py importtime [--runs 5] [--budget_ms 1000]
+#   python benchmark_transcribe_pro.py timecode [--corpus DIR_OR_FILE ...] [--baseline_rev REV]
+#   python benchmark_transcribe_pro.py corrector [--cues 1250,2500,5000] [--bad 0.5] [--baseline_rev REV]
+#   python benchmark_transcribe_pro.py merge [--files 20,100,200] [--chunk_duration 1800] [--baseline_rev REV]
+import argparse
+import glob
+import heapq
+import importlib.util
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import transcribe_pro_v5_branch_04_branch_79 as backend
+import gemini_standin
+
+
+# ==============================================================================
+#  schedule：多區段混合長度工作的排程 makespan 模擬
+# ==============================================================================
+def _random_multi_segment_parts(rng, chunk_duration):
+    """產生一份隨機的多區段工作：每個區段依 chunk_duration 切成小段，回傳各小段秒數。"""
+    parts = []
+    for _ in range(rng.randint(3, 8)):
+        seg_seconds = rng.uniform(60, 2700)
+        count = max(1, math.ceil(seg_seconds / chunk_duration))
+        for k in range(count):
+            parts.append(min(chunk_duration, seg_seconds - k * chunk_duration))
+    return parts
+
+
+def _simulate_makespan(ordered_keys, latencies, workers):
+    """依送出順序模擬 ThreadPoolExecutor (FIFO、固定 worker 數) 的完成時間。"""
+    free_at = [0.0] * workers
+    heapq.heapify(free_at)
+    finish = 0.0
+    for key in ordered_keys:
+        start = heapq.heappop(free_at)
+        end = start + latencies[key]
+        finish = max(finish, end)
+        heapq.heappush(free_at, end)
+    return finish
+
+
+def bench_schedule(args):
+    rng = random.Random(args.seed)
+    results = {policy: [] for policy in backend.SCHEDULE_POLICIES}
+    for trial in range(args.trials):
+        parts = _random_multi_segment_parts(rng, args.chunk_duration)
+        # 延遲 ≈ 固定開銷 + 與音訊長度成正比的生成時間，並有長尾雜訊；少數區塊固定偏慢 (密集對白)
+        slow_parts = set(rng.sample(range(len(parts)), k=max(1, len(parts) // 10)))
+        base_latency = {
+            i: 8.0 + seconds * 0.25 * (3.0 if i in slow_parts else 1.0)
+            for i, seconds in enumerate(parts)
+        }
+        latencies = {i: lat * rng.lognormvariate(0, 0.15) for i, lat in base_latency.items()}
+        jobs = [(i, i) for i in range(len(parts))]
+        durations = dict(enumerate(parts))
+        names = {i: f"part_{i:03d}" for i in range(len(parts))}
+
+        # history：以前一次執行 (另一組雜訊) 的延遲建立歷史記錄
+        history = backend.ChunkHistory(None)
+        for i, lat in base_latency.items():
+            history.record(names[i], lat * rng.lognormvariate(0, 0.15), True)
+        pinned = [i + 1 for i in sorted(slow_parts)]
+
+        for policy in backend.SCHEDULE_POLICIES:
+            ordered = backend.order_chunk_jobs(
+                jobs, policy, durations=durations, history=history, names=names,
+                pinned=pinned if policy == "pinned" else None,
+            )
+            results[policy].append(_simulate_makespan([k for k, _ in ordered], latencies, args.workers))
+
+    baseline = statistics.mean(results["index"])
+    print(f"[schedule] trials={args.trials} workers={args.workers} chunk_duration={args.chunk_duration}s")
+    print(f"{'policy':<10}{'mean makespan (s)':>20}{'p90 (s)':>12}{'vs index':>12}")
+    for policy, values in results.items():
+        mean = statistics.mean(values)
+        p90 = sorted(values)[max(0, math.ceil(0.9 * len(values)) - 1)]
+        print(f"{policy:<10}{mean:>20.1f}{p90:>12.1f}{(mean / baseline - 1) * 100:>+11.1f}%")
+
+
+# ==============================================================================
+#  throughput：以本機 Gemini 替身跑完整的 transcribe_audio + ChunkTaskRunner 流程
+# ==============================================================================
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _run_throughput_case(args, clock, workers, hedge):
+    client = gemini_standin.StandinClient(
+        duration_seconds=args.chunk_duration, seed=args.seed, clock=clock,
+        latency=gemini_standin.lognormal_latency(args.latency_median, args.latency_sigma, cap=args.latency_median * 8),
+        upload_latency=gemini_standin.uniform_latency(1.0, 4.0),
+        rate_429=args.rate_429, rate_5xx=args.rate_5xx, rate_empty=args.rate_empty, rate_malformed=args.rate_malformed,
+        server_rpm=args.server_rpm, retry_delay_hint=args.retry_hint,
+    )
+    limiter = backend.MinuteRateLimiter(args.rpm)
+    runner = backend.ChunkTaskRunner(workers, rate_limiter=limiter, hedge=hedge,
+                                     poll_interval=max(0.005, 2.0 / args.time_scale))
+    with tempfile.TemporaryDirectory() as tmp:
+        jobs = []
+        for i in range(args.chunks):
+            path = os.path.join(tmp, f"bench_chunk_{i:03d}.mp3")
+            with open(path, 'wb') as f:
+                f.write(f"chunk {i}".encode() * 256)
+            jobs.append((i, (i, path)))
+
+        def job(payload, cancel_event=None, claim_result=None, tag=""):
+            _, path = payload
+            return backend.transcribe_audio(
+                client, path, "benchmark prompt", "standin", args.correction_threshold, 0.5, args.chunk_duration,
+                0, "ffmpeg", max_retries=args.max_retries, rate_limiter=limiter,
+                retry_base=args.retry_base, retry_cap=args.retry_cap,
+                upload_timeout=300, generate_timeout=args.latency_median * 6,
+                cancel_event=cancel_event, claim_result=claim_result, attempt_label=tag,
+            )
+
+        start = clock.time()
+        results = runner.run(jobs, job)
+        makespan = clock.time() - start
+    ok = sum(1 for srt_path, _ in results.values() if srt_path)
+    chunk_seconds = [seconds for seconds, _ in runner.chunk_times.values()]
+    return {
+        "ok": ok, "makespan": makespan, "chunks_per_hour": ok / makespan * 3600 if makespan else 0.0,
+        "p50": _percentile(chunk_seconds, 0.5), "p90": _percentile(chunk_seconds, 0.9),
+        "requests": client.stats["requests"], "max_active": client.stats["max_active"],
+        "rejected_429": client.stats["429"] + client.stats["server_rpm_rejects"],
+        "server_rpm_rejects": client.stats["server_rpm_rejects"],
+    }
+
+
+def bench_throughput(args):
+    worker_counts = [int(w) for w in str(args.workers).split(",") if w.strip()]
+    clock = gemini_standin.VirtualClock(args.time_scale)
+    restore = clock.install(backend)
+    logging.disable(logging.CRITICAL)
+    try:
+        print(f"[throughput] chunks={args.chunks} chunk_duration={args.chunk_duration}s rpm={args.rpm} server_rpm={args.server_rpm} "
+              f"latency_median={args.latency_median}s 429={args.rate_429} 5xx={args.rate_5xx} empty={args.rate_empty} "
+              f"malformed={args.rate_malformed} time_scale={args.time_scale}x (時間皆為虛擬秒)")
+        print(f"{'workers':>8}{'hedge':>7}{'ok':>8}{'makespan':>11}{'chunks/h':>10}{'p50':>8}{'p90':>8}{'requests':>10}{'429s':>6}{'srv_rpm':>8}{'max_act':>8}")
+        for workers in worker_counts:
+            for hedge in ((False, True) if args.hedge else (False,)):
+                r = _run_throughput_case(args, clock, workers, hedge)
+                print(f"{workers:>8}{'on' if hedge else 'off':>7}{r['ok']:>5}/{args.chunks:<2}{r['makespan']:>11.0f}{r['chunks_per_hour']:>10.1f}"
+                      f"{r['p50']:>8.0f}{r['p90']:>8.0f}{r['requests']:>10}{r['rejected_429']:>6}{r['server_rpm_rejects']:>8}{r['max_active']:>8}")
+    finally:
+        logging.disable(logging.NOTSET)
+        restore()
+
+
+# ==============================================================================
+#  startup：GUI 動作「送出任務 → 第一個 API 請求」的延遲 (每次新程序 vs 常駐工作程序)
+# ==============================================================================
+def _first_request_probe(config, log_queue=None):
+    """與 run_*_task 同型的探測任務：取得 API 用戶端後即是送出第一個請求的時間點。"""
+    backend.get_task_client(config)
+    log_queue.put(("FIRST_REQUEST", time.time()))
+    return 0
+
+
+def _spawn_probe(config, log_queue):
+    """舊流程：每個任務一個新程序 (GUI 先前的 process_wrapper)。"""
+    sys.exit(_first_request_probe(config, log_queue))
+
+
+def _wait_first_request(events, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            item = events.get(timeout=max(0.01, deadline - time.time()))
+        except queue.Empty:
+            break
+        if isinstance(item, tuple) and item[0] == "FIRST_REQUEST":
+            return item[1]
+    raise RuntimeError("等待探測任務逾時。")
+
+
+def bench_startup(args):
+    multiprocessing.set_start_method(args.start_method, force=True)
+    config = SimpleNamespace(standin=args.client == "standin", api_key="benchmark-key", chunk_duration=600)
+    events = multiprocessing.Queue()
+
+    spawn_times = []
+    for _ in range(args.jobs):
+        t0 = time.time()
+        process = multiprocessing.Process(target=_spawn_probe, args=(config, events))
+        process.start()
+        spawn_times.append(_wait_first_request(events) - t0)
+        process.join()
+
+    worker = backend.BackendWorker(events)
+    worker_times = []
+    try:
+        for _ in range(args.jobs + 1):
+            t0 = time.time()
+            worker.submit(_first_request_probe, config)
+            worker_times.append(_wait_first_request(events) - t0)
+    finally:
+        worker.stop()
+
+    print(f"[startup] jobs={args.jobs} client={args.client} start_method={args.start_method} (送出任務 → 取得用戶端、可送出第一個請求)")
+    print(f"{'mode':<22}{'first (ms)':>12}{'mean (ms)':>12}{'p90 (ms)':>12}")
+    rows = [
+        ("spawn per job", spawn_times[0], spawn_times),
+        ("worker (cold start)", worker_times[0], worker_times[:1]),
+        ("worker (warm)", worker_times[1], worker_times[1:]),
+    ]
+    for name, first, values in rows:
+        print(f"{name:<22}{first * 1000:>12.1f}{statistics.mean(values) * 1000:>12.1f}{_percentile(values, 0.9) * 1000:>12.1f}")
+
+
+# ==============================================================================
+#  importtime：後端匯入時間與 --merge_only 的端到端啟動時間 (超出預算時回傳非零退出碼)
+# ==============================================================================
+BACKEND_DIR = os.path.dirname(os.path.abspath(backend.__file__))
+BACKEND_MODULE = os.path.splitext(os.path.basename(backend.__file__))[0]
+
+
+def _parse_importtime(stderr):
+    """解析 python -X importtime 的輸出，回傳 {模組名稱: 累計微秒}。"""
+    cumulative = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cum, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        if cum.isdigit():
+            cumulative[name] = int(cum)
+    return cumulative
+
+
+def _merge_only_fixture(tmp, chunk_duration=60, chunks=3):
+    """建立 --merge_only 所需的假輸入檔與區塊 SRT，回傳輸入檔路徑。"""
+    base = f"_bench_merge_{os.getpid()}"
+    rng = random.Random(0)
+    for i in range(chunks):
+        with open(os.path.join(tmp, f"{base}_{chunk_duration}s_chunk_{i:03d}.srt"), "w", encoding="utf-8") as f:
+            f.write(gemini_standin.synthetic_srt(chunk_duration, rng, fenced=False))
+    input_file = os.path.join(tmp, f"{base}.mp4")
+    open(input_file, "wb").close()
+    return input_file
+
+
+def bench_importtime(args):
+    import_ms, sdk_loaded = [], False
+    for _ in range(args.runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {BACKEND_MODULE}"],
+                              cwd=BACKEND_DIR, capture_output=True, text=True, check=True)
+        cumulative = _parse_importtime(proc.stderr)
+        import_ms.append(cumulative.get(BACKEND_MODULE, 0) / 1000)
+        sdk_loaded = sdk_loaded or "google.genai" in cumulative
+
+    merge_ms = []
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = _merge_only_fixture(tmp)
+        base = os.path.splitext(os.path.basename(input_file))[0]
+        try:
+            for _ in range(args.runs):
+                t0 = time.perf_counter()
+                subprocess.run([sys.executable, backend.__file__, "--file", input_file, "--ffmpeg_path", "ffmpeg",
+                                "--temp_dir", tmp, "--chunk_duration", "60", "--merge_only"],
+                               capture_output=True, check=True)
+                merge_ms.append((time.perf_counter() - t0) * 1000)
+        finally:
+            # 僅合併模式把最終 SRT 與日誌寫在後端所在資料夾
+            for leftover in glob.glob(os.path.join(backend.APP_PATH, f"{glob.escape(base)}*")):
+                os.remove(leftover)
+
+    print(f"[importtime] runs={args.runs} (取最小值；後端: {BACKEND_MODULE})")
+    print(f"{'measure':<34}{'min (ms)':>10}{'median (ms)':>13}")
+    print(f"{'import backend (-X importtime)':<34}{min(import_ms):>10.1f}{statistics.median(import_ms):>13.1f}")
+    print(f"{'--merge_only end to end':<34}{min(merge_ms):>10.1f}{statistics.median(merge_ms):>13.1f}")
+    print(f"匯入後端時載入 google.genai: {'是' if sdk_loaded else '否'}")
+    failures = []
+    if sdk_loaded:
+        failures.append("匯入後端時不應載入 google.genai")
+    if min(merge_ms) > args.budget_ms:
+        failures.append(f"--merge_only 啟動 {min(merge_ms):.0f} ms 超過預算 {args.budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+# ==============================================================================
+#  timecode：整數毫秒時間碼與 timedelta 舊版實作的速度、輸出比對
+# ==============================================================================
+_TIMECODE_RE = re.compile(r'^\s*(\S+)\s*-->\s*(\S+)', re.MULTILINE)
+
+
+def _load_timecode_corpus(paths, chunks, chunk_duration, seed):
+    """讀取 --corpus 指定的 .raw.txt / .srt (檔案或資料夾)；未指定時以替身產生合成的模型回應 (每 4 份含 1 份格式錯誤)。"""
+    if not paths:
+        rng = random.Random(seed)
+        return [gemini_standin.malformed_srt(chunk_duration, rng, rng.choice(gemini_standin.MALFORMED_KINDS))
+                if i % 4 == 3 else gemini_standin.synthetic_srt(chunk_duration, rng) for i in range(chunks)]
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in ("*.raw.txt", "*.srt"):
+                files.extend(sorted(glob.glob(os.path.join(glob.escape(path), "**", pattern), recursive=True)))
+        else:
+            files.append(path)
+    corpus = []
+    for path in files:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            corpus.append(f.read())
+    return corpus
+
+
+def _smart_centering_response(rng, cues):
+    """產生會反覆觸發「智慧置中」的模型回應：壞字幕塊 (無法解析或倒退重疊) 之後，下一條有效字幕
+    與上一個正確結束時間的間隔為奇數毫秒且短於超長靜音門檻，置中後的時間會落在半毫秒上並影響後續校正。"""
+    fmt = backend.format_timecode_ms
+    blocks, t = [], rng.randint(0, 999)
+    for i in range(1, cues + 1):
+        text = "這是一句比較長的字幕文字" if rng.random() < 0.5 else "嗯"
+        if rng.random() < 0.4:
+            if rng.random() < 0.5:
+                time_line = f"{fmt(t)} --> ??:??"
+            else:
+                start_ms = max(0, t - rng.randint(2000, 8000))
+                time_line = f"{fmt(start_ms)} --> {fmt(start_ms + rng.randint(500, 1500))}"
+            blocks.append(f"{i}\n{time_line}\n{text}\n")
+            t += 2 * rng.randint(600, 4000) + 1
+            continue
+        end_ms = t + rng.randint(800, 4000)
+        blocks.append(f"{i}\n{fmt(t)} --> {fmt(end_ms)}\n{text}\n")
+        t = end_ms + rng.randint(0, 1500)
+    return "\n".join(blocks)
+
+
+def _default_baseline(rev, marker):
+    """未指定 --baseline_rev 時，取後端首次出現 marker 之前的版本；尚未提交時為 HEAD。"""
+    if rev:
+        return rev
+    proc = subprocess.run(["git", "log", "--format=%H", "--reverse", "-S", marker, "--",
+                           os.path.basename(backend.__file__)],
+                          cwd=BACKEND_DIR, capture_output=True, text=True)
+    introduced = proc.stdout.split()
+    return f"{introduced[0]}~1" if proc.returncode == 0 and introduced else "HEAD"
+
+
+def _load_backend_revision(rev, tmp):
+    """以 git show 取出指定版本的後端並匯入為獨立模組。"""
+    source = subprocess.run(["git", "show", f"{rev}:{os.path.basename(backend.__file__)}"],
+                            cwd=BACKEND_DIR, capture_output=True, check=True).stdout
+    path = os.path.join(tmp, "baseline_backend.py")
+    with open(path, "wb") as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location("baseline_backend", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _best_of(runs, fn):
+    best = float("inf")
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def bench_timecode(args):
+    corpus = _load_timecode_corpus(args.corpus, args.chunks, args.chunk_duration, args.seed)
+    if not corpus:
+        print("FAIL: --corpus 中沒有 .raw.txt / .srt 檔案")
+        return 1
+    rev = _default_baseline(args.baseline_rev, "def parse_timecode_ms")
+    tolerance = timedelta(seconds=args.overlap_tolerance)
+    chunk_td = timedelta(seconds=args.chunk_duration)
+    stamps = [t for text in corpus for pair in _TIMECODE_RE.findall(text) for t in pair]
+    offset = timedelta(seconds=args.chunk_duration * 7)
+    fuzz_rng = random.Random(args.seed)
+    fuzz = [_smart_centering_response(fuzz_rng, fuzz_rng.randint(2, 60)) for _ in range(args.fuzz)]
+
+    # 修正器會對不標準的字幕塊大量輸出警告，量測時關閉
+    logging.disable(logging.CRITICAL)
+    try:
+        clean = [backend.format_srt_from_text_v16(text, "bench", tolerance, chunk_td)[0] for text in corpus]
+        with tempfile.TemporaryDirectory() as tmp:
+            old = _load_backend_revision(rev, tmp)
+            values_ms = [backend.parse_timecode_ms(t) for t in stamps]
+            values_ms = [v for v in values_ms if v is not None]
+            values_td = [timedelta(milliseconds=v) for v in values_ms]
+            cases = [
+                ("parse timestamps", len(stamps),
+                 lambda: [old.parse_time_v10(t) for t in stamps],
+                 lambda: [backend.parse_timecode_ms(t) for t in stamps],
+                 lambda: [None if v is None else v // timedelta(milliseconds=1) for v in map(old.parse_time_v10, stamps)]
+                         == [backend.parse_timecode_ms(t) for t in stamps]),
+                ("format timestamps", len(values_ms),
+                 lambda: [old.format_timedelta_v7(td) for td in values_td],
+                 lambda: [backend.format_timecode_ms(ms) for ms in values_ms],
+                 lambda: [old.format_timedelta_v7(td) for td in values_td]
+                         == [backend.format_timecode_ms(ms) for ms in values_ms]),
+                ("format_srt_from_text_v16", len(corpus),
+                 lambda: [old.format_srt_from_text_v16(text, "bench", tolerance, chunk_td) for text in corpus],
+                 lambda: [backend.format_srt_from_text_v16(text, "bench", tolerance, chunk_td) for text in corpus],
+                 lambda: [old.format_srt_from_text_v16(text, "bench", tolerance, chunk_td) for text in corpus]
+                         == [backend.format_srt_from_text_v16(text, "bench", tolerance, chunk_td) for text in corpus]),
+                ("smart centering fuzz", len(fuzz),
+                 lambda: [old.format_srt_from_text_v16(text, "bench", tolerance, chunk_td) for text in fuzz],
+                 lambda: [backend.format_srt_from_text_v16(text, "bench", tolerance, chunk_td) for text in fuzz],
+                 lambda: [old.format_srt_from_text_v16(text, "bench", tolerance, chunk_td) for text in fuzz]
+                         == [backend.format_srt_from_text_v16(text, "bench", tolerance, chunk_td) for text in fuzz]),
+                ("adjust_srt_content_with_offset", len(clean),
+                 lambda: [old.adjust_srt_content_with_offset(text, offset) for text in clean],
+                 lambda: [backend.adjust_srt_content_with_offset(text, offset) for text in clean],
+                 lambda: [old.adjust_srt_content_with_offset(text, offset) for text in clean]
+                         == [backend.adjust_srt_content_with_offset(text, offset) for text in clean]),
+            ]
+            rows = [(name, n, _best_of(args.runs, run_old), _best_of(args.runs, run_new), same())
+                    for name, n, run_old, run_new, same in cases]
+    finally:
+        logging.disable(logging.NOTSET)
+
+    print(f"[timecode] 語料 {len(corpus)} 份、時間戳 {len(stamps)} 個；基準版本 {rev}；runs={args.runs} (取最小值)")
+    print(f"{'measure':<34}{'items':>8}{'old (ms)':>11}{'new (ms)':>11}{'speedup':>9}  output")
+    for name, n, old_ms, new_ms, same in rows:
+        print(f"{name:<34}{n:>8}{old_ms:>11.2f}{new_ms:>11.2f}{old_ms / max(new_ms, 1e-9):>8.2f}x  {'identical' if same else 'DIFFERENT'}")
+    failures = [name for name, *_, same in rows if not same]
+    for name in failures:
+        print(f"FAIL: {name} 的輸出與基準版本不同")
+    return 1 if failures else 0
+
+
+# ==============================================================================
+#  corrector：大量壞時間戳的長回應，比較時間軸修正器的規模化行為
+# ==============================================================================
+def _bad_timestamp_response(cues, bad_ratio, rng, jump=False):
+    """產生 cues 條字幕的模型回應，其中約 bad_ratio 的時間戳無法解析或倒退重疊。
+
+    jump=True 時第 2 條字幕跳到 10 小時後，其後每一條都與它重疊、且後面再也找不到有效的開始時間。
+    """
+    blocks, t = [], 500
+    for i in range(1, cues + 1):
+        start_ms, end_ms = t, t + rng.randint(800, 4000)
+        t = end_ms + rng.randint(50, 1500)
+        if jump and i == 2:
+            start_ms, end_ms = start_ms + 36000000, end_ms + 36000000
+        elif rng.random() < bad_ratio:
+            if rng.random() < 0.5:
+                blocks.append(f"{i}\n{backend.format_timecode_ms(start_ms)} --> ??:??\n第 {i} 句\n")
+                continue
+            start_ms = max(0, start_ms - rng.randint(5000, 60000))
+            end_ms = start_ms + rng.randint(800, 4000)
+        blocks.append(f"{i}\n{backend.format_timecode_ms(start_ms)} --> {backend.format_timecode_ms(end_ms)}\n第 {i} 句\n")
+    return "```srt\n" + "\n".join(blocks) + "```\n"
+
+
+def bench_corrector(args):
+    # 以 timedelta 實作 (整數毫秒時間碼之前，亦早於線性前瞻) 作為輸出基準
+    rev = _default_baseline(args.baseline_rev, "def parse_timecode_ms")
+    sizes = [int(n) for n in args.cues.split(",")]
+    tolerance, chunk_td = timedelta(seconds=args.overlap_tolerance), timedelta(hours=100)
+    rows = []
+    logging.disable(logging.CRITICAL)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            old = _load_backend_revision(rev, tmp)
+            for scenario, jump in (("bad timestamps", False), ("bad + timeline jump", True)):
+                for cues in sizes:
+                    text = _bad_timestamp_response(cues, args.bad, random.Random(args.seed + cues), jump=jump)
+                    old_ms = _best_of(args.runs, lambda: old.format_srt_from_text_v16(text, "bench", tolerance, chunk_td))
+                    new_ms = _best_of(args.runs, lambda: backend.format_srt_from_text_v16(text, "bench", tolerance, chunk_td))
+                    same = (old.format_srt_from_text_v16(text, "bench", tolerance, chunk_td)
+                            == backend.format_srt_from_text_v16(text, "bench", tolerance, chunk_td))
+                    rows.append((scenario, cues, old_ms, new_ms, same))
+    finally:
+        logging.disable(logging.NOTSET)
+
+    print(f"[corrector] 壞時間戳比例 {args.bad:.0%}；基準版本 {rev}；runs={args.runs} (取最小值)")
+    print(f"{'scenario':<24}{'cues':>7}{'old (ms)':>11}{'new (ms)':>11}{'speedup':>9}{'new us/cue':>12}  output")
+    for scenario, cues, old_ms, new_ms, same in rows:
+        print(f"{scenario:<24}{cues:>7}{old_ms:>11.1f}{new_ms:>11.1f}{old_ms / max(new_ms, 1e-9):>8.2f}x"
+              f"{new_ms * 1000 / cues:>12.1f}  {'identical' if same else 'DIFFERENT'}")
+    failures = [(scenario, cues) for scenario, cues, *_, same in rows if not same]
+    for scenario, cues in failures:
+        print(f"FAIL: {scenario} ({cues} cues) 的輸出與基準版本不同")
+    return 1 if failures else 0
+
+
+# ==============================================================================
+#  merge：數百個區塊 SRT 的合併時間與峰值記憶體
+# ==============================================================================
+def _peak_memory_mb(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1] / (1 << 20)
+    finally:
+        tracemalloc.stop()
+
+
+def bench_merge(args):
+    rev = _default_baseline(args.baseline_rev, "def iter_srt_cues")
+    sizes = [int(n) for n in args.files.split(",")]
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        old = _load_backend_revision(rev, tmp)
+        rng = random.Random(args.seed)
+        srt_files = []
+        for i in range(max(sizes)):
+            path = os.path.join(tmp, f"bench_{args.chunk_duration}s_chunk_{i:04d}.srt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(gemini_standin.synthetic_srt(args.chunk_duration, rng, fenced=False))
+            srt_files.append(path)
+        # 絕對時間軸檔案：每個區塊加上自己的位移，模擬多區段任務的 _abs.srt
+        abs_files = []
+        for i, path in enumerate(srt_files):
+            abs_path = path[:-4] + "_abs.srt"
+            with open(path, "r", encoding="utf-8") as f:
+                content = f.read()
+            with open(abs_path, "w", encoding="utf-8") as f:
+                f.write(backend.adjust_srt_content_with_offset(content, timedelta(seconds=i * args.chunk_duration)))
+            abs_files.append(abs_path)
+
+        logging.disable(logging.CRITICAL)
+        try:
+            for count in sizes:
+                cues = sum(1 for path in srt_files[:count] for _ in backend.iter_srt_cues(path))
+                cases = [
+                    ("merge_srts", lambda m, out, n=count: m.merge_srts(srt_files[:n], out, args.chunk_duration)),
+                    # 反向傳入檔案，讓 k 路合併真的需要排序
+                    ("merge_absolute_srts", lambda m, out, n=count: m.merge_absolute_srts(abs_files[:n][::-1], out)),
+                ]
+                for name, run in cases:
+                    old_out, new_out = os.path.join(tmp, "old.srt"), os.path.join(tmp, "new.srt")
+                    old_ms = _best_of(args.runs, lambda: run(old, old_out))
+                    new_ms = _best_of(args.runs, lambda: run(backend, new_out))
+                    old_mb = _peak_memory_mb(lambda: run(old, old_out))
+                    new_mb = _peak_memory_mb(lambda: run(backend, new_out))
+                    with open(old_out, "r", encoding="utf-8") as f_old, open(new_out, "r", encoding="utf-8") as f_new:
+                        same = f_old.read() == f_new.read()
+                    rows.append((name, count, cues, old_ms, new_ms, old_mb, new_mb, same))
+        finally:
+            logging.disable(logging.NOTSET)
+
+    print(f"[merge] 每檔 {args.chunk_duration}s；基準版本 {rev}；runs={args.runs} (時間取最小值，峰值記憶體以 tracemalloc 量測)")
+    print(f"{'function':<22}{'files':>6}{'cues':>8}{'old (ms)':>10}{'new (ms)':>10}{'speedup':>9}{'old MB':>8}{'new MB':>8}  output")
+    for name, count, cues, old_ms, new_ms, old_mb, new_mb, same in rows:
+        print(f"{name:<22}{count:>6}{cues:>8}{old_ms:>10.1f}{new_ms:>10.1f}{old_ms / max(new_ms, 1e-9):>8.2f}x"
+              f"{old_mb:>8.2f}{new_mb:>8.2f}  {'identical' if same else 'DIFFERENT'}")
+    failures = [(name, count) for name, count, *_, same in rows if not same]
+    for name, count in failures:
+        print(f"FAIL: {name} ({count} 個檔案) 的輸出與基準版本不同")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="transcribe_pro 後端效能基準測試。")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_schedule = sub.add_parser("schedule", help="模擬不同排程策略的多區段工作 makespan。")
+    p_schedule.add_argument("--trials", type=int, default=200)
+    p_schedule.add_argument("--workers", type=int, default=4)
+    p_schedule.add_argument("--chunk_duration", type=int, default=600)
+    p_schedule.add_argument("--seed", type=int, default=20260629)
+    p_schedule.set_defaults(func=bench_schedule)
+
+    p_throughput = sub.add_parser("throughput", help="以本機 Gemini 替身 (虛擬時鐘、錯誤注入) 量測端到端吞吐量與重試行為。")
+    p_throughput.add_argument("--chunks", type=int, default=24)
+    p_throughput.add_argument("--workers", default="1,2,4,8", help="以逗號分隔的 worker 數。")
+    p_throughput.add_argument("--hedge", action='store_true', help="每種 worker 數再以 --hedge 跑一次。")
+    p_throughput.add_argument("--chunk_duration", type=int, default=600)
+    p_throughput.add_argument("--rpm", type=int, default=10, help="客戶端限速器的 RPM。")
+    p_throughput.add_argument("--server_rpm", type=int, default=12, help="替身伺服器端的 RPM 上限 (超過回 429)。0 為不限。")
+    p_throughput.add_argument("--latency_median", type=float, default=45.0)
+    p_throughput.add_argument("--latency_sigma", type=float, default=0.5)
+    p_throughput.add_argument("--rate_429", type=float, default=0.03)
+    p_throughput.add_argument("--rate_5xx", type=float, default=0.03)
+    p_throughput.add_argument("--rate_empty", type=float, default=0.03)
+    p_throughput.add_argument("--rate_malformed", type=float, default=0.05)
+    p_throughput.add_argument("--retry_hint", type=float, default=20.0, help="429 回應附帶的 RetryInfo.retryDelay (秒)。")
+    p_throughput.add_argument("--max_retries", type=int, default=4)
+    p_throughput.add_argument("--retry_base", type=float, default=65)
+    p_throughput.add_argument("--retry_cap", type=float, default=250)
+    p_throughput.add_argument("--correction_threshold", type=int, default=6)
+    p_throughput.add_argument("--time_scale", type=float, default=200.0, help="虛擬時鐘倍速。")
+    p_throughput.add_argument("--seed", type=int, default=20260701)
+    p_throughput.set_defaults(func=bench_throughput)
+
+    p_startup = sub.add_parser("startup", help="量測每個任務新開程序與常駐工作程序的「送出 → 第一個請求」延遲。")
+    p_startup.add_argument("--jobs", type=int, default=5)
+    p_startup.add_argument("--client", choices=("genai", "standin"), default="genai",
+                           help="genai 會建立真正的 genai.Client (不送出請求)；未安裝 google-genai 時請改用 standin。")
+    p_startup.add_argument("--start_method", choices=("spawn", "forkserver", "fork"), default="spawn",
+                           help="GUI 主要執行於 Windows，預設以 spawn 模擬。")
+    p_startup.set_defaults(func=bench_startup)
+
+    p_importtime = sub.add_parser("importtime", help="量測後端匯入時間與 --merge_only 啟動時間，超出預算或載入 SDK 時回傳 1。")
+    p_importtime.add_argument("--runs", type=int, default=5)
+    p_importtime.add_argument("--budget_ms", type=float, default=1000.0, help="--merge_only 端到端時間的上限 (毫秒)。")
+    p_importtime.set_defaults(func=bench_importtime)
+
+    p_timecode = sub.add_parser("timecode", help="比較整數毫秒時間碼與基準版本 (timedelta) 的解析、格式化與 SRT 修正速度，輸出不同時回傳 1。")
+    p_timecode.add_argument("--corpus", nargs="*", default=[], help="模型原始回應 (.raw.txt) 或 SRT 檔案/資料夾；未指定時使用替身合成的回應。")
+    p_timecode.add_argument("--baseline_rev", default=None, help="比對用的 git 版本；預設為引入整數毫秒時間碼之前的版本。")
+    p_timecode.add_argument("--chunks", type=int, default=40)
+    p_timecode.add_argument("--chunk_duration", type=int, default=600)
+    p_timecode.add_argument("--overlap_tolerance", type=float, default=0.5)
+    p_timecode.add_argument("--fuzz", type=int, default=2000, help="額外產生的「智慧置中」模糊測試回應數 (間隔為奇數毫秒)，逐一比對基準版本的輸出。")
+    p_timecode.add_argument("--runs", type=int, default=5)
+    p_timecode.add_argument("--seed", type=int, default=20261019)
+    p_timecode.set_defaults(func=bench_timecode)
+
+    p_corrector = sub.add_parser("corrector", help="以大量壞時間戳的合成長回應比較時間軸修正器與基準版本，輸出不同時回傳 1。")
+    p_corrector.add_argument("--cues", default="1250,2500,5000", help="以逗號分隔的字幕條數。")
+    p_corrector.add_argument("--bad", type=float, default=0.5, help="壞時間戳 (無法解析或倒退重疊) 的比例。")
+    p_corrector.add_argument("--baseline_rev", default=None, help="比對用的 git 版本；預設為引入整數毫秒時間碼之前 (亦即線性前瞻之前) 的版本。")
+    p_corrector.add_argument("--overlap_tolerance", type=float, default=0.5)
+    p_corrector.add_argument("--runs", type=int, default=3)
+    p_corrector.add_argument("--seed", type=int, default=20261019)
+    p_corrector.set_defaults(func=bench_corrector)
+
+    p_merge = sub.add_parser("merge", help="比較 merge_srts / merge_absolute_srts 與基準版本的合併時間與峰值記憶體，輸出不同時回傳 1。")
+    p_merge.add_argument("--files", default="20,100,200", help="以逗號分隔的區塊 SRT 檔案數。")
+    p_merge.add_argument("--chunk_duration", type=int, default=1800)
+    p_merge.add_argument("--baseline_rev", default=None, help="比對用的 git 版本；預設為引入串流合併之前的版本。")
+    p_merge.add_argument("--runs", type=int, default=3)
+    p_merge.add_argument("--seed", type=int, default=20261019)
+    p_merge.set_defaults(func=bench_merge)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args) or 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+# gemini_standin.py
+# 本機 Gemini 替身：實作 transcribe_pro 後端用到的 google-genai 介面子集 (files / models / caches / batches)，
+# 不連網、不消耗額度，供 --standin 測試與基準測試使用。回應為依音訊時長產生的合成 SRT。
+# 可設定延遲分佈、429 / 5xx / 空回應注入、格式錯誤與重複迴圈的 SRT，以及加速的虛擬時鐘。
+import itertools
+import math
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+_real_time = time
+_real_threading = threading
+
+
+# ==============================================================================
+#  虛擬時鐘
+# ==============================================================================
+class VirtualClock:
+    """以 scale 倍速前進的虛擬時鐘：sleep(60) 實際只睡 60/scale 秒，time() 同步加速。
+
+    install(module) 會把模組中的 time 與 threading 換成經過縮放的版本 (threading.Event.wait
+    的 timeout 也會縮放)，讓後端的限速器、重試等待與期限都以虛擬時間運作；回傳還原函式。
+    """
+    def __init__(self, scale=1.0):
+        self.scale = max(1e-6, float(scale))
+        self._real_start = _real_time.monotonic()
+        self._virtual_start = _real_time.time()
+
+    def time(self):
+        return self._virtual_start + (_real_time.monotonic() - self._real_start) * self.scale
+
+    monotonic = time
+    perf_counter = time
+
+    def sleep(self, seconds):
+        _real_time.sleep(max(0.0, seconds) / self.scale)
+
+    def install(self, module):
+        clock = self
+
+        class _ScaledEvent(_real_threading.Event):
+            def wait(self, timeout=None):
+                return super().wait(None if timeout is None else max(0.0, timeout) / clock.scale)
+
+        time_proxy = _ModuleProxy(_real_time, time=self.time, monotonic=self.time, perf_counter=self.time, sleep=self.sleep)
+        threading_proxy = _ModuleProxy(_real_threading, Event=_ScaledEvent)
+        saved = {name: getattr(module, name) for name in ("time", "threading") if hasattr(module, name)}
+        module.time, module.threading = time_proxy, threading_proxy
+
+        def restore():
+            for name, value in saved.items():
+                setattr(module, name, value)
+        return restore
+
+
+class _ModuleProxy:
+    def __init__(self, module, **overrides):
+        self._module = module
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+
+# ==============================================================================
+#  延遲分佈 (單位：虛擬秒)
+# ==============================================================================
+def fixed_latency(seconds):
+    return lambda rng: seconds
+
+
+def uniform_latency(low, high):
+    return lambda rng: rng.uniform(low, high)
+
+
+def lognormal_latency(median, sigma=0.4, cap=None):
+    """中位數為 median 的對數常態分佈，cap 為上限 (模擬長尾但避免無限延遲)。"""
+    mu = math.log(max(1e-6, median))
+
+    def draw(rng):
+        value = rng.lognormvariate(mu, sigma)
+        return min(value, cap) if cap else value
+    return draw
+
+
+# ==============================================================================
+#  錯誤注入
+# ==============================================================================
+class StandinAPIError(Exception):
+    """模擬 google-genai 的 APIError：帶有 code / status / details，後端的錯誤分類與重試提示可直接辨識。"""
+    def __init__(self, code, status, message, retry_delay=None, quota_id=None):
+        details = {"error": {"code": code, "status": status, "message": message, "details": []}}
+        if quota_id is not None:
+            details["error"]["details"].append({"@type": "type.googleapis.com/google.rpc.QuotaFailure",
+                                                "violations": [{"quotaId": quota_id}]})
+        if retry_delay is not None:
+            details["error"]["details"].append({"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{retry_delay}s"})
+        super().__init__(f"{code} {status}. {details}")
+        self.code = code
+        self.status = status
+        self.message = message
+        self.details = details
+        self.response = None
+
+
+def synthetic_srt(duration_seconds, rng, cue_seconds=4.0, fenced=True):
+    """產生覆蓋 duration_seconds 的合成 SRT 文字 (格式與模型實際回應相同，可含 ```srt 標記)。"""
+    lines = []
+    t = 0.5
+    index = 1
+    while t + 1.0 < duration_seconds:
+        length = min(cue_seconds * rng.uniform(0.5, 1.0), duration_seconds - t)
+        start_ms, end_ms = int(t * 1000), int((t + length) * 1000)
+        lines.append(f"{index}\n{_fmt_ms(start_ms)} --> {_fmt_ms(end_ms)}\n替身字幕第 {index} 句\n")
+        t += length + rng.uniform(0.1, cue_seconds * 0.3)
+        index += 1
+    body = "\n".join(lines)
+    return f"```srt\n{body}```\n" if fenced else body
+
+
+MALFORMED_KINDS = ("overlap", "bad_timestamp", "missing_index", "truncated", "loop", "burst")
+BURST_SECONDS = 40.0
+
+def malformed_srt(duration_seconds, rng, kind, cue_seconds=4.0):
+    """產生特定類型的錯誤回應，用於驗證校正、品質檢查與重試流程。
+
+    overlap: 大量時間倒流；bad_timestamp: 無法解析的時間戳；missing_index: 缺少序列號；
+    truncated: 只覆蓋前 30% 的音訊；loop: 同一句字幕無限重複 (重複迴圈)；
+    burst: 只有隨機一段 BURST_SECONDS 秒內的字幕時間倒流 (局部受損)。
+    """
+    if kind == "truncated":
+        return synthetic_srt(duration_seconds * 0.3, rng, cue_seconds)
+    if kind == "loop":
+        head = synthetic_srt(min(duration_seconds, 60), rng, cue_seconds, fenced=False)
+        start_index = head.count("-->") + 1
+        loop = "".join(f"{start_index + k}\n00:01:00,000 --> 00:01:02,000\n謝謝收看\n\n" for k in range(400))
+        return head + "\n" + loop
+    blocks = synthetic_srt(duration_seconds, rng, cue_seconds, fenced=False).strip().split("\n\n")
+    if kind == "burst":
+        burst_start = rng.uniform(0, max(0.0, duration_seconds - BURST_SECONDS))
+        burst_ms = (int(burst_start * 1000), int((burst_start + BURST_SECONDS) * 1000))
+    out = []
+    for k, block in enumerate(blocks):
+        lines = block.split("\n")
+        if kind == "burst":
+            start_ms = _parse_ms(lines[1].split(" --> ")[0])
+            if k > 0 and burst_ms[0] <= start_ms < burst_ms[1]:
+                lines[1] = "00:00:00,100 --> 00:00:00,900"
+        elif k % 3 == 1:
+            if kind == "overlap":
+                lines[1] = "00:00:00,100 --> 00:00:00,900"
+            elif kind == "bad_timestamp":
+                lines[1] = "00:0x:1?,abc --> ??"
+            elif kind == "missing_index":
+                lines = lines[1:]
+        out.append("\n".join(lines))
+    return "\n\n".join(out) + "\n"
+
+
+def _parse_ms(stamp):
+    hms, ms = stamp.split(",")
+    hours, minutes, seconds = (int(x) for x in hms.split(":"))
+    return ((hours * 60 + minutes) * 60 + seconds) * 1000 + int(ms)
+
+
+def _fmt_ms(ms):
+    hours, ms = divmod(ms, 3_600_000)
+    minutes, ms = divmod(ms, 60_000)
+    seconds, ms = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{ms:03d}"
+
+
+def _usage(prompt_tokens, output_tokens, cached_tokens=0):
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_tokens,
+        total_token_count=prompt_tokens + output_tokens,
+        cached_content_token_count=cached_tokens,
+    )
+
+
+def _response(text, usage, finish_reason="STOP"):
+    return SimpleNamespace(
+        text=text,
+        usage_metadata=usage,
+        candidates=[SimpleNamespace(finish_reason=finish_reason)],
+    )
+
+
+class _Files:
+    def __init__(self, client):
+        self._client = client
+        self._counter = itertools.count(1)
+
+    def upload(self, file, config=None):
+        self._client.on_upload()
+        path = os.fspath(file)
+        size = os.path.getsize(path)
+        name = f"files/standin-{next(self._counter):06d}"
+        uploaded = SimpleNamespace(name=name, uri=f"standin://{name}", mime_type="audio/mpeg", size_bytes=size,
+                                   duration_seconds=self._client.duration_probe(path) if self._client.duration_probe else None)
+        with self._client.lock:
+            self._client.uploaded[name] = uploaded
+        return uploaded
+
+    def get(self, name):
+        with self._client.lock:
+            return self._client.uploaded[name]
+
+    def delete(self, name):
+        with self._client.lock:
+            self._client.uploaded.pop(name, None)
+
+
+class _Models:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model, contents, config=None):
+        return self._client.respond(model, contents, config)
+
+    def generate_content_stream(self, model, contents, config=None):
+        response = self._client.respond(model, contents, config)
+        text = response.text or ""
+        step = max(1, self._client.stream_piece_chars)
+        for k in range(0, max(1, len(text)), step):
+            last = k + step >= len(text)
+            yield SimpleNamespace(text=text[k:k + step], usage_metadata=response.usage_metadata if last else None,
+                                  candidates=response.candidates if last else None)
+
+
+class _Caches:
+    def __init__(self, client):
+        self._client = client
+        self._counter = itertools.count(1)
+
+    def create(self, model, config):
+        contents = config.get("contents") or []
+        tokens = sum(len(c) // 4 for c in contents if isinstance(c, str))
+        name = f"cachedContents/standin-{next(self._counter):04d}"
+        with self._client.lock:
+            self._client.caches_by_name[name] = tokens
+        return SimpleNamespace(name=name, usage_metadata=SimpleNamespace(total_token_count=tokens))
+
+    def update(self, name, config):
+        with self._client.lock:
+            if name not in self._client.caches_by_name:
+                raise KeyError(name)
+
+    def delete(self, name):
+        with self._client.lock:
+            self._client.caches_by_name.pop(name, None)
+
+
+class _Batches:
+    """批次工作：建立後經過 batch_latency 秒才「完成」，於 get() 時一次產生所有回應。"""
+    def __init__(self, client):
+        self._client = client
+        self._counter = itertools.count(1)
+        self._jobs = {}
+
+    def create(self, model, src, config=None):
+        name = f"batches/standin-{next(self._counter):04d}"
+        job = SimpleNamespace(name=name, model=model, state="JOB_STATE_PENDING", dest=None,
+                              display_name=(config or {}).get("display_name", ""))
+        self._jobs[name] = (job, list(src), time.time())
+        return job
+
+    def get(self, name):
+        job, requests, created = self._jobs[name]
+        if job.state == "JOB_STATE_PENDING" and time.time() - created >= self._client.batch_latency:
+            responses = []
+            for request in requests:
+                try:
+                    responses.append(SimpleNamespace(
+                        response=self._client.respond(job.model, request.get("contents"), request.get("config")),
+                        error=None))
+                except Exception as e:
+                    responses.append(SimpleNamespace(response=None, error=SimpleNamespace(message=str(e))))
+            job.dest = SimpleNamespace(inlined_responses=responses)
+            job.state = "JOB_STATE_SUCCEEDED"
+        return job
+
+    def cancel(self, name):
+        self._jobs[name][0].state = "JOB_STATE_CANCELLED"
+
+    def delete(self, name):
+        self._jobs.pop(name, None)
+
+
+class StandinClient:
+    """與 genai.Client 相容的本機替身。
+
+    duration_seconds: 合成 SRT 覆蓋的音訊長度 (替身無法解碼音訊，預設一律以此長度產生字幕)。
+    duration_probe: 選用的 callable(上傳檔路徑) -> 秒數；回傳值優先於 duration_seconds (例如測試局部重新轉錄的子段)。
+    max_output_tokens: 輸出 token 上限 (約 3 字元 / token)；超過時截斷回應並回報 finish_reason=MAX_TOKENS。
+    batch_latency: 批次工作從建立到完成的秒數。
+    latency / upload_latency: 延遲分佈函式 (rng -> 虛擬秒)，以 clock.sleep 等待。
+    rate_429 / rate_5xx / rate_empty / rate_malformed: 每次 generate_content 注入對應錯誤的機率；
+    malformed 回應從 malformed_kinds 中抽選。server_rpm: 伺服器端 60 秒視窗的請求上限，超過即回 429。
+    daily_quota: {模型名稱: 可用請求數}；用完後該模型一律回 429 (QuotaFailure 的 quotaId 含 PerDay)。
+    同一個 seed 下，第 n 次上傳 / 第 n 次生成請求的抽樣結果固定；單一 worker 時整體結果可完全重現。
+    """
+    def __init__(self, duration_seconds=600.0, seed=0, batch_latency=0.0, stream_piece_chars=256,
+                 latency=None, upload_latency=None, clock=None,
+                 rate_429=0.0, rate_5xx=0.0, rate_empty=0.0, rate_malformed=0.0,
+                 malformed_kinds=MALFORMED_KINDS, server_rpm=None, retry_delay_hint=None, duration_probe=None,
+                 max_output_tokens=None, daily_quota=None):
+        self.duration_seconds = duration_seconds
+        self.daily_quota = dict(daily_quota or {})
+        self.duration_probe = duration_probe
+        self.max_output_tokens = max_output_tokens
+        self.batch_latency = batch_latency
+        self.stream_piece_chars = stream_piece_chars
+        self.seed = seed
+        self.latency = latency
+        self.upload_latency = upload_latency
+        self.clock = clock or VirtualClock(1.0)
+        self.rates = {"429": rate_429, "5xx": rate_5xx, "empty": rate_empty, "malformed": rate_malformed}
+        self.malformed_kinds = tuple(malformed_kinds)
+        self.server_rpm = server_rpm
+        self.retry_delay_hint = retry_delay_hint
+        self.lock = threading.Lock()
+        self.uploaded = {}
+        self.caches_by_name = {}
+        self._request_counter = itertools.count()
+        self._upload_counter = itertools.count()
+        self._request_times = []
+        self.active = 0
+        self.stats = {"requests": 0, "uploads": 0, "max_active": 0, "429": 0, "5xx": 0, "empty": 0,
+                      "malformed": 0, "server_rpm_rejects": 0, "daily_quota_rejects": 0}
+        self.files = _Files(self)
+        self.models = _Models(self)
+        self.caches = _Caches(self)
+        self.batches = _Batches(self)
+
+    def _request_rng(self, counter=None):
+        return random.Random(f"{self.seed}:{next(counter or self._request_counter)}")
+
+    def _check_server_rpm(self):
+        if not self.server_rpm:
+            return False
+        now = self.clock.time()
+        with self.lock:
+            self._request_times = [t for t in self._request_times if now - t < 60.0]
+            if len(self._request_times) >= self.server_rpm:
+                self.stats["server_rpm_rejects"] += 1
+                return True
+            self._request_times.append(now)
+        return False
+
+    def _check_daily_quota(self, model):
+        with self.lock:
+            if model not in self.daily_quota:
+                return False
+            if self.daily_quota[model] <= 0:
+                self.stats["daily_quota_rejects"] += 1
+                return True
+            self.daily_quota[model] -= 1
+        return False
+
+    def on_upload(self):
+        with self.lock:
+            self.stats["uploads"] += 1
+        if self.upload_latency:
+            self.clock.sleep(self.upload_latency(self._request_rng(self._upload_counter)))
+
+    def respond(self, model, contents, config=None):
+        """依請求內容產生一次回應 (含延遲與錯誤注入)。"""
+        config = config or {}
+        rng = self._request_rng()
+        with self.lock:
+            self.stats["requests"] += 1
+            self.active += 1
+            self.stats["max_active"] = max(self.stats["max_active"], self.active)
+        try:
+            if self.latency:
+                self.clock.sleep(self.latency(rng))
+            if self._check_daily_quota(model):
+                raise StandinAPIError(429, "RESOURCE_EXHAUSTED", f"Quota exceeded for model {model}.", self.retry_delay_hint,
+                                      quota_id="GenerateRequestsPerDayPerProjectPerModel-FreeTier")
+            if self._check_server_rpm():
+                raise StandinAPIError(429, "RESOURCE_EXHAUSTED", "Server-side RPM exceeded.", self.retry_delay_hint)
+            roll = rng.random()
+            for fault in ("429", "5xx", "empty", "malformed"):
+                if roll < self.rates[fault]:
+                    break
+                roll -= self.rates[fault]
+            else:
+                fault = None
+            if fault:
+                with self.lock:
+                    self.stats[fault] += 1
+            if fault == "429":
+                raise StandinAPIError(429, "RESOURCE_EXHAUSTED", "Quota exceeded.", self.retry_delay_hint)
+            if fault == "5xx":
+                raise StandinAPIError(503, "UNAVAILABLE", "The model is overloaded.")
+            return self._build_response(contents, config, rng, fault)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def _build_response(self, contents, config, rng, fault):
+        cached_tokens = 0
+        cache_name = config.get("cached_content") if isinstance(config, dict) else getattr(config, "cached_content", None)
+        with self.lock:
+            if cache_name:
+                if cache_name not in self.caches_by_name:
+                    raise LookupError(f"404 NOT_FOUND: CachedContent {cache_name} not found")
+                cached_tokens = self.caches_by_name[cache_name]
+        duration_seconds = next((c.duration_seconds for c in (contents or [])
+                                 if getattr(c, "duration_seconds", None)), self.duration_seconds)
+        if fault == "empty":
+            text = ""
+        elif fault == "malformed":
+            text = malformed_srt(duration_seconds, rng, rng.choice(self.malformed_kinds))
+        else:
+            text = synthetic_srt(duration_seconds, rng)
+        prompt_tokens = cached_tokens + sum(len(c) // 4 for c in (contents or []) if isinstance(c, str))
+        prompt_tokens += int(duration_seconds * 32) # 音訊約 32 tokens/秒
+        finish_reason = "STOP"
+        if self.max_output_tokens and len(text) // 3 > self.max_output_tokens:
+            text, finish_reason = text[:self.max_output_tokens * 3], "MAX_TOKENS"
+        return _response(text, _usage(prompt_tokens, len(text) // 3, cached_tokens), finish_reason)
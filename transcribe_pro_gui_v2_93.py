@@ -13,6 +13,7 @@
 # 10.【v2.91 後端更新】: 搭配 branch_77，重試等待改為基礎等待時間 + 0~15 秒隨機抖動。
 # 11.【v2.92 後端更新】: 搭配 branch_78，所有上傳流程改用短英文安全副本上傳，保留原本輸出檔名對照。
 # 12.【v2.93 後端更新】: 搭配 branch_79，上傳副本檔名改為 up-000001.mp3 格式，每次新任務重新編號並自動清除副本。
+# 13.【常駐後端工作程序】: 不再為每個動作 spawn 新程序；啟動時建立 `backend_task.BackendWorker`，任務經佇列送入並沿用已載入的模組與 API 用戶端。新增「取消任務」按鈕 (只取消目前任務，工作程序保持常駐)，狀態列顯示區塊完成進度。
 # 9. 【v2.88 UI 修正】: 保留切出音檔預設勾選、術語表可見標題＋2列、術語按鈕固定橫向置於 TreeView 下方。
 # 10.【v2.89 UI 修正】: 修正進階設定中術語按鈕被 Notebook 高度裁切的問題；按鈕列移入術語區外框下方並調整高度。
 import tkinter as tk
@@ -20,7 +21,6 @@ from tkinter import ttk, filedialog, scrolledtext, messagebox, simpledialog
 from tkinter import font as tkfont
 import os
 import sys
-import threading
 import queue
 import json
 import shutil
@@ -33,24 +33,6 @@ from types import SimpleNamespace
 # 匯入重構後的後端任務模組 (請確保此檔案與主程式位於同一目錄)
 import transcribe_pro_v5_branch_04_branch_79 as backend_task
 
-# ==============================================================================
-#  Process Wrapper
-# ==============================================================================
-def process_wrapper(target_func, config, log_queue):
-    """
-    執行目標函式，並使用其回傳值作為程序的退出碼。
-    """
-    try:
-        import sys
-        exit_code = target_func(config, log_queue)
-        sys.exit(exit_code if isinstance(exit_code, int) else 1)
-    except SystemExit as e:
-        sys.exit(e.code)
-    except Exception as e:
-        if log_queue:
-            log_queue.put(f"FATAL ERROR in process_wrapper: {e}")
-        sys.exit(1)
-
 # ==============================================================================
 #  Reusable Collapsible Frame Class
 # ==============================================================================
@@ -350,8 +332,10 @@ class TranscriptionApp:
         self.multi_label_var = tk.StringVar(value="")
         # --- END NEW ---
         
-        self.process = None
         self.log_queue = multiprocessing.Queue()
+        # 常駐後端工作程序：任務經佇列送入，API 用戶端在任務之間重複使用
+        self.backend_worker = backend_task.BackendWorker(self.log_queue)
+        self.current_job_id = None
         self.settings_changed = False
         self.transcription_actually_performed = False
         self.is_partial_task = False
@@ -362,6 +346,7 @@ class TranscriptionApp:
         self._create_widgets()
         self._bind_settings_changes()
         self._load_settings_on_startup()
+        self._start_backend_worker()
         self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
 
     def _setup_styles_and_fonts(self):
@@ -504,11 +489,11 @@ class TranscriptionApp:
         ttk.Label(params_frame, text="連續空值中止閾值:").grid(row=3, column=0, sticky="w", padx=5, pady=2)
         self.empty_abort_threshold_entry = ttk.Entry(params_frame, textvariable=self.empty_abort_threshold_var)
         self.empty_abort_threshold_entry.grid(row=3, column=1, sticky="ew", padx=5, pady=2)
-        CreateToolTip(self.empty_abort_threshold_entry, "連續收到 API 空白回應達到此次數就中止；設為 0 可關閉。")
+        CreateToolTip(self.empty_abort_threshold_entry, "同一類錯誤 (空白回應、解析失敗、伺服器錯誤等) 連續達到此次數就開啟斷路器：暫停送出新請求並定期探測，恢復後自動繼續；探測多次仍失敗才將剩餘區塊標記失敗。設為 0 可關閉。")
         ttk.Label(params_frame, text="併發數 (workers):").grid(row=3, column=2, sticky="w", padx=5, pady=2)
         self.workers_entry = ttk.Entry(params_frame, textvariable=self.workers_var)
         self.workers_entry.grid(row=3, column=3, sticky="ew", padx=5, pady=2)
-        CreateToolTip(self.workers_entry, "目前區段清單流程會依序處理小段；此欄保留給完整/後續併發流程。")
+        CreateToolTip(self.workers_entry, "同時轉錄的小段數；區段清單流程會依此併發處理，並在轉錄進行時預先切割後續小段。")
         ttk.Label(params_frame, text="每分鐘請求數 (rpm):").grid(row=3, column=4, sticky="w", padx=5, pady=2)
         self.rpm_entry = ttk.Entry(params_frame, textvariable=self.rpm_var)
         self.rpm_entry.grid(row=3, column=5, sticky="ew", padx=5, pady=2)
@@ -679,6 +664,9 @@ class TranscriptionApp:
         self.merge_button = ttk.Button(action_frame, text="僅重新合併SRT", command=self._check_and_start_merge)
         self.merge_button.pack(side=tk.LEFT, padx=5)
         CreateToolTip(self.merge_button, "不呼叫 API，只依照目前區段清單，把對應的 absolute SRT 重合成 selected SRT。")
+        self.cancel_button = ttk.Button(action_frame, text="取消任務", command=self._cancel_current_job, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        CreateToolTip(self.cancel_button, "停止目前的任務：不再送出新的區塊請求，已完成的區塊 SRT 會保留，之後可接續。")
         self.status_var = tk.StringVar(value="狀態: 準備就緒")
         self.status_label = ttk.Label(action_frame, textvariable=self.status_var)
         self.status_label.pack(side=tk.LEFT, padx=10, fill=tk.X, expand=True)
@@ -765,6 +753,8 @@ class TranscriptionApp:
         for entry in self.end_time_entries.values():
             entry.configure(state=state)
         self.partial_transcribe_button.configure(state=state)
+        # 取消按鈕與其他控制項相反：任務執行中 (其他控制項停用) 時才可按
+        self.cancel_button.configure(state=tk.NORMAL if state == tk.DISABLED else tk.DISABLED)
 
         if state == tk.DISABLED:
             self.terms_tree.unbind("<Control-v>")
@@ -1432,17 +1422,25 @@ class TranscriptionApp:
                 target_func = backend_task.run_partial_transcription_task
             else:
                 target_func = backend_task.run_transcription_task
-            self.process = multiprocessing.Process(target=process_wrapper, args=(target_func, config, self.log_queue))
-            self.process.start()
-            threading.Thread(target=self._wait_for_process, daemon=True).start()
+            self.current_job_id = self.backend_worker.submit(target_func, config)
         except Exception as e:
             self.log(f"\n!!! 啟動背景任務失敗 !!!\n{e}\n"); self.is_running = False; self._set_ui_state(tk.NORMAL)
 
-    def _wait_for_process(self):
-        if self.process:
-            self.process.join(); exit_code = self.process.exitcode
-            self.process = None; self.is_running = False
-            self.log_queue.put(('TASK_COMPLETE', exit_code))
+    def _start_backend_worker(self):
+        try:
+            try: workers = int(self.workers_var.get())
+            except ValueError: workers = 1
+            # 以任務會使用的連線設定預先建立用戶端，第一個任務即可沿用
+            self.backend_worker.warm(SimpleNamespace(api_key=self.api_key_var.get().strip(), workers=workers, standin=False))
+        except Exception as e:
+            self.log(f"啟動常駐後端工作程序失敗 (將於任務開始時重試): {e}")
+
+    def _cancel_current_job(self):
+        if not self.is_running or self.current_job_id is None: return
+        self.log("使用者要求取消目前的任務，等待進行中的請求結束...")
+        self.status_var.set("狀態：正在取消任務...")
+        self.cancel_button.configure(state=tk.DISABLED)
+        self.backend_worker.cancel(self.current_job_id)
 
     def _process_log_queue(self):
         if self.is_closing: return
@@ -1459,7 +1457,20 @@ class TranscriptionApp:
                             self.log("使用者選擇重試 SRT轉錄情況報告 生成..."); self._start_transcription(summarize_only=True, log_file_to_summarize=log_filepath)
                         else: self.log("使用者選擇不重試 SRT轉錄情況報告 生成。"); self.status_var.set("狀態：任務結束 (報告生成失敗)")
                     else: self.log(line)
+                elif isinstance(item, tuple) and item[0] == 'JOB_PROGRESS':
+                    if self.is_running and item[1] == self.current_job_id:
+                        self.status_var.set(f"狀態：轉錄中，已完成 {item[2]}/{item[3]} 個區塊")
+                elif isinstance(item, tuple) and item[0] == 'WORKER_EXITED':
+                    self.log(f"常駐後端工作程序意外結束 (退出碼: {item[1]})，下一個任務會重新啟動。")
+                    if self.is_running: self.log_queue.put(('TASK_COMPLETE', 1, self.current_job_id))
+                elif isinstance(item, tuple) and item[0] == 'TASK_COMPLETE' and len(item) > 2 and item[2] != self.current_job_id:
+                    pass # 已被新任務取代 (例如摘要重試) 的舊任務結束通知
+                elif isinstance(item, tuple) and item[0] == 'TASK_COMPLETE' and item[1] == backend_task.TASK_CANCELLED_EXIT_CODE:
+                    self.is_running = False; self.current_job_id = None; self.last_exit_code = item[1]
+                    self._set_ui_state(tk.NORMAL)
+                    self.status_var.set("狀態：任務已取消")
                 elif isinstance(item, tuple) and item[0] == 'TASK_COMPLETE':
+                    self.is_running = False; self.current_job_id = None
                     self.last_exit_code = item[1]
                     # 後端日誌已包含退出碼，此處可簡化
                     # self.log(f"\n後端程序已結束。 (退出碼: {self.last_exit_code} - {'成功' if self.last_exit_code == 0 else '發生錯誤'})\n")
@@ -1598,10 +1609,10 @@ class TranscriptionApp:
     def on_closing(self, ask_confirm=True, save_only=False):
         if not save_only:
             self.is_closing = True
-        if ask_confirm and self.is_running and self.process and self.process.is_alive():
+        if ask_confirm and self.is_running and self.backend_worker.is_alive():
             if not messagebox.askokcancel("關閉確認", "任務尚在執行，確定要強制終止並關閉程式？"):
                 self.is_closing = False; return
-            try: self.process.terminate(); self.process.join(timeout=2)
+            try: self.backend_worker.terminate()
             except Exception as e: self.log(f"終止背景任務時出錯: {e}")
         if self.settings_changed or save_only:
             try:
@@ -1612,6 +1623,8 @@ class TranscriptionApp:
             except Exception as e:
                 if ask_confirm: self.log(f"自動儲存設定檔失敗: {e}")
         if not save_only:
+             try: self.backend_worker.stop(timeout=2)
+             except Exception: pass
              self.master.destroy()
 
 def main():
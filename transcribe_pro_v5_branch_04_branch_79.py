@@ -29,6 +29,30 @@
 # 21.【v5_6_74 版本銜接】: 搭配 GUI v2.88，核心邏輯沿用 branch_73。
 # 22.【v5_6_78 上傳安全副本】: 送 API 前會複製一份短英文暫存檔作為上傳來源，避免中文、日文、特殊符號或過長檔名造成 SDK 上傳編碼錯誤；SRT、raw、absolute 與日誌對照仍使用原本區段檔名。
 # 23.【v5_6_79 上傳副本短名化】: 上傳副本檔名改為 up-000001.mp3 格式，每次新任務重新從 1 編號；上傳後立即刪除副本，避免殘留。
+# 24.【錯誤分類退避】: 新增 `classify_retry_error`，將例外分為 quota / server / timeout / empty / parse / severe / other，各類別依 `RETRY_DELAY_POLICIES` 決定等待時間；空回應與解析失敗幾秒內即重試，不再一律等待 retry_base。會解析 Google API 錯誤內容中的 RetryInfo.retryDelay 與 Retry-After 標頭作為伺服器提示。
+# 25.【請求期限與看門狗】: 新增 `call_with_deadline`，`client.files.upload` 與 `client.models.generate_content` 各自套用 --upload_timeout / --generate_timeout 期限；逾時即放棄卡住的呼叫並釋放工作執行緒，拋出 `DeadlineExceededError` 並以獨立的 deadline 類別重試。逾時後才完成的上傳會自動刪除遠端檔案。
+# 26.【尾端對沖請求】: 新增 `ChunkTaskRunner` 取代 `as_completed` 迴圈。啟用 --hedge 時，待處理佇列清空且有閒置 worker 後，若某區塊執行時間超過已完成區塊延遲的 p90 (--hedge_quantile)，且限速器仍有空餘 RPM，會對該區塊再送出一次對沖請求；先取得有效結果者寫入 SRT，另一個請求立即取消。
+# 27.【優先順序排程】: 新增 `order_chunk_jobs` 與 --schedule 參數 (index / longest / history / pinned)。history 依暫存資料夾中的 `_chunk_history.json` 記錄，先送出過去較慢或常失敗的區塊；--pin_chunks 可指定優先處理的區塊編號 (從 1 起算)。附 `benchmark_transcribe_pro.py schedule` 模擬多區段混合長度工作的完成時間 (makespan)。
+# 28.【多區段併發】: `run_multi_partial_transcription_task` 改用與完整轉錄相同的 `ChunkTaskRunner` + 排程，依 --workers 併發轉錄各小段 (支援 --hedge / --schedule)；FFmpeg 預切改由獨立的切割執行緒池依送出順序先行處理，與進行中的轉錄重疊。
+# 29.【串流生成與增量解析】: `format_srt_from_text_v16` 重構為 `IncrementalSRTParser` (批次版本改為一次餵入全文，輸出不變)。啟用 --stream 時改用 `generate_content_stream`，邊接收邊寫入 .raw.txt、即時解析字幕並在日誌回報字幕數；嚴重修正一旦超過 correction_threshold 即提前中止串流並重試。
+# 30.【重複迴圈偵測】: 新增 `DegenerateOutputDetector`，以最近字幕文字的雜湊比對週期 1~4 的重複 (重複的字幕同時開始時間未前進或平均間隔過密才算迴圈，正常節奏的 ♪、(笑) 等連續字幕不受影響)，並追蹤開始時間停滯的連續塊數 (每塊 O(1)，對回應長度為線性時間)。串流模式下偵測到迴圈即中止生成；非串流模式於解析時偵測並拒絕該回應。以獨立的 degenerate 類別快速重試，門檻由 --degenerate_repeat / --degenerate_stall 設定 (0 為停用)。
+# 31.【提示詞內容快取】: 新增 `PromptCacheManager`，每個任務為組合後的提示詞建立一份 Gemini cached content (首次使用時建立、剩餘 TTL 不足時自動延長、任務結束時刪除)，所有區塊與重試改以 cached_content 引用，不再重複傳送數千 token 的提示詞。建立失敗 (例如低於模型的最小快取 token 數) 時自動退回原本的傳送方式。任務結束時回報由快取提供的輸入 token 數。--no_context_cache 停用，--cache_ttl 設定 TTL。
+# 32.【批次模式】: 新增 --batch_mode，將一個任務的所有區塊請求打包成一次 Gemini Batch API 工作 (費用較低、不佔即時 RPM)，每 --batch_poll_interval 秒輪詢直到完成 (超過 --batch_timeout 或任務被取消時呼叫 batches.cancel 並停止等待)，結果經 `check_and_correct_response` (與 transcribe_audio 共用的解析、校正與品質檢查) 寫入 SRT 後沿用原本的合併流程；批次中失敗的區塊自動改走一般請求。新增 `gemini_standin.py` 本機替身 (--standin)，可在不連網的情況下測試批次與一般流程。
+# 33.【回應內容快取】: 新增 `ResponseCache`，以 sha256(音訊內容) + sha256(提示詞) + 模型名稱為鍵，將通過品質檢查的模型回應 (原始文字與 token 用量，對沖請求只快取勝出者；續寫接回或局部修補的結果不快取) 存於 `_response_cache` 資料夾。`transcribe_audio` 上傳前先查詢，命中時以目前的校正器重新解析，仍通過檢查門檻時直接寫入 SRT，不再呼叫 API；--recreate 或在另一個 GUI 工作階段重跑同一集時可省下全部費用。依總容量以 LRU (最後使用時間) 淘汰，--response_cache_mb 設定上限 (0 為停用)，--response_cache_bypass 略過查詢但仍寫入新結果。
+# 34.【斷路器】: 以 `CircuitBreakerBoard` 取代 `_mark_empty_and_maybe_abort` (原本連續空回應時以 RuntimeError 中止整個任務，並丟棄進行中的請求)。依 (錯誤類別, 模型) 各自維護 closed / open / half_open 狀態：連續失敗達 empty_abort_threshold 次即開啟，其後的請求暫停等待 (不消耗重試次數)；冷卻 --circuit_cooldown 秒後只放行一個探測請求，成功 (或只因 severe、degenerate 等內容問題失敗，代表模型已恢復回應) 即關閉，仍為斷路器追蹤的錯誤類別則冷卻時間加倍。探測連續失敗 --circuit_max_probes 次才判定為持續性故障 (例如提示詞本身有問題)，該模型後續的區塊直接標記失敗，已完成的結果照常合併。
+# 35.【局部重新轉錄】: `IncrementalSRTParser` 會記錄每次嚴重修正所在的時間範圍 (severe_ranges)。嚴重修正超過 correction_threshold 時，不再整段丟棄重送：先將各範圍前後加上 --repair_margin 秒並合併，若總長不超過區塊時長的 --repair_max_fraction，就以 FFmpeg 只切出這幾段重新轉錄，再將結果依時間位移後替換回原本的區塊 SRT，重試的 token 與受損範圍成正比。子段最多重試 REPAIR_MAX_RETRIES 次、不對半切割也不使用回應快取。範圍過大、切割或子段轉錄失敗時退回整段重試；串流模式下嚴重修正仍可局部修補時不再提前中止。--no_range_repair 停用。
+# 36.【最佳嘗試保留】: 每次因嚴重修正過多而失敗的嘗試，都會保留其校正後的 SRT 與品質分數 (嚴重修正次數，同分時字幕數多者優先)。重試次數用盡時不再留下空洞，改用分數最佳的一次結果寫入 SRT，於日誌以 [DEGRADED] 標示，並記錄於暫存資料夾的 `_degraded_chunks.json` (日後同一區塊成功轉錄時自動移除)；任務結束時列出所有降級區塊。--no_best_attempt 停用。
+# 37.【截斷續寫】: 檢查回應的 finish_reason (串流模式取最後一段)。因 MAX_TOKENS 截斷時，捨棄最後一個可能不完整的字幕塊，以其餘字幕最後的結束時間為起點，用 FFmpeg 切出剩餘音訊送出續寫請求 (續寫本身若再被截斷會繼續續寫)，再將結果依時間位移接回，整體照常經過品質檢查；不再只留下 truncation_threshold 警告或整段重試。保留的前段先經過重複迴圈偵測與嚴重修正門檻，未通過時不送出續寫而直接重試，前段的嚴重修正次數與範圍也併入接回後的檢查；raw 檔保存模型的原始輸出。續寫失敗時保留原本的回應。批次模式中被截斷的區塊改走一般請求以便續寫。--no_continuation 停用。
+# 38.【遞迴對半切割】: 區塊用盡重試次數且最後的失敗屬於品質或逾時類別 (severe / degenerate / parse / empty / timeout / deadline) 時，改將音訊對半切開並同時轉錄兩半；某一半仍失敗時再對半切，直到長度低於 --bisect_min 秒。各子段的 SRT 依開始時間位移後接回原本區塊的 .srt，Resume 與 merge_srts 看到的仍是一般的區塊檔案。子段每次使用 --bisect_retries 次嘗試；對半切割仍失敗時才改用最佳嘗試 (降級) 的結果。--bisect_min 0 停用。
+# 39.【分層模型升級】: 新增 --draft_model。設定後每個區塊先以較快、較便宜的草稿模型轉錄 (--draft_retries 次嘗試)，品質門檻為嚴重修正次數與結尾截斷檢查 (草稿層的截斷空白超過 truncation_threshold 視為失敗)；只有未通過門檻的區塊才升級到 --model_name 的主模型，沿用原本的重試、修補、對半切割與最佳嘗試流程。草稿模型有獨立的提示詞快取。任務結束時以 `TierStats` 回報各層的區塊數、通過率、token 總量與延遲 (平均 / p90)。
+# 40.【額度用盡自動換模型】: 新增 --fallback_models (以逗號分隔的備援模型清單，依序使用)。`is_daily_quota_error` 依 429 錯誤內容中的 QuotaFailure (quotaId / quotaMetric 含 PerDay、per_day) 判斷為每日額度用盡時，`ModelFailover` 將該模型標記為用盡，其餘區塊與重試中的區塊立即改用下一個模型 (切換不計入重試次數，也不再等待)；所有模型皆用盡時照常失敗。啟用時每個區塊實際使用的模型記錄於暫存資料夾的 `_chunk_models.json`，任務結束時列出由備援模型完成的區塊，方便日後只重做這些區塊。
+# 41.【GUI 常駐後端工作程序】: 新增 `BackendWorker` / `backend_worker_main`。GUI 啟動時建立一個常駐子程序，任務經由佇列送入依序執行，同一組 API 金鑰的用戶端 (與其連線池) 在任務之間重複使用，不再每次重新 spawn、重新載入 google-genai。任務可個別取消 (尚未開始者直接略過，執行中者透過 cancel_event 停止送出新請求並以退出碼 130 結束)，並以 ('JOB_PROGRESS', job_id, 完成數, 總數) 回報區塊進度。`ChunkTaskRunner` 新增 cancel_event / on_progress；`setup_logging` 移除舊 handler 時一併關閉，避免常駐程序累積開啟的日誌檔。
+# 42.【共用 HTTP 連線池】: 新增 `get_shared_genai_client`，同一程序內相同金鑰與連線設定的任務共用一個 genai.Client (程序內只保留一個，設定改變或需要更大的連線池時才重建並關閉舊的)。底層 httpx 連線池大小依 workers 自動設定 (workers × 2 + 2，可用 --http_pool 指定)，閒置連線保留 --http_keepalive 秒 (預設 120 秒，httpx 預設僅 5 秒)，已安裝 h2 套件時啟用 HTTP/2 (--no_http2 可關閉)。`HttpConnectionStats` 以 response hook 統計請求數、新建連線數與重用率，任務結束時輸出 [HTTP] 摘要，方便確認在公司代理伺服器後方不會每個區塊都重新做 TLS 交握。
+# 43.【延遲載入 google-genai】: google-genai 改在第一次建立 API 用戶端時 (`ensure_genai_available`) 才匯入，模組層級與 `__main__` 不再預先 import (後者改以 importlib.util.find_spec 檢查是否已安裝)。--merge_only 等不需呼叫 API 的模式、GUI 啟動與常駐工作程序的冷啟動都不再支付約 0.4 秒的 SDK 載入成本。啟動時間以 `python benchmark_transcribe_pro.py importtime` 量測與把關。
+# 44.【整數毫秒時間碼】: 新增 `parse_timecode_ms` / `format_timecode_ms`，SRT 時間軸一律以整數毫秒處理。格式正確的 `HH:MM:SS,mmm` 走預先編譯的快速路徑，只有格式不標準時才退回 parse_time_v10 原本的各項容錯規則；格式化改用整數 divmod。`merge_srts`、`adjust_srt_content_with_offset`、`merge_absolute_srts` 改用毫秒整數運算；`IncrementalSRTParser` (format_srt_from_text_v16) 的校正改用整數微秒 (「智慧置中」對半後可能落在半毫秒上，且會影響後續校正)，只在寫入字幕時捨去至毫秒。輸出與原本逐字相同。`parse_time_v10` / `format_timedelta_v7` 保留為 timedelta 介面。效能以 `python benchmark_transcribe_pro.py timecode` 量測。
+# 45.【共用字幕表】: 新增 `CueTable`：開始/結束時間 (整數毫秒) 以 array('q') 平行存放、文字存於 list，SRT 只在讀入時解析一次、寫出時格式化一次。`IncrementalSRTParser`、`merge_srts`、`merge_absolute_srts`、`adjust_srt_content_with_offset`、`splice_srt_ranges` 全部改用 CueTable，不再各自以 dict / tuple / 字串重複解析與格式化。解析規則統一為原本修補流程的寬鬆版 (條目前後空白行不再導致整條被略過)；`adjust_srt_content_with_offset` 會重新編號，無法解析的條目改為略過並記錄數量。
+# 46.【線性前瞻】: `IncrementalSRTParser` 尋找「下一個有效開始時間」時不再每次從頭掃描暫存塊，改以掃描指標 `_scan_pos` 接續上次的位置 (只有 last_correct_end 低於上次掃描的下限時才重掃)。時間軸跳到遠處後其餘字幕全部重疊的回應，校正從 O(n²) 降為 O(n)。以 `python benchmark_transcribe_pro.py corrector` 量測。
+# 47.【串流合併】: 新增 `iter_srt_cues` 讀取單一 SRT 並逐條產生字幕 (解析規則與 CueTable.from_srt 相同)。`merge_srts` 一次只讀一個檔案、邊讀邊加位移邊寫出；`merge_absolute_srts` 改以 heap 對各檔案的字幕串流做 k 路合併 (最小串流連續輸出到超過次小串流開頭為止) (相同時間依檔案順序，與原本的穩定排序一致)。各檔案先只讀出第一條字幕，輪到時才重新開啟讀取其餘部分，區塊時間互不重疊時同時只有一個檔案在記憶體中，峰值記憶體不再隨檔案數或字幕總數成長；若某檔案本身未依時間排序，退回整體載入排序。合併時間與原本相當，改善在於記憶體。以 `python benchmark_transcribe_pro.py merge` 量測。
 import os
 import sys
 import subprocess
@@ -40,14 +64,22 @@ import logging
 import time
 import io
 import math
+import itertools
+import json
+import hashlib
+import importlib.util
+import weakref
 from types import SimpleNamespace
 
 # NEW: 併發與限速所需 import
 import threading
+import queue
+import multiprocessing
 import random
+import heapq
+from array import array
 from collections import deque
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from threading import Lock
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # NEW: 自訂例外（共用）
 class EmptyResponseError(Exception):
@@ -57,6 +89,31 @@ class EmptyResponseError(Exception):
 class SRTContentParseError(Exception):
     pass
 
+# NEW: 自訂例外（嚴重修正次數超過閾值）
+class SevereCorrectionError(ValueError):
+    """完整解析後拋出時附帶校正後的 SRT 與嚴重修正的時間範圍，供局部重新轉錄使用。"""
+    def __init__(self, message, corrected_srt=None, severe_ranges=None, severe_count=None):
+        super().__init__(message)
+        self.corrected_srt = corrected_srt
+        self.severe_ranges = list(severe_ranges or [])
+        self.severe_count = severe_count
+
+# NEW: 自訂例外（模型輸出陷入重複迴圈）
+class DegenerateOutputError(Exception):
+    pass
+
+# NEW: 自訂例外（斷路器持續開啟，探測多次仍失敗）
+class CircuitOpenError(Exception):
+    pass
+
+# NEW: 自訂例外（API 呼叫超過設定期限）
+class DeadlineExceededError(TimeoutError):
+    pass
+
+# NEW: 自訂例外（API 呼叫被主動取消，例如對沖請求的輸家）
+class CallCancelledError(Exception):
+    pass
+
 # NEW: 單程序共用的滑動視窗 RPM 限速器
 class MinuteRateLimiter:
     """單程序滑動視窗 RPM 限速器：所有執行緒共用。"""
@@ -81,6 +138,15 @@ class MinuteRateLimiter:
         with self.lock:
             self.ts.append(time.time())
 
+    def available(self):
+        """目前 60 秒視窗內尚未使用的請求額度。"""
+        window = 60.0
+        with self.lock:
+            now = time.time()
+            while self.ts and now - self.ts[0] > window:
+                self.ts.popleft()
+            return max(0, self.rpm - len(self.ts))
+
 # NEW: 基礎等待時間 + 固定範圍抖動
 def sleep_with_base_jitter(base=65, jitter=15):
     """
@@ -91,6 +157,164 @@ def sleep_with_base_jitter(base=65, jitter=15):
     delay = max(0, float(base)) + random.uniform(0, max(0, float(jitter)))
     time.sleep(delay)
 
+# NEW: 各錯誤類別的重試等待策略。base 為 None 表示沿用 --retry_base；grow=True 時每次重試加倍，上限為 --retry_cap。
+RETRY_DELAY_POLICIES = {
+    "quota":   {"base": None, "jitter": 15, "grow": False},
+    "server":  {"base": 15,   "jitter": 10, "grow": True},
+    "timeout": {"base": 5,    "jitter": 5,  "grow": True},
+    "deadline": {"base": 5,   "jitter": 5,  "grow": False},
+    "empty":   {"base": 2,    "jitter": 3,  "grow": False},
+    "parse":   {"base": 0,    "jitter": 2,  "grow": False},
+    "severe":  {"base": 0,    "jitter": 2,  "grow": False},
+    "degenerate": {"base": 0, "jitter": 2,  "grow": False},
+    "other":   {"base": None, "jitter": 15, "grow": False},
+}
+
+_RETRY_DELAY_TEXT_RE = re.compile(r"""(?:retryDelay['"]?\s*[:=]\s*['"]?|retry in\s+)(\d+(?:\.\d+)?)\s*s""", re.IGNORECASE)
+
+def _error_code_and_status(e):
+    """取出 google-genai APIError 的 HTTP 狀態碼與 status 字串；其他例外回傳 (None, "")。"""
+    code = getattr(e, "code", None)
+    if not isinstance(code, int):
+        code = getattr(getattr(e, "response", None), "status_code", None)
+    status = str(getattr(e, "status", "") or "").upper()
+    return (code if isinstance(code, int) else None), status
+
+def classify_retry_error(e):
+    """將轉錄過程中的例外對應到重試類別。"""
+    if isinstance(e, EmptyResponseError):
+        return "empty"
+    if isinstance(e, SevereCorrectionError):
+        return "severe"
+    if isinstance(e, DegenerateOutputError):
+        return "degenerate"
+    if isinstance(e, SRTContentParseError):
+        return "parse"
+    if isinstance(e, DeadlineExceededError):
+        return "deadline"
+    code, status = _error_code_and_status(e)
+    if code == 429 or status == "RESOURCE_EXHAUSTED":
+        return "quota"
+    if code == 504 or status == "DEADLINE_EXCEEDED":
+        return "timeout"
+    if (code is not None and 500 <= code < 600) or status in ("INTERNAL", "UNAVAILABLE"):
+        return "server"
+    if isinstance(e, TimeoutError) or "Timeout" in type(e).__name__:
+        return "timeout"
+    return "other"
+
+def _find_retry_delay_in_details(obj):
+    """在 API 錯誤內容 (dict/list) 中遞迴尋找 google.rpc.RetryInfo 的 retryDelay。"""
+    if isinstance(obj, dict):
+        value = obj.get("retryDelay")
+        if value is not None:
+            m = re.match(r"^\s*(\d+(?:\.\d+)?)\s*s?\s*$", str(value))
+            if m:
+                return float(m.group(1))
+        for v in obj.values():
+            found = _find_retry_delay_in_details(v)
+            if found is not None:
+                return found
+    elif isinstance(obj, list):
+        for v in obj:
+            found = _find_retry_delay_in_details(v)
+            if found is not None:
+                return found
+    return None
+
+def extract_retry_delay_hint(e):
+    """讀取伺服器提供的重試等待提示（秒）；依序檢查 Retry-After 標頭、RetryInfo.retryDelay、錯誤訊息文字。"""
+    try:
+        retry_after = getattr(getattr(e, "response", None), "headers", {}).get("Retry-After")
+    except Exception:
+        retry_after = None
+    if retry_after and str(retry_after).strip().isdigit():
+        return float(str(retry_after).strip())
+    hint = _find_retry_delay_in_details(getattr(e, "details", None))
+    if hint is not None:
+        return hint
+    m = _RETRY_DELAY_TEXT_RE.search(str(e))
+    return float(m.group(1)) if m else None
+
+_DAILY_QUOTA_RE = re.compile(r"per_?day|daily", re.IGNORECASE)
+
+def is_daily_quota_error(e):
+    """429 / RESOURCE_EXHAUSTED 且錯誤內容指出是每日額度 (例如 quotaId 為 ...PerDay...) 時回傳 True。
+
+    每分鐘額度的 429 只需等待，不應觸發換模型。
+    """
+    if classify_retry_error(e) != "quota":
+        return False
+    try:
+        details = json.dumps(getattr(e, "details", None), ensure_ascii=False, default=str)
+    except (TypeError, ValueError):
+        details = ""
+    return bool(_DAILY_QUOTA_RE.search(details) or _DAILY_QUOTA_RE.search(str(e)))
+
+def compute_retry_delay(error_class, attempt, retry_base=65, retry_cap=250, hint=None):
+    """依錯誤類別與伺服器提示計算本次重試前的等待秒數 (含抖動)。"""
+    policy = RETRY_DELAY_POLICIES.get(error_class, RETRY_DELAY_POLICIES["other"])
+    if hint is not None:
+        return max(0.0, float(hint)) + random.uniform(0, 3)
+    base = float(retry_base) if policy["base"] is None else float(policy["base"])
+    if policy["grow"]:
+        base = min(base * (2 ** attempt), max(base, float(retry_cap)))
+    return max(0.0, base) + random.uniform(0, max(0, float(policy["jitter"])))
+
+# NEW: 單次 API 呼叫的期限看門狗
+def call_with_deadline(fn, timeout, stage, on_late_result=None, cancel_event=None):
+    """在背景執行緒中執行 fn，超過 timeout 秒即放棄等待並拋出 DeadlineExceededError。
+
+    Python 無法強制中止卡住的 HTTP 連線，因此逾時的呼叫會留在 daemon 執行緒中自行結束，
+    但呼叫端的工作執行緒會立即被釋放。若呼叫在逾時後才成功，on_late_result 會收到其結果
+    (例如用來刪除已上傳的遠端檔案)。cancel_event 被設定時以 CallCancelledError 提前放棄。
+    timeout <= 0 且沒有 cancel_event 時直接同步呼叫。
+    """
+    has_deadline = bool(timeout) and timeout > 0
+    if not has_deadline and cancel_event is None:
+        return fn()
+    state = {"done": False, "abandoned": False, "result": None, "error": None}
+    lock = threading.Lock()
+    finished = threading.Event()
+
+    def _runner():
+        try:
+            result, error = fn(), None
+        except BaseException as exc:
+            result, error = None, exc
+        with lock:
+            state.update(done=True, result=result, error=error)
+            abandoned = state["abandoned"]
+        finished.set()
+        if abandoned and error is None and on_late_result:
+            try:
+                on_late_result(result)
+            except Exception as late_e:
+                logging.warning(f"[DEADLINE] 處理逾時後才完成的 {stage} 結果失敗: {late_e}")
+
+    threading.Thread(target=_runner, name=f"deadline-{stage}", daemon=True).start()
+    deadline_at = time.time() + timeout if has_deadline else None
+    while True:
+        wait_for = 0.25 if cancel_event is not None else timeout
+        if deadline_at is not None:
+            wait_for = min(wait_for, max(0.0, deadline_at - time.time()))
+        if finished.wait(wait_for):
+            break
+        cancelled = cancel_event is not None and cancel_event.is_set()
+        expired = deadline_at is not None and time.time() >= deadline_at
+        if not (cancelled or expired):
+            continue
+        with lock:
+            if state["done"]:
+                break
+            state["abandoned"] = True
+        if cancelled:
+            raise CallCancelledError(f"{stage} 已被取消。")
+        raise DeadlineExceededError(f"{stage} 超過期限 {timeout:g} 秒仍未完成，已放棄此呼叫。")
+    if state["error"] is not None:
+        raise state["error"]
+    return state["result"]
+
 def get_application_path():
     if getattr(sys, 'frozen', False):
         return os.path.dirname(sys.executable)
@@ -117,6 +341,7 @@ def setup_logging(log_filename, verbose=False, log_queue=None):
     level = logging.DEBUG if verbose else logging.INFO
     for handler in logging.root.handlers[:]:
         logging.root.removeHandler(handler)
+        handler.close()
     handlers = [logging.FileHandler(log_filename, 'a', 'utf-8')]
     if log_queue:
         handlers.append(QueueHandler(log_queue))
@@ -128,17 +353,158 @@ def setup_logging(log_filename, verbose=False, log_queue=None):
     logging.getLogger("urllib3").setLevel(logging.WARNING)
     logging.getLogger("google.api_core").setLevel(logging.WARNING)
 
-try:
-    from google import genai
-except ImportError as import_error:
-    genai = None
-    GENAI_IMPORT_ERROR = import_error
-else:
-    GENAI_IMPORT_ERROR = None
+# google-genai 載入約需 0.4 秒，延遲到第一次建立 API 用戶端時才匯入 (僅合併等本機模式完全不需要)
+genai = None
+GENAI_IMPORT_ERROR = None
+_GENAI_IMPORT_LOCK = threading.Lock()
 
 def ensure_genai_available():
-    if genai is None:
-        raise ImportError("缺少 google-genai 套件，請執行：python -m pip install -U google-genai")
+    """匯入並回傳 google.genai 模組；未安裝時拋出附安裝說明的 ImportError。"""
+    global genai, GENAI_IMPORT_ERROR
+    with _GENAI_IMPORT_LOCK:
+        if genai is None:
+            try:
+                from google import genai as genai_module
+            except ImportError as import_error:
+                GENAI_IMPORT_ERROR = import_error
+                raise ImportError("缺少 google-genai 套件，請執行：python -m pip install -U google-genai") from import_error
+            genai = genai_module
+    return genai
+
+HTTP_KEEPALIVE_SECONDS = 120.0
+
+class HttpConnectionStats:
+    """以 httpx 的 response hook 統計請求數與實際建立的連線數；同一條連線上的後續請求即為重用。"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.http2_requests = 0
+        self._streams = weakref.WeakSet()
+
+    def on_response(self, response):
+        stream = response.extensions.get("network_stream")
+        with self.lock:
+            self.requests += 1
+            if response.http_version == "HTTP/2":
+                self.http2_requests += 1
+            try:
+                is_new = stream is None or stream not in self._streams
+                if stream is not None:
+                    self._streams.add(stream)
+            except TypeError:
+                is_new = True
+            if is_new:
+                self.connections += 1
+
+    def snapshot(self):
+        with self.lock:
+            return (self.requests, self.connections, self.http2_requests)
+
+    def log_summary(self, since=(0, 0, 0)):
+        requests, connections, http2_requests = (now - before for now, before in zip(self.snapshot(), since))
+        if requests <= 0:
+            return
+        reused = max(0, requests - connections)
+        logging.info(f"[HTTP] 請求 {requests} 次，新建連線 {connections} 條，重用連線 {reused} 次 ({reused / requests:.0%})，"
+                     f"其中 HTTP/2 請求 {http2_requests} 次。")
+
+def http_pool_size(config):
+    """連線池上限：--http_pool 未指定時依 workers 設定 (每個 worker 可能同時上傳與生成，另保留對沖 / 探測請求)。"""
+    pool = int(getattr(config, 'http_pool', 0) or 0)
+    if pool > 0:
+        return pool
+    return max(1, int(getattr(config, 'workers', 1) or 1)) * 2 + 2
+
+def _make_http_options(config, http_stats=None):
+    """建立 genai 的 HttpOptions：自訂 httpx 連線池大小、keep-alive 與 HTTP/2。"""
+    import httpx
+    pool = http_pool_size(config)
+    keepalive = float(getattr(config, 'http_keepalive', HTTP_KEEPALIVE_SECONDS))
+    http2 = bool(getattr(config, 'http2', True))
+    if http2 and importlib.util.find_spec("h2") is None:
+        logging.info("[HTTP] 未安裝 h2 套件，使用 HTTP/1.1 (pip install httpx[http2] 可啟用 HTTP/2)。")
+        http2 = False
+    client_args = {
+        "limits": httpx.Limits(max_connections=pool, max_keepalive_connections=pool, keepalive_expiry=keepalive),
+        "http2": http2,
+    }
+    if http_stats is not None:
+        client_args["event_hooks"] = {"response": [http_stats.on_response]}
+    logging.info(f"[HTTP] 連線池上限 {pool} 條，閒置連線保留 {keepalive:g} 秒，HTTP/2: {'開啟' if http2 else '關閉'}。")
+    return ensure_genai_available().types.HttpOptions(client_args=client_args)
+
+def create_genai_client(config, http_stats=None):
+    """建立 API 用戶端；設定 standin 時改用本機 Gemini 替身 (gemini_standin.py)，不連網也不消耗額度。"""
+    if getattr(config, 'standin', False):
+        import gemini_standin
+        logging.warning("[STANDIN] 使用本機 Gemini 替身，輸出為合成字幕，僅供測試。")
+        return gemini_standin.StandinClient(duration_seconds=getattr(config, 'chunk_duration', 600))
+    genai_module = ensure_genai_available()
+    api_key = config.api_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+    return genai_module.Client(api_key=api_key, http_options=_make_http_options(config, http_stats))
+
+_SHARED_CLIENT = None # (比對鍵, 用戶端, HttpConnectionStats 或 None, 連線池上限)
+_SHARED_CLIENT_LOCK = threading.Lock()
+
+def _shared_client_key(config):
+    """共用用戶端的比對鍵。連線池大小不列入：較小的任務直接沿用既有 (較大) 的連線池。"""
+    if getattr(config, 'standin', False):
+        return ("standin", getattr(config, 'chunk_duration', 600))
+    api_key = getattr(config, 'api_key', None) or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
+    return ("genai", api_key, float(getattr(config, 'http_keepalive', HTTP_KEEPALIVE_SECONDS)), bool(getattr(config, 'http2', True)))
+
+def _close_genai_client(client):
+    """關閉被取代的用戶端 (釋放其連線池)；替身或不支援 close() 的版本直接略過。"""
+    close = getattr(client, 'close', None)
+    if not callable(close):
+        return
+    try:
+        close()
+    except Exception as e:
+        logging.debug(f"[HTTP] 關閉舊的 API 用戶端失敗: {e}")
+
+def get_shared_genai_client(config):
+    """程序內共用的 API 用戶端：金鑰與連線設定相同的任務共用同一個連線池。
+
+    程序內只保留一個共用用戶端。金鑰或連線設定改變、或任務需要的連線池大於現有用戶端時，
+    建立新的用戶端並關閉舊的；同一程序的任務依序執行，因此不會關閉仍在使用中的用戶端。
+    """
+    global _SHARED_CLIENT
+    key = _shared_client_key(config)
+    pool = 0 if key[0] == "standin" else http_pool_size(config)
+    with _SHARED_CLIENT_LOCK:
+        replaced = _SHARED_CLIENT
+        if replaced is not None and replaced[0] == key and replaced[3] >= pool:
+            return replaced[1]
+        http_stats = None if key[0] == "standin" else HttpConnectionStats()
+        client = create_genai_client(config, http_stats)
+        _SHARED_CLIENT = (key, client, http_stats, pool)
+    if replaced is not None:
+        _close_genai_client(replaced[1])
+    return client
+
+def shared_http_stats(client):
+    """回傳共用用戶端的 HttpConnectionStats；非共用或替身用戶端回傳 None。"""
+    with _SHARED_CLIENT_LOCK:
+        shared = _SHARED_CLIENT
+    return shared[2] if shared is not None and shared[1] is client else None
+
+def get_task_client(config):
+    """任務使用的 API 用戶端：常駐工作程序已提供 (config.genai_client) 時沿用，否則取用程序內共用的用戶端。"""
+    client = getattr(config, 'genai_client', None)
+    return client if client is not None else get_shared_genai_client(config)
+
+TASK_CANCELLED_EXIT_CODE = 130
+
+class TaskCancelledError(Exception):
+    """使用者取消了任務 (config.cancel_event 被設定)。"""
+    pass
+
+def raise_if_task_cancelled(config):
+    cancel_event = getattr(config, 'cancel_event', None)
+    if cancel_event is not None and cancel_event.is_set():
+        raise TaskCancelledError("任務已被使用者取消。")
 
 def is_final_srt_valid(srt_text):
     """
@@ -161,11 +527,23 @@ def is_final_srt_valid(srt_text):
         
     return True
 
-def parse_time_v10(time_str):
-    """
-    將多種格式的時間字串 (HH:MM:SS,ms 或 HH:MM:SS.ms) 解析為 timedelta 物件。
-    這個版本增強了對毫秒的處理，並能處理不規則的格式。
-    """
+# ==============================================================================
+#  時間碼：SRT 時間軸一律以整數毫秒處理
+# ==============================================================================
+_ONE_MS = timedelta(milliseconds=1)
+# 格式正確的 HH:MM:SS,mmm (分、秒 < 60，毫秒 3 位) 直接解析，其餘交給容錯規則
+_TIMECODE_FAST_RE = re.compile(r'(\d+):([0-5]\d):([0-5]\d),(\d{3})')
+
+def parse_timecode_ms(time_str):
+    """將時間字串解析為整數毫秒；無法解析時回傳 None。規則與 parse_time_v10 相同。"""
+    match = _TIMECODE_FAST_RE.fullmatch(time_str.strip())
+    if match:
+        h, m, s, ms = match.groups()
+        return ((int(h) * 60 + int(m)) * 60 + int(s)) * 1000 + int(ms)
+    return _parse_timecode_tolerant(time_str)
+
+def _parse_timecode_tolerant(time_str):
+    """parse_timecode_ms 的慢速路徑：處理各種不標準的時間格式 (詳見檔頭第 1、18 項規則)。"""
     ts = time_str.strip().replace(':_', ':').replace('：', ':')
     
     # 處理潛在的格林威治時間格式 (HH:MM:SS.msZ)
@@ -228,37 +606,321 @@ def parse_time_v10(time_str):
         if m >= 60:
             logging.warning(f"分鐘數無效 ({m})，校正為 59。原始: '{time_str}'")
             m = 59
-        return timedelta(hours=h, minutes=m, seconds=s, milliseconds=ms)
+        return ((h * 60 + m) * 60 + s) * 1000 + ms
     except (ValueError, IndexError):
         logging.error(f"時間戳中的數字無法轉換: '{time_str}'")
         return None
 
+def format_timecode_ms(ms):
+    """整數毫秒 -> HH:MM:SS,mmm。負值的時、分、秒為 0，毫秒取 ms % 1000 (與 format_timedelta_v7 一致)。"""
+    if ms < 0:
+        return f"00:00:00,{ms % 1000:03}"
+    seconds, milliseconds = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%02d:%02d:%02d,%03d" % (hours, minutes, seconds, milliseconds)
+
+_ONE_US = timedelta(microseconds=1)
+_US_PER_SECOND = 1000000
+
+def _halve_us(us):
+    """整數微秒對半，與 timedelta / 2 相同：恰為 0.5 微秒時取偶數 (銀行家捨入)。"""
+    half, odd = divmod(us, 2)
+    return half + (odd and half & 1)
+
+def timedelta_to_ms(td):
+    """timedelta -> 整數毫秒 (不足 1 毫秒的部分向下捨去)。"""
+    return td // _ONE_MS
+
+def parse_time_v10(time_str):
+    """
+    將多種格式的時間字串 (HH:MM:SS,ms 或 HH:MM:SS.ms) 解析為 timedelta 物件。
+    這個版本增強了對毫秒的處理，並能處理不規則的格式。
+    """
+    ms = parse_timecode_ms(time_str)
+    return None if ms is None else timedelta(milliseconds=ms)
+
 def format_timedelta_v7(td):
     if not isinstance(td, timedelta): return "00:00:00,000"
-    total_seconds = max(0, td.total_seconds())
-    hours, remainder = divmod(total_seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    milliseconds = td.microseconds // 1000
-    return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02},{milliseconds:03}"
+    return format_timecode_ms(td // _ONE_MS)
 
-def format_srt_from_text_v16(srt_content, audio_filename, overlap_tolerance_td, chunk_duration_td, max_silence_seconds=10.0):
-    srt_content = srt_content.strip().replace('\r\n', '\n').replace('\r', '\n')
-    if srt_content.startswith("```srt"): srt_content = srt_content[srt_content.find('\n') + 1:]
-    if srt_content.endswith("\n```"): srt_content = srt_content[:-4]
+class CueTable:
+    """字幕表：開始/結束時間 (整數毫秒) 以兩個 array('q') 平行存放，文字存於 list。
 
-    lines = srt_content.split('\n')
-    parsed_blocks = []
-    current_block = {}
-    
-    for i, line in enumerate(lines):
-        line = line.strip()
-        
+    SRT 文字只在讀入時解析一次 (from_srt / read)、寫出時格式化一次 (to_srt / write)；
+    位移、篩選、合併與排序都直接在整數陣列上進行。skipped 為解析時因缺少時間行或時間戳無法解析而略過的條目數。
+    """
+    __slots__ = ("starts", "ends", "texts", "skipped")
+
+    def __init__(self):
+        self.starts = array('q')
+        self.ends = array('q')
+        self.texts = []
+        self.skipped = 0
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends, self.texts)
+
+    def append(self, start_ms, end_ms, text):
+        self.starts.append(start_ms)
+        self.ends.append(end_ms)
+        self.texts.append(text)
+
+    def extend(self, other, offset_ms=0):
+        """接上另一個字幕表，開始/結束時間加上 offset_ms。"""
+        if offset_ms:
+            self.starts.extend(start + offset_ms for start in other.starts)
+            self.ends.extend(end + offset_ms for end in other.ends)
+        else:
+            self.starts.extend(other.starts)
+            self.ends.extend(other.ends)
+        self.texts.extend(other.texts)
+        self.skipped += other.skipped
+
+    def filter(self, keep):
+        """回傳只含 keep(start_ms, end_ms) 為真之字幕的新字幕表。"""
+        table = CueTable()
+        for start_ms, end_ms, text in self:
+            if keep(start_ms, end_ms):
+                table.append(start_ms, end_ms, text)
+        return table
+
+    def sort(self):
+        """依 (開始, 結束) 時間穩定排序。"""
+        starts, ends = self.starts, self.ends
+        order = sorted(range(len(self.texts)), key=lambda i: (starts[i], ends[i]))
+        self.starts = array('q', [starts[i] for i in order])
+        self.ends = array('q', [ends[i] for i in order])
+        self.texts = [self.texts[i] for i in order]
+
+    def clip_overlaps(self):
+        """相鄰字幕重疊時，將前一條的結束時間截到下一條的開始時間。"""
+        starts, ends = self.starts, self.ends
+        for idx in range(len(self.texts) - 1):
+            if ends[idx] > starts[idx + 1] > starts[idx]:
+                ends[idx] = starts[idx + 1]
+
+    @classmethod
+    def from_srt(cls, srt_text):
+        table = cls()
+        for entry in srt_text.strip().split('\n\n'):
+            entry = entry.strip()
+            if not entry:
+                continue
+            cue = _parse_srt_entry(entry)
+            if cue is None:
+                table.skipped += 1
+                continue
+            table.append(*cue)
+        return table
+
+    @classmethod
+    def read(cls, srt_path):
+        with open(srt_path, 'r', encoding='utf-8') as f:
+            return cls.from_srt(f.read())
+
+    def to_srt(self, first_index=1, offset_ms=0):
+        return "".join(format_srt_cues(self, first_index, offset_ms))
+
+    def write(self, outfile, first_index=1, offset_ms=0):
+        """以 first_index 起算編號寫出 SRT，回傳下一個編號。"""
+        outfile.writelines(format_srt_cues(self, first_index, offset_ms))
+        return first_index + len(self.texts)
+
+def _parse_srt_entry(entry):
+    """解析一個已去除前後空白的 SRT 條目，回傳 (start_ms, end_ms, 文字)；缺少時間行或時間戳無法解析時回傳 None。"""
+    _, newline, rest = entry.partition('\n')
+    if not newline:
+        return None
+    time_line, _, text = rest.partition('\n')
+    start_str, arrow, end_str = time_line.partition('-->')
+    if not arrow:
+        return None
+    start_ms, end_ms = parse_timecode_ms(start_str), parse_timecode_ms(end_str)
+    if start_ms is None or end_ms is None:
+        return None
+    return start_ms, end_ms, text
+
+def iter_srt_cues(srt_path):
+    """讀取 SRT 檔案，逐條產生 (start_ms, end_ms, 文字)；解析規則與 CueTable.from_srt 相同，無法解析的條目略過。"""
+    with open(srt_path, 'r', encoding='utf-8') as f:
+        srt_text = f.read()
+    for entry in srt_text.split('\n\n'):
+        entry = entry.strip()
+        if entry:
+            cue = _parse_srt_entry(entry)
+            if cue is not None:
+                yield cue
+
+def format_srt_cues(cues, first_index=1, offset_ms=0):
+    """將 (start_ms, end_ms, 文字) 序列格式化為 SRT 條目字串 (以 first_index 起算重新編號)。"""
+    for idx, (start_ms, end_ms, text) in enumerate(cues, start=first_index):
+        yield f"{idx}\n{format_timecode_ms(start_ms + offset_ms)} --> {format_timecode_ms(end_ms + offset_ms)}\n{text}\n\n"
+
+class DegenerateOutputDetector:
+    """偵測模型輸出陷入重複迴圈：同一句 (或同一組句子) 反覆出現，或開始時間長時間停滯不前。
+
+    每個字幕塊只比對最近 MAX_PERIOD 個文字雜湊並更新計數，整體對回應長度為線性時間。
+    repeat_limit: 週期 p 的句組連續重複達此次數，且這些字幕的開始時間未前進或平均間隔小於 LOOP_MIN_SPACING_MS
+    才判定為迴圈 (音樂段的連續 ♪、(笑) 等以正常節奏出現時屬於合法內容)；stall_limit: 開始時間連續未前進的塊數上限。
+    任一門檻為 0 時停用對應的檢查。
+    """
+    MAX_PERIOD = 4
+    LOOP_MIN_SPACING_MS = 500
+
+    def __init__(self, repeat_limit=12, stall_limit=20):
+        self.repeat_limit = max(0, int(repeat_limit))
+        self.stall_limit = max(0, int(stall_limit))
+        self._recent_hashes = deque(maxlen=self.MAX_PERIOD)
+        self._recent_starts = deque(maxlen=max(1, self.repeat_limit) * self.MAX_PERIOD)
+        self._period_runs = [0] * (self.MAX_PERIOD + 1)
+        self._stall_run = 0
+        self._max_start_ms = None
+        self.cues_seen = 0
+        self.reason = None
+        self.loop_start_cue = None # 迴圈開始的字幕塊序號 (從 1 起算)
+
+    def observe(self, text, start_ms):
+        """記錄一個字幕塊；偵測到迴圈時回傳 True (之後持續回傳 True)。"""
+        if self.reason:
+            return True
+        self.cues_seen += 1
+        text_hash = hash(" ".join(text.split()))
+        self._recent_starts.append(start_ms)
+
+        if self.repeat_limit:
+            for period in range(1, self.MAX_PERIOD + 1):
+                if len(self._recent_hashes) >= period and self._recent_hashes[-period] == text_hash:
+                    self._period_runs[period] += 1
+                else:
+                    self._period_runs[period] = 0
+                # 連續 (repeat_limit - 1) * period 個塊與前一週期相同 => 該句組共重複 repeat_limit 次
+                if (self._period_runs[period] >= (self.repeat_limit - 1) * period
+                        and self._repeat_timing_is_degenerate(self.repeat_limit * period)):
+                    self.loop_start_cue = self.cues_seen - self._period_runs[period] - period + 1
+                    self.reason = f"週期 {period} 的字幕內容連續重複 {self.repeat_limit} 次且時間軸停滯或過密 (自第 {self.loop_start_cue} 條起)"
+                    return True
+        self._recent_hashes.append(text_hash)
+
+        if self.stall_limit:
+            if start_ms is None or (self._max_start_ms is not None and start_ms <= self._max_start_ms):
+                self._stall_run += 1
+            else:
+                self._stall_run = 0
+                self._max_start_ms = start_ms
+            if self._stall_run >= self.stall_limit:
+                self.loop_start_cue = self.cues_seen - self._stall_run + 1
+                self.reason = f"連續 {self._stall_run} 條字幕的開始時間未前進 (自第 {self.loop_start_cue} 條起)"
+                return True
+        return False
+
+    def _repeat_timing_is_degenerate(self, count):
+        """最近 count 條重複字幕的開始時間未前進 (或無法解析)，或平均間隔小於 LOOP_MIN_SPACING_MS 時回傳 True。"""
+        starts = list(self._recent_starts)[-count:]
+        if any(start is None for start in starts):
+            return True
+        if any(later <= earlier for earlier, later in zip(starts, starts[1:])):
+            return True
+        return starts[-1] - starts[0] < (len(starts) - 1) * self.LOOP_MIN_SPACING_MS
+
+
+class IncrementalSRTParser:
+    """`format_srt_from_text_v16` 的增量版本：可逐段餵入模型輸出，即時解析並校正字幕塊。
+
+    解析與校正規則與原本的批次版本完全相同。遇到需要「往後探測下一個有效時間點」的
+    錯誤塊時，會先計入嚴重修正並暫存，等後續字幕塊到達 (或 finish) 時再決定校正位置。
+    cue_count / severe_correction_count 可在串流過程中即時讀取；severe_ranges 記錄每次嚴重修正
+    涉及的 (開始, 結束) 時間範圍 (timedelta，區塊內相對時間)。
+    內部時間一律為整數微秒：「智慧置中」會將靜音長度對半，校正後的時間可能落在半毫秒上，
+    並影響後續的重疊判斷與下一次校正；只有寫入字幕表 (整數毫秒) 時才向下捨去。
+    """
+    MAX_DURATION_US = 18 * _US_PER_SECOND
+    MAX_REASONABLE_GAP_US = 30 * _US_PER_SECOND
+
+    def __init__(self, audio_filename, overlap_tolerance_td, chunk_duration_td, max_silence_seconds=10.0, detector=None):
+        self.audio_filename = audio_filename
+        self.detector = detector
+        self.overlap_tolerance_us = overlap_tolerance_td // _ONE_US
+        self.chunk_duration_us = chunk_duration_td // _ONE_US
+        self.max_silence_us = timedelta(seconds=max_silence_seconds) // _ONE_US
+        self.cues = CueTable()
+        self.severe_correction_count = 0
+        self.severe_ranges = []
+        self.last_correct_end_us = 0
+        self._line_buffer = ""
+        self._carry_cr = ""
+        self._line_no = 0
+        self._seen_content = False
+        self._held_lines = []
+        self._current_block = {}
+        self._pending = deque()
+        self._scan_pos = 1
+        self._scan_floor_us = 0
+        self._head_is_bad = False
+        self._finished = False
+
+    @property
+    def cue_count(self):
+        return len(self.cues)
+
+    @property
+    def degenerate_reason(self):
+        """偵測到重複迴圈時的說明文字；未設定 detector 或未偵測到時為 None。"""
+        return self.detector.reason if self.detector is not None else None
+
+    # --- 逐行解析 ---
+    def feed(self, text):
+        """餵入一段文字，回傳本次新增的已校正字幕數。"""
+        before = len(self.cues)
+        text = self._carry_cr + text
+        # 串流切點可能落在 \r\n 中間，結尾的 \r 留到下一段再判斷
+        self._carry_cr = '\r' if text.endswith('\r') else ''
+        if self._carry_cr:
+            text = text[:-1]
+        self._line_buffer += text.replace('\r\n', '\n').replace('\r', '\n')
+        *lines, self._line_buffer = self._line_buffer.split('\n')
+        for line in lines:
+            self._feed_line(line)
+        self._drain()
+        return len(self.cues) - before
+
+    def _feed_line(self, raw_line):
+        line = raw_line.strip()
+        if not self._seen_content:
+            if not line:
+                return
+            self._seen_content = True
+            if line.startswith("```srt"):  # 回應開頭的 ```srt 標記
+                return
+        # 結尾的 ``` 標記只有在確定後面沒有其他內容時才捨棄，因此先暫存
+        if raw_line.rstrip() == "```":
+            self._flush_held_lines()
+            self._held_lines.append(raw_line)
+            return
+        if self._held_lines:
+            if not line:
+                self._held_lines.append(raw_line)
+                return
+            self._flush_held_lines()
+        self._parse_line(line)
+
+    def _flush_held_lines(self):
+        held, self._held_lines = self._held_lines, []
+        for held_line in held:
+            self._parse_line(held_line.strip())
+
+    def _parse_line(self, line):
+        self._line_no += 1
+        current_block = self._current_block
         if not line: # 空行通常是塊之間的間隔
             if current_block and "time_line" in current_block: # 如果當前塊已收集時間行，則表示一個塊結束
-                parsed_blocks.append(current_block)
-                current_block = {}
-            continue
-        
+                self._add_block(current_block)
+                self._current_block = {}
+            return
+
         if line.isdigit() and not current_block: # 序列號，且是新塊的開始
             current_block["original_index"] = int(line) - 1 # 轉換為0-based index
             current_block["text_lines"] = []
@@ -267,133 +929,173 @@ def format_srt_from_text_v16(srt_content, audio_filename, overlap_tolerance_td,
         elif "original_index" in current_block: # 文本行
             current_block["text_lines"].append(line)
         else: # 無法識別的行，可能是開頭的雜訊或錯誤格式
-            logging.warning(f"[{audio_filename}] 無法識別的行 (行 {i+1}): '{line}'。已跳過。")
-
-    if current_block and "time_line" in current_block: # 添加最後一個塊
-        parsed_blocks.append(current_block)
+            logging.warning(f"[{self.audio_filename}] 無法識別的行 (行 {self._line_no}): '{line}'。已跳過。")
 
-    final_parsed_blocks = []
-    for i, block_data in enumerate(parsed_blocks):
-        original_index = block_data.get("original_index", i) # 如果沒有序列號，使用遍歷索引
-        time_line = block_data.get("time_line")
+    def _add_block(self, block_data):
+        original_index = block_data["original_index"]
+        time_line = block_data["time_line"]
         full_text = '\n'.join(block_data.get("text_lines", []))
 
-        if not time_line:
-            logging.warning(f"[{audio_filename}] 塊 {original_index+1} 缺少時間戳行，已跳過。")
-            continue
-
         start_raw, end_raw = [t.strip() for t in time_line.split('-->')]
-        start_td, end_td = parse_time_v10(start_raw), parse_time_v10(end_raw)
-        
-        is_valid = start_td is not None and end_td is not None and end_td > start_td
-        
+        start_ms, end_ms = parse_timecode_ms(start_raw), parse_timecode_ms(end_raw)
+
+        is_valid = start_ms is not None and end_ms is not None and end_ms > start_ms
+
         # 即使文本為空，只要時間戳有效，也將其視為一個塊
         if not full_text:
-            logging.warning(f"[{audio_filename}] 塊 {original_index+1} 的 API 回應文本為空。")
-            # 不再 'continue'，而是將其添加到 parsed_blocks 中，以便後續處理
-            
-        final_parsed_blocks.append({
+            logging.warning(f"[{self.audio_filename}] 塊 {original_index+1} 的 API 回應文本為空。")
+
+        if self.detector is not None:
+            self.detector.observe(full_text, start_ms)
+
+        self._pending.append({
             "original_index": original_index,
-            "start_td": start_td,
-            "end_td": end_td,
+            "start_us": None if start_ms is None else start_ms * 1000,
+            "end_us": None if end_ms is None else end_ms * 1000,
             "text": full_text,
             "is_valid": is_valid,
             "time_line": time_line
         })
 
-    # 使用 final_parsed_blocks 進行後續處理
-    parsed_blocks = final_parsed_blocks
-    
-    corrected_blocks = []
-    entry_counter = 1
-    last_correct_end_td = timedelta(0)
-    severe_correction_count = 0
-    MAX_DURATION = timedelta(seconds=18)
-    MAX_SILENCE_TD = timedelta(seconds=max_silence_seconds)
-    
-    i = 0
-    while i < len(parsed_blocks):
-        block = parsed_blocks[i]
-        
-        is_unparsable = not block["is_valid"]
-        
-        is_overlap_violation = False
-        if overlap_tolerance_td.total_seconds() >= 0:
-            is_overlap_violation = block["is_valid"] and block["start_td"] < (last_correct_end_td - overlap_tolerance_td)
-
-        if is_unparsable or is_overlap_violation:
-            severe_correction_count += 1
-            log_msg = f"[{audio_filename}] SRT修正: 塊 {block['original_index']+1} " + (f"無法解析時間戳 '{block['time_line']}' 或時間倒流" if is_unparsable else f"檢測到時間軸重疊")
-            logging.warning(log_msg)
-
-            next_good_start_td = None
-            for next_block in parsed_blocks[i+1:]:
-                if next_block["is_valid"] and next_block["start_td"] >= last_correct_end_td:
-                    next_good_start_td = next_block["start_td"]
-                    break
-            
-            MAX_REASONABLE_GAP = timedelta(seconds=30)
-            
-            use_smart_logic = (
-                next_good_start_td is not None and
-                (next_good_start_td - last_correct_end_td) <= MAX_REASONABLE_GAP
-            )
+    # --- 時間軸校正 ---
+    def _find_next_good_start(self):
+        """在暫存的後續字幕塊中尋找下一個有效且不早於 last_correct_end_us 的開始時間。
+
+        _pending[1:_scan_pos] 已確認無效或開始時間早於 _scan_floor_us；只要 last_correct_end_us 不低於
+        _scan_floor_us，這些塊不必重看，直接從 _scan_pos 接續掃描，整體校正維持線性時間。
+        """
+        floor_us = self.last_correct_end_us
+        if floor_us < self._scan_floor_us:
+            self._scan_pos = 1
+        self._scan_floor_us = floor_us
+        pending = self._pending
+        while self._scan_pos < len(pending):
+            next_block = pending[self._scan_pos] # 掃描指標多半靠近 deque 尾端，索引為常數時間
+            if next_block["is_valid"] and next_block["start_us"] >= floor_us:
+                return next_block["start_us"], True
+            self._scan_pos += 1
+        return None, self._finished
+
+    def _drain(self):
+        audio_filename = self.audio_filename
+        while self._pending:
+            block = self._pending[0]
+
+            if not self._head_is_bad:
+                is_unparsable = not block["is_valid"]
+                is_overlap_violation = False
+                if self.overlap_tolerance_us >= 0:
+                    is_overlap_violation = block["is_valid"] and block["start_us"] < (self.last_correct_end_us - self.overlap_tolerance_us)
+
+                if is_unparsable or is_overlap_violation:
+                    self.severe_correction_count += 1
+                    log_msg = f"[{audio_filename}] SRT修正: 塊 {block['original_index']+1} " + (f"無法解析時間戳 '{block['time_line']}' 或時間倒流" if is_unparsable else f"檢測到時間軸重疊")
+                    logging.warning(log_msg)
+                    self._head_is_bad = True
+
+            if self._head_is_bad:
+                next_good_start_us, resolved = self._find_next_good_start()
+                if not resolved:
+                    return # 等待後續字幕塊到達後再校正
+                self._correct_bad_block(block, next_good_start_us)
+                self._head_is_bad = False
+
+            self._pending.popleft()
+            self._scan_pos = max(1, self._scan_pos - 1)
+            self._finalize_block(block)
+
+    def _correct_bad_block(self, block, next_good_start_us):
+        audio_filename = self.audio_filename
+        last_correct_end_us = self.last_correct_end_us
+
+        use_smart_logic = (
+            next_good_start_us is not None and
+            (next_good_start_us - last_correct_end_us) <= self.MAX_REASONABLE_GAP_US
+        )
 
-            dynamic_safe_duration = timedelta(seconds=2) if len(block["text"]) >= 8 else timedelta(seconds=1)
+        dynamic_safe_duration_us = (2000 if len(block["text"]) >= 8 else 1000) * 1000
 
-            if use_smart_logic:
-                silence_duration = next_good_start_td - last_correct_end_td
-                if silence_duration > MAX_SILENCE_TD:
-                    logging.warning(f"[{audio_filename}]   -> 檢測到超長靜音 ({silence_duration.total_seconds():.1f}s)，採用「安全後貼」策略。")
-                    end_td = next_good_start_td - timedelta(milliseconds=200)
-                    start_td = end_td - dynamic_safe_duration
-                else:
-                    logging.warning(f"[{audio_filename}]   -> 檢測到常規靜音 ({silence_duration.total_seconds():.1f}s)，採用「智慧置中」策略。")
-                    remaining_silence = silence_duration - dynamic_safe_duration
-                    start_offset = max(timedelta(milliseconds=100), remaining_silence / 2)
-                    start_td = last_correct_end_td + start_offset
-                    end_td = start_td + dynamic_safe_duration
+        if use_smart_logic:
+            silence_duration_us = next_good_start_us - last_correct_end_us
+            if silence_duration_us > self.max_silence_us:
+                logging.warning(f"[{audio_filename}]   -> 檢測到超長靜音 ({silence_duration_us / _US_PER_SECOND:.1f}s)，採用「安全後貼」策略。")
+                end_us = next_good_start_us - 200 * 1000
+                start_us = end_us - dynamic_safe_duration_us
             else:
-                if next_good_start_td:
-                     logging.warning(f"[{audio_filename}]   -> 探測到過於遙遠的下個時間點，退回標準修正策略。")
-                logging.warning(f"[{audio_filename}]   -> 採用標準向前修正策略。")
-                dynamic_safe_duration = timedelta(seconds=3) if len(block["text"]) >= 8 else timedelta(seconds=1.5)
-                start_td = last_correct_end_td + timedelta(milliseconds=100)
-                end_td = start_td + dynamic_safe_duration
-            
-            if start_td < last_correct_end_td:
-                start_td = last_correct_end_td + timedelta(milliseconds=50)
-            if end_td <= start_td:
-                end_td = start_td + dynamic_safe_duration
-
-            block["start_td"] = start_td
-            block["end_td"] = end_td
-            block["is_valid"] = True
-
-        if (block["end_td"] - block["start_td"]) > MAX_DURATION:
-            logging.warning(f"[{audio_filename}] SRT修正: 塊 {block['original_index']+1} 檢測到超長持續時間 ({ (block['end_td'] - block['start_td']).total_seconds():.1f}s > {MAX_DURATION.total_seconds()}s)，已自動校正。")
-            severe_correction_count += 1 # 將超長持續時間視為嚴重修正
-            block["end_td"] = block["start_td"] + timedelta(seconds=5)
-
-        if block["end_td"] > chunk_duration_td:
-            logging.warning(f"[{audio_filename}] SRT修正: 塊 {block['original_index']+1} 結束時間 ({format_timedelta_v7(block['end_td'])}) 超過分段時長 ({format_timedelta_v7(chunk_duration_td)})，已校正至邊界。")
-            block["end_td"] = chunk_duration_td
-            if block["start_td"] >= block["end_td"]:
-                block["start_td"] = block["end_td"] - timedelta(seconds=1)
-                if block["start_td"] < timedelta(0):
-                    block["start_td"] = timedelta(0)
-
-        last_correct_end_td = block["end_td"]
-        
-        corrected_blocks.append(f"{entry_counter}\n{format_timedelta_v7(block['start_td'])} --> {format_timedelta_v7(block['end_td'])}\n{block['text']}")
-        entry_counter += 1
-        i += 1
+                logging.warning(f"[{audio_filename}]   -> 檢測到常規靜音 ({silence_duration_us / _US_PER_SECOND:.1f}s)，採用「智慧置中」策略。")
+                remaining_silence_us = silence_duration_us - dynamic_safe_duration_us
+                start_offset_us = max(100 * 1000, _halve_us(remaining_silence_us))
+                start_us = last_correct_end_us + start_offset_us
+                end_us = start_us + dynamic_safe_duration_us
+        else:
+            if next_good_start_us:
+                 logging.warning(f"[{audio_filename}]   -> 探測到過於遙遠的下個時間點，退回標準修正策略。")
+            logging.warning(f"[{audio_filename}]   -> 採用標準向前修正策略。")
+            dynamic_safe_duration_us = (3000 if len(block["text"]) >= 8 else 1500) * 1000
+            start_us = last_correct_end_us + 100 * 1000
+            end_us = start_us + dynamic_safe_duration_us
+
+        if start_us < last_correct_end_us:
+            start_us = last_correct_end_us + 50 * 1000
+        if end_us <= start_us:
+            end_us = start_us + dynamic_safe_duration_us
+
+        block["start_us"] = start_us
+        block["end_us"] = end_us
+        block["is_valid"] = True
+        # 受損範圍：上一個正確塊結束到下一個有效開始時間 (找不到時到校正後的結束時間)
+        range_end_us = max(end_us, next_good_start_us) if use_smart_logic else end_us
+        self.severe_ranges.append((timedelta(microseconds=last_correct_end_us), timedelta(microseconds=range_end_us)))
+
+    def _finalize_block(self, block):
+        audio_filename = self.audio_filename
+        MAX_DURATION_US = self.MAX_DURATION_US
+        chunk_duration_us = self.chunk_duration_us
+        start_us, end_us = block["start_us"], block["end_us"]
+
+        if (end_us - start_us) > MAX_DURATION_US:
+            logging.warning(f"[{audio_filename}] SRT修正: 塊 {block['original_index']+1} 檢測到超長持續時間 ({(end_us - start_us) / _US_PER_SECOND:.1f}s > {MAX_DURATION_US / _US_PER_SECOND}s)，已自動校正。")
+            self.severe_correction_count += 1 # 將超長持續時間視為嚴重修正
+            self.severe_ranges.append((timedelta(microseconds=start_us), timedelta(microseconds=start_us + MAX_DURATION_US)))
+            end_us = start_us + 5 * _US_PER_SECOND
+
+        if end_us > chunk_duration_us:
+            logging.warning(f"[{audio_filename}] SRT修正: 塊 {block['original_index']+1} 結束時間 ({format_timecode_ms(end_us // 1000)}) 超過分段時長 ({format_timecode_ms(chunk_duration_us // 1000)})，已校正至邊界。")
+            end_us = chunk_duration_us
+            if start_us >= end_us:
+                start_us = max(0, end_us - _US_PER_SECOND)
+        block["start_us"], block["end_us"] = start_us, end_us
+
+        self.last_correct_end_us = end_us
+        self.cues.append(start_us // 1000, end_us // 1000, block['text'])
+
+    def finish(self):
+        """結束輸入並校正剩餘字幕塊，回傳與 format_srt_from_text_v16 相同的 (srt, 嚴重修正數, 最後結束時間)。"""
+        if not self._finished:
+            if self._carry_cr:
+                self._carry_cr = ""
+                self.feed('\n')
+            if self._line_buffer:
+                self._feed_line(self._line_buffer)
+                self._line_buffer = ""
+            self._held_lines = [] # 結尾的 ``` 標記不屬於字幕內容
+            if self._current_block and "time_line" in self._current_block: # 添加最後一個塊
+                self._add_block(self._current_block)
+            self._current_block = {}
+            self._finished = True
+            self._drain()
+
+        if not self.cues:
+            logging.warning(f"在 {self.audio_filename} 的回應中未能解析出任何有效的字幕塊。")
+            raise SRTContentParseError(f"在 {self.audio_filename} 的回應中未能解析出任何有效的字幕塊。")
+
+        return self.cues.to_srt(), self.severe_correction_count, timedelta(microseconds=self.last_correct_end_us)
 
-    if not corrected_blocks:
-        logging.warning(f"在 {audio_filename} 的回應中未能解析出任何有效的字幕塊。")
-        raise SRTContentParseError(f"在 {audio_filename} 的回應中未能解析出任何有效的字幕塊。")
-        
-    return "\n\n".join(corrected_blocks) + "\n\n", severe_correction_count, last_correct_end_td
+
+def format_srt_from_text_v16(srt_content, audio_filename, overlap_tolerance_td, chunk_duration_td, max_silence_seconds=10.0):
+    parser = IncrementalSRTParser(audio_filename, overlap_tolerance_td, chunk_duration_td, max_silence_seconds)
+    parser.feed(srt_content)
+    return parser.finish()
 
 
 _UPLOAD_COPY_LOCK = threading.Lock()
@@ -437,13 +1139,978 @@ def _make_api_upload_copy(audio_path, attempt=0):
     shutil.copy2(audio_path, upload_path)
     return upload_path
 
+# NEW: 跨區塊共用的提示詞內容快取
+class PromptCacheManager:
+    """為單一任務的提示詞建立一份 Gemini cached content，供所有區塊與重試共用。
+
+    首次 get() 時才建立；剩餘 TTL 低於 refresh_margin 時自動延長；任務結束呼叫 close() 刪除。
+    建立失敗 (例如提示詞低於模型的最小快取 token 數) 時只警告一次，之後 get() 一律回傳 None，
+    呼叫端改為直接傳送提示詞。
+    """
+    def __init__(self, client, model_name, prompt_text, ttl_seconds=3600, display_name=""):
+        self.client = client
+        self.model_name = model_name
+        self.prompt_text = prompt_text
+        self.ttl_seconds = max(60, int(ttl_seconds))
+        self.refresh_margin = max(30, self.ttl_seconds // 4)
+        self.display_name = display_name[:100]
+        self.name = None
+        self.disabled = not prompt_text
+        self.lock = threading.Lock()
+        self._expires_at = 0.0
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def get(self):
+        """回傳可用的 cached content 名稱；無法使用快取時回傳 None。"""
+        with self.lock:
+            if self.disabled:
+                return None
+            if self.name and self._expires_at - time.time() > self.refresh_margin:
+                return self.name
+            if self.name:
+                try:
+                    self.client.caches.update(name=self.name, config={"ttl": f"{self.ttl_seconds}s"})
+                    self._expires_at = time.time() + self.ttl_seconds
+                    logging.info(f"[CACHE] 已延長提示詞快取 {self.name} 的 TTL ({self.ttl_seconds}s)。")
+                    return self.name
+                except Exception as e:
+                    logging.warning(f"[CACHE] 延長提示詞快取 TTL 失敗，將重新建立: {e}")
+                    self.name = None
+            try:
+                cache = self.client.caches.create(
+                    model=self.model_name,
+                    config={"contents": [self.prompt_text], "ttl": f"{self.ttl_seconds}s", "display_name": self.display_name},
+                )
+            except Exception as e:
+                self.disabled = True
+                logging.warning(f"[CACHE] 建立提示詞快取失敗，本次任務改為每次請求直接傳送提示詞: {e}")
+                return None
+            self.name = cache.name
+            self._expires_at = time.time() + self.ttl_seconds
+            cached_token_count = getattr(getattr(cache, "usage_metadata", None), "total_token_count", None)
+            logging.info(f"[CACHE] 已建立提示詞快取 {self.name} (TTL {self.ttl_seconds}s" + (f", {cached_token_count} tokens)" if cached_token_count else ")"))
+            return self.name
+
+    def invalidate(self, name):
+        """快取在伺服器端已失效 (過期或被刪除) 時呼叫，下次 get() 會重新建立。"""
+        with self.lock:
+            if self.name == name:
+                self.name = None
+
+    @staticmethod
+    def is_cache_error(e):
+        """判斷請求失敗是否因為引用的 cached content 已不存在。"""
+        code, _ = _error_code_and_status(e)
+        return code in (403, 404) or "cachedcontent" in str(e).lower().replace(" ", "").replace("_", "")
+
+    def record_usage(self, usage_metadata):
+        if not usage_metadata:
+            return
+        with self.lock:
+            self.requests += 1
+            self.prompt_tokens += usage_metadata.prompt_token_count or 0
+            self.cached_tokens += getattr(usage_metadata, "cached_content_token_count", None) or 0
+
+    def log_summary(self):
+        """在任務結束時回報快取節省的輸入 token。prompt_token_count 已包含快取部分，即為未快取的基準。"""
+        if not self.requests:
+            return
+        share = self.cached_tokens / self.prompt_tokens * 100 if self.prompt_tokens else 0.0
+        logging.info(f"[CACHE] {self.requests} 次請求的輸入 token 共 {self.prompt_tokens}，其中 {self.cached_tokens} ({share:.1f}%) 由提示詞快取提供，"
+                     f"相較未快取基準少傳送並以快取費率計費。")
+
+    def close(self):
+        with self.lock:
+            name, self.name = self.name, None
+            self.disabled = True
+        if name:
+            try:
+                self.client.caches.delete(name=name)
+                logging.info(f"[CACHE] 已刪除提示詞快取 {name}。")
+            except Exception as e:
+                logging.warning(f"[CACHE] 刪除提示詞快取 {name} 失敗 (將於 TTL 到期後自動失效): {e}")
+
+# NEW: 依 (錯誤類別, 模型) 的斷路器
+CIRCUIT_CLASSES = ("quota", "server", "timeout", "deadline", "empty", "parse")
+
+class CircuitBreaker:
+    """單一 (錯誤類別, 模型) 的斷路器狀態。由 CircuitBreakerBoard 在鎖內操作。"""
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, error_class, model_name, cooldown):
+        self.error_class = error_class
+        self.model_name = model_name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.opened_at = 0.0
+        self.failed_probes = 0
+        self.probe_in_flight = False
+        self.locked = False # 探測連續失敗達上限，不再放行
+
+    def open(self, now):
+        self.state = self.OPEN
+        self.opened_at = now
+        self.probe_in_flight = False
+
+    def close(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self.failed_probes = 0
+        self.cooldown = self.base_cooldown
+        self.probe_in_flight = False
+        self.locked = False
+
+class CircuitBreakerBoard:
+    """所有工作執行緒共用的斷路器集合，依 (錯誤類別, 模型) 分別計算連續失敗。
+
+    acquire(): 該模型有任何斷路器開啟時暫停等待 (區塊被「停放」而非失敗)；冷卻結束後只放行一個
+    探測請求，其餘持續等待。record_success(): 該模型的所有斷路器關閉。record_failure(): 累計失敗，
+    探測失敗時冷卻時間加倍 (上限 max_cooldown)，連續 max_failed_probes 次後鎖定並拋出 CircuitOpenError。
+    只有 classes 內的錯誤算作探測失敗；探測請求若以其他類別失敗 (severe、degenerate 等內容問題)，
+    表示模型已能正常回應，該斷路器視為恢復並關閉。
+    """
+    def __init__(self, threshold=5, cooldown=60, max_cooldown=600, max_failed_probes=3, classes=CIRCUIT_CLASSES):
+        self.threshold = max(1, int(threshold))
+        self.cooldown = max(1.0, float(cooldown))
+        self.max_cooldown = max(self.cooldown, float(max_cooldown))
+        self.max_failed_probes = max(1, int(max_failed_probes))
+        self.classes = tuple(classes)
+        self.lock = threading.Lock()
+        self.breakers = {}
+        self.trips = 0
+
+    def _breaker(self, error_class, model_name):
+        key = (error_class, model_name)
+        if key not in self.breakers:
+            self.breakers[key] = CircuitBreaker(error_class, model_name, self.cooldown)
+        return self.breakers[key]
+
+    def acquire(self, model_name, label="", cancel_event=None):
+        """等待到可以送出請求為止；回傳本次請求擔任探測的 CircuitBreaker，一般請求回傳 None。"""
+        parked_logged = False
+        while True:
+            with self.lock:
+                blocking = [b for b in self.breakers.values() if b.model_name == model_name and b.state != CircuitBreaker.CLOSED]
+                locked = [b for b in blocking if b.locked]
+                if locked:
+                    raise CircuitOpenError(f"模型 '{model_name}' 的 {locked[0].error_class} 斷路器在 {self.max_failed_probes} 次探測後仍開啟，停止送出請求。")
+                if not blocking:
+                    if parked_logged:
+                        logging.info(f"[CIRCUIT] '{label}' 恢復送出請求。")
+                    return None
+                now = time.time()
+                for b in blocking:
+                    if b.state == CircuitBreaker.OPEN and now >= b.opened_at + b.cooldown:
+                        b.state = CircuitBreaker.HALF_OPEN
+                        logging.info(f"[CIRCUIT] {b.error_class}/{model_name} 冷卻結束，進入半開狀態，等待探測請求。")
+                still_open = [b for b in blocking if b.state == CircuitBreaker.OPEN]
+                idle_half_open = [b for b in blocking if b.state == CircuitBreaker.HALF_OPEN and not b.probe_in_flight]
+                if not still_open and idle_half_open:
+                    probe = idle_half_open[0]
+                    probe.probe_in_flight = True
+                    logging.info(f"[CIRCUIT] 以 '{label}' 作為 {probe.error_class}/{model_name} 的探測請求。")
+                    return probe
+                wake_in = min([b.opened_at + b.cooldown - now for b in still_open] or [1.0])
+            if not parked_logged:
+                logging.warning(f"[CIRCUIT] 模型 '{model_name}' 的斷路器開啟中，'{label}' 暫停等待 (約 {max(0.0, wake_in):.0f} 秒後探測)。")
+                parked_logged = True
+            if cancel_event is not None and cancel_event.is_set():
+                raise CallCancelledError("等待斷路器時已被取消。")
+            time.sleep(min(1.0, max(0.05, wake_in)))
+
+    def release(self, probe):
+        """探測請求被取消 (未得到結果) 時歸還探測名額。"""
+        if probe is None:
+            return
+        with self.lock:
+            probe.probe_in_flight = False
+
+    def record_success(self, model_name, probe=None):
+        with self.lock:
+            for b in self.breakers.values():
+                if b.model_name != model_name:
+                    continue
+                if b.state != CircuitBreaker.CLOSED:
+                    logging.info(f"[CIRCUIT] {b.error_class}/{model_name} 已恢復，斷路器關閉。")
+                b.close()
+
+    def record_failure(self, error_class, model_name, probe=None):
+        with self.lock:
+            now = time.time()
+            if probe is not None and error_class not in self.classes:
+                if probe.state != CircuitBreaker.CLOSED:
+                    logging.info(f"[CIRCUIT] {probe.error_class}/{model_name} 探測請求已取得回應 [類別: {error_class}]，斷路器關閉。")
+                probe.close()
+                return
+            if probe is not None:
+                probe.failed_probes += 1
+                if probe.failed_probes >= self.max_failed_probes:
+                    probe.locked = True
+                    probe.open(now)
+                    logging.critical(f"[CIRCUIT] {probe.error_class}/{model_name} 探測連續失敗 {probe.failed_probes} 次，判定為持續性故障；此模型其餘區塊將直接標記失敗。")
+                    return
+                probe.cooldown = min(self.max_cooldown, probe.cooldown * 2)
+                probe.open(now)
+                logging.warning(f"[CIRCUIT] {probe.error_class}/{model_name} 探測失敗 [類別: {error_class}]，斷路器重新開啟，冷卻 {probe.cooldown:.0f} 秒。")
+            if error_class not in self.classes:
+                return
+            b = self._breaker(error_class, model_name)
+            b.failures += 1
+            if b.state == CircuitBreaker.CLOSED and b.failures >= self.threshold:
+                b.open(now)
+                self.trips += 1
+                logging.warning(f"[CIRCUIT] {error_class}/{model_name} 連續失敗 {b.failures} 次，斷路器開啟；新請求暫停 {b.cooldown:.0f} 秒後探測。")
+
+    def log_summary(self):
+        if self.trips:
+            logging.info(f"[CIRCUIT] 本次任務斷路器共開啟 {self.trips} 次。")
+
+class ModelFailover:
+    """依序排列的模型清單：某模型的每日額度用盡後，其餘與重試中的區塊改用下一個模型。"""
+    def __init__(self, models):
+        self.models = list(dict.fromkeys(m for m in models if m))
+        self.exhausted = set()
+        self.lock = threading.Lock()
+
+    def current(self):
+        """目前應使用的模型；全部用盡時回傳 None。"""
+        with self.lock:
+            return next((m for m in self.models if m not in self.exhausted), None)
+
+    def mark_exhausted(self, model_name):
+        """標記模型的額度已用盡並回傳下一個可用模型 (沒有時回傳 None)。"""
+        with self.lock:
+            if model_name not in self.exhausted:
+                self.exhausted.add(model_name)
+                logging.warning(f"[FAILOVER] 模型 '{model_name}' 的每日額度已用盡，後續請求改用備援模型。")
+            return next((m for m in self.models if m not in self.exhausted), None)
+
+def make_model_failover(config):
+    """設定 --fallback_models 時建立 ModelFailover (主模型在前)，否則回傳 None。"""
+    fallback = [m.strip() for m in str(getattr(config, 'fallback_models', '') or '').split(',') if m.strip()]
+    if not fallback:
+        return None
+    failover = ModelFailover([config.model_name] + fallback)
+    logging.info(f"[FAILOVER] 每日額度用盡時依序改用: {', '.join(failover.models[1:])}")
+    return failover
+
+def make_circuit_board(config):
+    """依設定建立 CircuitBreakerBoard；empty_abort_threshold 為 0 時停用。"""
+    threshold = getattr(config, 'empty_abort_threshold', 5)
+    if not threshold or threshold <= 0:
+        return None
+    return CircuitBreakerBoard(threshold, cooldown=getattr(config, 'circuit_cooldown', 60),
+                               max_failed_probes=getattr(config, 'circuit_max_probes', 3))
+
+# NEW: 以內容雜湊為鍵的本機回應快取
+RESPONSE_CACHE_DIRNAME = "_response_cache"
+
+class ResponseCache:
+    """本機模型回應快取：鍵為 sha256(音訊內容) + sha256(提示詞) + 模型名稱。
+
+    每筆快取為一個 JSON 檔 (原始回應文字與 token 用量)，以檔案修改時間作為最後使用時間；
+    寫入後總容量超過 max_bytes 時，從最久未使用的項目開始刪除。bypass=True 時只寫不讀。
+    """
+    def __init__(self, directory, max_bytes=512 * 1024 * 1024, bypass=False):
+        self.directory = directory
+        self.max_bytes = max(0, int(max_bytes))
+        self.bypass = bypass
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.saved_tokens = [0, 0, 0]
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def _sha256_file(path):
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def key_for(self, audio_path, prompt_text, model_name):
+        prompt_hash = hashlib.sha256((prompt_text or "").encode('utf-8')).hexdigest()
+        return hashlib.sha256(f"{self._sha256_file(audio_path)}|{prompt_hash}|{model_name}".encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """回傳 {"text", "tokens", ...}；未命中、bypass 或檔案損毀時回傳 None。"""
+        if self.bypass:
+            return None
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path) # 更新最後使用時間 (LRU)
+        except (OSError, ValueError):
+            return None
+        return entry
+
+    def put(self, key, model_name, text, tokens):
+        entry = {"model": model_name, "text": text, "tokens": list(tokens), "created": datetime.now().isoformat(timespec='seconds')}
+        path = self._entry_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.warning(f"[RESPONSE CACHE] 寫入快取失敗: {e}")
+            return
+        self._evict()
+
+    def discard(self, key):
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def record_hit(self, tokens):
+        with self.lock:
+            self.hits += 1
+            self.saved_tokens = [a + (b or 0) for a, b in zip(self.saved_tokens, tokens)]
+
+    def _evict(self):
+        with self.lock:
+            try:
+                entries = []
+                for name in os.listdir(self.directory):
+                    if name.endswith('.json'):
+                        st = os.stat(os.path.join(self.directory, name))
+                        entries.append((st.st_mtime, st.st_size, name))
+            except OSError:
+                return
+            total = sum(size for _, size, _ in entries)
+            for _, size, name in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                    total -= size
+                except OSError:
+                    pass
+
+    def log_summary(self):
+        if self.hits:
+            total, inp, out = self.saved_tokens
+            logging.info(f"[RESPONSE CACHE] 本次任務有 {self.hits} 個區塊命中回應快取，省下 Token: {total} (輸入: {inp}, 輸出: {out})")
+
+def make_response_cache(config):
+    """依設定建立 ResponseCache；--response_cache_mb 為 0 時回傳 None。"""
+    max_mb = getattr(config, 'response_cache_mb', 512)
+    if not max_mb or max_mb <= 0:
+        return None
+    directory = getattr(config, 'response_cache_dir', None) or os.path.join(APP_PATH, RESPONSE_CACHE_DIRNAME)
+    try:
+        return ResponseCache(directory, max_bytes=int(max_mb * 1024 * 1024), bypass=getattr(config, 'response_cache_bypass', False))
+    except OSError as e:
+        logging.warning(f"[RESPONSE CACHE] 無法建立快取資料夾 '{directory}'，停用回應快取: {e}")
+        return None
+
+def make_prompt_cache(config, client, prompt_text, display_name, model_name=None):
+    """依設定建立任務用的 PromptCacheManager；停用或沒有提示詞時回傳 None。快取綁定模型，預設為 config.model_name。"""
+    if not prompt_text or not getattr(config, 'context_cache', True):
+        return None
+    return PromptCacheManager(client, model_name or config.model_name, prompt_text,
+                              ttl_seconds=getattr(config, 'cache_ttl', 3600), display_name=display_name)
+
+STREAM_PROGRESS_EVERY = 50
+
+def _usage_to_tokens(usage_metadata):
+    """將 usage_metadata 轉為 (total, input, output)；沒有資料時回傳 None。"""
+    if not usage_metadata:
+        return None
+    return (usage_metadata.total_token_count or 0,
+            usage_metadata.prompt_token_count or 0,
+            usage_metadata.candidates_token_count or 0)
+
+def _finish_reason(response):
+    """取出第一個候選回應的 finish_reason 名稱 (例如 'STOP'、'MAX_TOKENS')；沒有時回傳空字串。"""
+    candidates = getattr(response, "candidates", None) or []
+    reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+    return str(getattr(reason, "name", reason) or "")
+
+def _stream_generate_content(client, model_name, contents, parser, raw_path, correction_threshold,
+                             file_basename, stream_state, stop_event=None, generate_config=None, repair_budget=None):
+    """以 generate_content_stream 取得回應：邊接收邊寫入 .raw.txt，並即時餵給 IncrementalSRTParser。
+
+    嚴重修正一旦超過 correction_threshold 就關閉串流並拋出 SevereCorrectionError，不再為後續輸出付費。
+    傳入 repair_budget=(margin 秒, 上限秒數) 時，受損範圍仍在局部修補上限內就繼續接收。
+    stream_state["usage"] 保留最後收到的 usage_metadata，提前中止時仍可計入 token 用量；
+    stream_state["finish_reason"] 記錄最後回報的 finish_reason。
+    """
+    stream = client.models.generate_content_stream(model=model_name, contents=contents, config=generate_config)
+    text_parts = []
+    next_report = STREAM_PROGRESS_EVERY
+    try:
+        with open(raw_path, 'w', encoding='utf-8') as raw_file:
+            for piece in stream:
+                if stop_event is not None and stop_event.is_set():
+                    raise CallCancelledError("串流已停止接收。")
+                if getattr(piece, 'usage_metadata', None):
+                    stream_state["usage"] = piece.usage_metadata
+                finish_reason = _finish_reason(piece)
+                if finish_reason:
+                    stream_state["finish_reason"] = finish_reason
+                text = piece.text or ""
+                if not text:
+                    continue
+                raw_file.write(text)
+                raw_file.flush()
+                text_parts.append(text)
+                parser.feed(text)
+                if parser.degenerate_reason:
+                    raise DegenerateOutputError(f"模型輸出陷入重複迴圈: {parser.degenerate_reason}，已中止串流。")
+                if parser.cue_count >= next_report:
+                    logging.info(f"[STREAM | {file_basename}] 已即時解析 {parser.cue_count} 條字幕 (嚴重修正 {parser.severe_correction_count} 次)")
+                    next_report += STREAM_PROGRESS_EVERY
+                if parser.severe_correction_count > correction_threshold and not _within_repair_budget(parser.severe_ranges, repair_budget):
+                    raise SevereCorrectionError(
+                        f"SRT嚴重錯誤: 串流中已偵測到 {parser.severe_correction_count} 次嚴重修正，超過閾值 {correction_threshold}，提前中止接收。")
+    finally:
+        close = getattr(stream, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+    return "".join(text_parts)
+
+def _make_degenerate_detector(repeat_limit, stall_limit):
+    """兩個門檻皆為 0 時不建立偵測器。"""
+    if not repeat_limit and not stall_limit:
+        return None
+    return DegenerateOutputDetector(repeat_limit, stall_limit)
+
+# NEW: 回應的解析、校正與品質檢查 (transcribe_audio 與批次模式共用)
+def check_and_correct_response(response_text, audio_path, file_basename, raw_path, correction_threshold,
+                               overlap_tolerance_td, chunk_duration, truncation_threshold, ffmpeg_executable,
+                               is_last_chunk=False, degenerate_repeat=12, degenerate_stall=20, stream_parser=None,
+                               strict_truncation=False, raw_text=None, prior_severe=None):
+    """解析並校正模型回應，通過結構、重複迴圈與嚴重修正檢查時回傳校正後的 SRT 文字。
+
+    任一檢查未通過時拋出對應例外 (EmptyResponseError / DegenerateOutputError / SRTContentParseError /
+    SevereCorrectionError)，由呼叫端決定是否重試。串流模式傳入已接收完畢的 stream_parser。
+    strict_truncation=True 時結尾空白超過 truncation_threshold 也視為失敗 (SRTContentParseError)。
+    續寫接回的 response_text 已是整理過的 SRT：raw_text 為寫入 raw_path 的模型原始輸出，
+    prior_severe=(次數, 範圍) 為接回前的嚴重修正，併入本次的門檻檢查。
+    """
+    chunk_duration_td = timedelta(seconds=chunk_duration)
+    if not response_text:
+        raise EmptyResponseError("API 回應為空值 (empty response)。")
+
+    if stream_parser is not None:
+        srt_parser = stream_parser
+        corrected_srt, severe_correction_count, last_subtitle_end_td = stream_parser.finish()
+        logging.info(f"[STREAM | {file_basename}] 串流完成，共 {stream_parser.cue_count} 條字幕。")
+    else:
+        with open(raw_path, 'w', encoding='utf-8') as f: f.write(response_text if raw_text is None else raw_text)
+        srt_parser = IncrementalSRTParser(file_basename, overlap_tolerance_td, chunk_duration_td,
+                                          detector=_make_degenerate_detector(degenerate_repeat, degenerate_stall))
+        srt_parser.feed(response_text)
+        corrected_srt, severe_correction_count, last_subtitle_end_td = srt_parser.finish()
+    # 結尾沒有空行時 finish() 才加入最後一個字幕塊，重複迴圈必須在它之後檢查
+    if srt_parser.degenerate_reason:
+        raise DegenerateOutputError(f"模型輸出陷入重複迴圈: {srt_parser.degenerate_reason}，捨棄此回應。")
+
+    if not is_final_srt_valid(corrected_srt):
+        raise SRTContentParseError("校正後的 SRT 檔案結構驗證失敗 (序列號與時間戳數量不匹配)，觸發重試。")
+
+    if corrected_srt and truncation_threshold > 0:
+        effective_duration_td = timedelta(seconds=chunk_duration)
+        duration_source_msg = f"標準分段時長 {chunk_duration}s"
+        if is_last_chunk:
+            actual_duration_seconds = get_media_duration(audio_path, ffmpeg_executable)
+            if actual_duration_seconds is not None:
+                logging.info(f"正在為最後一個區塊 '{file_basename}' 獲取精確音訊時長: {actual_duration_seconds:.2f}s")
+                effective_duration_td = timedelta(seconds=actual_duration_seconds)
+                duration_source_msg = f"音訊實際長度 {actual_duration_seconds:.2f}s"
+            else:
+                logging.warning(f"無法獲取最後一個區塊 '{file_basename}' 的精確時長，將退回使用標準分段時長。")
+
+        end_gap_seconds = (effective_duration_td - last_subtitle_end_td).total_seconds()
+
+        if end_gap_seconds > truncation_threshold:
+            log_msg = (
+                f"SRT截斷警告: 區塊 '{file_basename}' 的結尾偵測到超過 {truncation_threshold} 秒的空白 "
+                f"({end_gap_seconds:.1f}s)。(基於 {duration_source_msg})。"
+                " 回應可能不完整，請手動檢查。"
+            )
+            if strict_truncation:
+                raise SRTContentParseError(log_msg)
+            logging.warning(log_msg)
+
+    severe_ranges = srt_parser.severe_ranges
+    if prior_severe:
+        severe_correction_count += prior_severe[0]
+        severe_ranges = list(prior_severe[1]) + list(severe_ranges)
+    if severe_correction_count > correction_threshold:
+        raise SevereCorrectionError(f"SRT嚴重錯誤: 偵測到 {severe_correction_count} 次嚴重修正，超過閾值 {correction_threshold}。",
+                                    corrected_srt=corrected_srt, severe_ranges=severe_ranges,
+                                    severe_count=severe_correction_count)
+    return corrected_srt
+
+REPAIR_MARGIN_SECONDS = 5.0
+REPAIR_MIN_SECONDS = 20.0 # 過短的音訊片段模型容易漏字，子段至少切這麼長
+REPAIR_MAX_RETRIES = 1 # 每個受損範圍的重試上限；失敗即退回整段重試，避免請求數隨範圍數 × max_retries 倍增
+
+def merge_repair_ranges(severe_ranges, margin_seconds, limit_seconds, min_seconds=REPAIR_MIN_SECONDS):
+    """將嚴重修正的時間範圍前後加上 margin、補足最短長度並合併重疊者，回傳 [(開始秒, 結束秒), ...]。"""
+    expanded = []
+    for start_td, end_td in severe_ranges:
+        start = max(0.0, start_td.total_seconds() - margin_seconds)
+        end = min(float(limit_seconds), max(end_td, start_td).total_seconds() + margin_seconds)
+        if end - start < min_seconds:
+            pad = (min_seconds - (end - start)) / 2
+            start, end = max(0.0, start - pad), min(float(limit_seconds), end + pad)
+        if end > start:
+            expanded.append((start, end))
+    merged = []
+    for start, end in sorted(expanded):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _within_repair_budget(severe_ranges, repair_budget):
+    """repair_budget=(margin 秒, 上限秒數)；合併後的受損範圍總長不超過上限時回傳 True。"""
+    if not repair_budget:
+        return False
+    margin_seconds, budget_seconds = repair_budget
+    ranges = merge_repair_ranges(severe_ranges, margin_seconds, float("inf"))
+    return sum(end - start for start, end in ranges) <= budget_seconds
+
+def splice_srt_ranges(srt_text, replacements):
+    """以子段轉錄結果替換區塊 SRT 中對應時間範圍的字幕。
+
+    replacements: [(開始秒, 結束秒, 子段 SRT 文字 (時間軸從 0 起算)), ...]
+    原本開始時間落在範圍內的字幕全部移除；子段字幕加上開始秒數位移，只保留開始時間落在範圍內者。
+    合併後依時間排序、修掉相鄰字幕的重疊並重新編號。
+    """
+    spans = [(timedelta_to_ms(timedelta(seconds=start)), timedelta_to_ms(timedelta(seconds=end)), sub_srt)
+             for start, end, sub_srt in replacements]
+    cues = CueTable.from_srt(srt_text).filter(
+        lambda start_ms, _: not any(range_start <= start_ms < range_end for range_start, range_end, _ in spans))
+    for range_start, range_end, sub_srt in spans:
+        sub_cues = CueTable.from_srt(sub_srt).filter(lambda start_ms, _: start_ms + range_start < range_end)
+        cues.extend(sub_cues, offset_ms=range_start)
+    cues.sort()
+    cues.clip_overlaps()
+    return cues.to_srt()
+
+def cut_audio_range(ffmpeg_executable, input_path, start_seconds, duration_seconds, output_path):
+    """以 FFmpeg 切出指定範圍的音訊，成功回傳 True。"""
+    command = [ffmpeg_executable, '-i', input_path, '-ss', str(start_seconds), '-t', str(duration_seconds),
+               '-vn', '-acodec', 'libmp3lame', '-b:a', '192k', '-y', output_path]
+    try:
+        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
+        return os.path.exists(output_path) and os.path.getsize(output_path) > 0
+    except Exception as e:
+        logging.error(f"使用 FFmpeg 切割音訊範圍失敗: {e.stderr.decode(errors='ignore') if hasattr(e, 'stderr') and e.stderr else e}")
+        return False
+
+def _remove_sub_clip_files(sub_path):
+    """刪除局部重新轉錄 / 續寫用的子段音訊及其 SRT、raw 檔。"""
+    sub_base = os.path.splitext(sub_path)[0]
+    for leftover in (sub_path, sub_base + ".srt", sub_base + ".raw.txt"):
+        if os.path.exists(leftover):
+            try:
+                os.remove(leftover)
+            except OSError:
+                pass
+    # 子段轉錄時寫入的模型記錄不屬於任何正式區塊
+    update_chunk_manifest(CHUNK_MODELS_FILENAME, sub_base + ".srt")
+
+# 各區塊各自不同、不會轉給子段請求的 transcribe_audio 參數；其餘設定一律由 options 整組轉發
+_CHUNK_SPECIFIC_ARGS = frozenset((
+    "client", "audio_path", "prompt_text", "model_name", "correction_threshold", "overlap_tolerance",
+    "chunk_duration", "truncation_threshold", "ffmpeg_executable", "is_last_chunk", "claim_result", "attempt_label",
+))
+
+def _sub_request_kwargs(options, **overrides):
+    """將 transcribe_audio 的請求設定 (SimpleNamespace) 展開為子段請求的關鍵字參數，只覆寫 overrides 指定的項目。"""
+    kwargs = dict(vars(options))
+    kwargs.update(overrides)
+    return kwargs
+
+def repair_severe_ranges(client, audio_path, severe_error, prompt_text, model_name, correction_threshold,
+                         overlap_tolerance, chunk_duration, ffmpeg_executable, file_basename, options,
+                         attempt_label=""):
+    """只重新轉錄嚴重修正所在的時間範圍，並替換回校正後的區塊 SRT。
+
+    回傳 (修補後的 SRT 文字或 None, (total, input, output))；None 表示應退回整段重試
+    (範圍過大、FFmpeg 切割失敗或任一子段轉錄失敗)。options 為原請求的設定；子段關閉局部修補、最佳嘗試保留與
+    對半切割，不使用回應快取，重試次數上限為 REPAIR_MAX_RETRIES (失敗時由整段重試接手)。
+    """
+    margin_seconds, max_fraction = options.repair_margin, options.repair_max_fraction
+    tokens = (0, 0, 0)
+    ranges = merge_repair_ranges(severe_error.severe_ranges, margin_seconds, chunk_duration)
+    span = sum(end - start for start, end in ranges)
+    if not severe_error.corrected_srt or not ranges or span > chunk_duration * max_fraction:
+        logging.info(f"[REPAIR | {file_basename}] 受損範圍合計 {span:.0f}s，超過可局部修補的上限 "
+                     f"({chunk_duration * max_fraction:.0f}s)，改為整段重試。")
+        return None, tokens
+    logging.info(f"[REPAIR | {file_basename}] 嚴重修正集中在 {len(ranges)} 個範圍 (合計 {span:.0f}s / {chunk_duration}s)，"
+                 f"僅重新轉錄這些範圍: " + ", ".join(f"{format_timedelta_v7(timedelta(seconds=s))}~{format_timedelta_v7(timedelta(seconds=e))}" for s, e in ranges))
+    base_path = os.path.splitext(audio_path)[0] + (f".{attempt_label}" if attempt_label else "")
+    replacements = []
+    for idx, (start, end) in enumerate(ranges, start=1):
+        sub_path = f"{base_path}_fix{idx:02d}_{int(start * 1000)}-{int(end * 1000)}.mp3"
+        sub_srt_path = None
+        try:
+            if not cut_audio_range(ffmpeg_executable, audio_path, start, end - start, sub_path):
+                return None, tokens
+            sub_srt_path, sub_tokens = transcribe_audio(
+                client, sub_path, prompt_text, model_name, correction_threshold, overlap_tolerance, end - start,
+                0, ffmpeg_executable, **_sub_request_kwargs(options, repair_ranges=False, keep_best_attempt=False, response_cache=None,
+                                                            max_retries=min(options.max_retries, REPAIR_MAX_RETRIES),
+                                                            bisect_min_seconds=0),
+            )
+            tokens = tuple(a + (b or 0) for a, b in zip(tokens, sub_tokens))
+            if not sub_srt_path:
+                logging.warning(f"[REPAIR | {file_basename}] 範圍 {idx} 重新轉錄失敗，改為整段重試。")
+                return None, tokens
+            with open(sub_srt_path, 'r', encoding='utf-8') as f:
+                replacements.append((start, end, f.read()))
+        finally:
+            _remove_sub_clip_files(sub_path)
+    repaired_srt = splice_srt_ranges(severe_error.corrected_srt, replacements)
+    if not is_final_srt_valid(repaired_srt):
+        logging.warning(f"[REPAIR | {file_basename}] 替換後的 SRT 結構驗證失敗，改為整段重試。")
+        return None, tokens
+    logging.info(f"[REPAIR | {file_basename}] 已替換 {len(ranges)} 個範圍 (Input: {tokens[1]}, Output: {tokens[2]})。")
+    return repaired_srt, tokens
+
+CONTINUATION_MIN_SECONDS = 2.0
+
+def continue_truncated_response(client, audio_path, response_text, prompt_text, model_name, correction_threshold,
+                                overlap_tolerance, chunk_duration, ffmpeg_executable, file_basename, options,
+                                is_last_chunk=False, attempt_label="", repair_budget=None):
+    """回應因 MAX_TOKENS 被截斷時，只為剩餘的音訊送出續寫請求並接回。
+
+    捨棄最後一個可能不完整的字幕塊，以其餘字幕最後的結束時間為起點切出剩餘音訊轉錄，
+    回傳 (接回後的 SRT 文字或 None, (total, input, output), (嚴重修正次數, 範圍))；
+    None 表示應沿用原本被截斷的回應。接回的 SRT 已整理過，呼叫端須將第三項併入最終的門檻檢查。
+    保留的前段陷入重複迴圈，或嚴重修正超過 correction_threshold 且超出 repair_budget 時，
+    不送出續寫請求，直接拋出 DegenerateOutputError / SevereCorrectionError 交由一般重試處理。
+    options 為原請求的設定，續寫請求只關閉最佳嘗試保留。
+    """
+    tokens = (0, 0, 0)
+    cut_at = response_text.rstrip().rfind("\n\n")
+    if cut_at <= 0:
+        logging.warning(f"[CONTINUE | {file_basename}] 截斷的回應中沒有完整的字幕塊，無法續寫。")
+        return None, tokens, None
+    overlap_tolerance_td = timedelta(seconds=overlap_tolerance)
+    prefix_parser = IncrementalSRTParser(file_basename, overlap_tolerance_td, timedelta(seconds=chunk_duration),
+                                         detector=_make_degenerate_detector(options.degenerate_repeat, options.degenerate_stall))
+    prefix_parser.feed(response_text[:cut_at])
+    try:
+        prefix_srt, severe_count, last_end_td = prefix_parser.finish()
+    except SRTContentParseError:
+        return None, tokens, None
+    # 被截斷的回應常是重複迴圈用盡了 token，先對保留的前段做品質檢查，不為壞掉的回應付續寫的費用
+    if prefix_parser.degenerate_reason:
+        raise DegenerateOutputError(f"模型輸出陷入重複迴圈: {prefix_parser.degenerate_reason}，不續寫此回應。")
+    prefix_severe = (severe_count, list(prefix_parser.severe_ranges))
+    if severe_count > correction_threshold and not _within_repair_budget(prefix_parser.severe_ranges, repair_budget):
+        raise SevereCorrectionError(f"SRT嚴重錯誤: 截斷前已偵測到 {severe_count} 次嚴重修正，超過閾值 {correction_threshold}，不續寫此回應。",
+                                    corrected_srt=prefix_srt, severe_ranges=prefix_parser.severe_ranges,
+                                    severe_count=severe_count)
+    audio_seconds = chunk_duration
+    if is_last_chunk:
+        audio_seconds = min(chunk_duration, get_media_duration(audio_path, ffmpeg_executable) or chunk_duration)
+    start = last_end_td.total_seconds()
+    remaining = audio_seconds - start
+    if remaining < CONTINUATION_MIN_SECONDS:
+        logging.info(f"[CONTINUE | {file_basename}] 截斷點已接近音訊結尾，不需續寫。")
+        return prefix_srt, tokens, prefix_severe
+    logging.info(f"[CONTINUE | {file_basename}] 回應因輸出 token 上限被截斷，自 {format_timedelta_v7(last_end_td)} 起續寫剩餘的 {remaining:.0f}s。")
+    base_path = os.path.splitext(audio_path)[0] + (f".{attempt_label}" if attempt_label else "")
+    sub_path = f"{base_path}_cont_{int(start * 1000)}.mp3"
+    try:
+        if not cut_audio_range(ffmpeg_executable, audio_path, start, remaining, sub_path):
+            return None, tokens, None
+        sub_srt_path, tokens = transcribe_audio(
+            client, sub_path, prompt_text, model_name, correction_threshold, overlap_tolerance, remaining,
+            0, ffmpeg_executable, **_sub_request_kwargs(options, keep_best_attempt=False),
+        )
+        tokens = tuple(t or 0 for t in tokens)
+        if not sub_srt_path:
+            logging.warning(f"[CONTINUE | {file_basename}] 續寫請求失敗，沿用被截斷的回應。")
+            return None, tokens, None
+        with open(sub_srt_path, 'r', encoding='utf-8') as f:
+            continuation_srt = f.read()
+    finally:
+        _remove_sub_clip_files(sub_path)
+    stitched_srt = splice_srt_ranges(prefix_srt, [(start, audio_seconds, continuation_srt)])
+    logging.info(f"[CONTINUE | {file_basename}] 已接回續寫結果 (Input: {tokens[1]}, Output: {tokens[2]})。")
+    return stitched_srt, tokens, prefix_severe
+
+BISECT_ERROR_CLASSES = ("severe", "degenerate", "parse", "empty", "timeout", "deadline")
+
+def bisect_transcribe(client, audio_path, prompt_text, model_name, correction_threshold, overlap_tolerance,
+                      audio_seconds, truncation_threshold, ffmpeg_executable, file_basename, options,
+                      is_last_chunk=False, attempt_label=""):
+    """將持續失敗的區塊對半切開並同時轉錄兩半，成功時接回為一份 SRT。
+
+    子段沿用原請求的設定 (options) 交給 transcribe_audio 處理，重試次數改為 bisect_retries，
+    仍失敗時會依 bisect_min_seconds 再遞迴對半。
+    回傳 (接回後的 SRT 文字或 None, (total, input, output))；任一半失敗即回傳 None。
+    """
+    half = audio_seconds / 2
+    base_path = os.path.splitext(audio_path)[0] + (f".{attempt_label}" if attempt_label else "")
+    halves = [
+        (0.0, half, f"{base_path}_half1.mp3", False),
+        (half, audio_seconds, f"{base_path}_half2.mp3", is_last_chunk),
+    ]
+    logging.warning(f"[BISECT | {file_basename}] 對半切割為 2 個 {half:.0f}s 的子段並同時轉錄。")
+
+    def _run_half(spec):
+        start, end, sub_path, sub_is_last = spec
+        try:
+            if not cut_audio_range(ffmpeg_executable, audio_path, start, end - start, sub_path):
+                return None, (0, 0, 0)
+            sub_srt_path, sub_tokens = transcribe_audio(
+                client, sub_path, prompt_text, model_name, correction_threshold, overlap_tolerance, end - start,
+                truncation_threshold, ffmpeg_executable, is_last_chunk=sub_is_last,
+                **_sub_request_kwargs(options, keep_best_attempt=False, max_retries=options.bisect_retries),
+            )
+            if not sub_srt_path:
+                return None, sub_tokens
+            with open(sub_srt_path, 'r', encoding='utf-8') as f:
+                return f.read(), sub_tokens
+        finally:
+            _remove_sub_clip_files(sub_path)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(_run_half, halves))
+    tokens = tuple(sum(t[k] or 0 for _, t in results) for k in range(3))
+    if any(text is None for text, _ in results):
+        logging.error(f"[BISECT | {file_basename}] 對半切割後仍有子段失敗。")
+        return None, tokens
+    stitched_srt = splice_srt_ranges("", [(start, end, text) for (start, end, _, _), (text, _) in zip(halves, results)])
+    return stitched_srt, tokens
+
+DEGRADED_MANIFEST_FILENAME = "_degraded_chunks.json"
+CHUNK_MODELS_FILENAME = "_chunk_models.json"
+_CHUNK_MANIFEST_LOCK = threading.Lock()
+
+def load_chunk_manifest(directory, filename):
+    """讀取資料夾中以 SRT 檔名為鍵的 JSON 記錄 (例如 _degraded_chunks.json)；不存在或損毀時回傳空字典。"""
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError) as e:
+        logging.warning(f"無法讀取區塊記錄 {path}: {e}")
+        return {}
+
+def update_chunk_manifest(filename, srt_path, entry=None):
+    """在 SRT 所在資料夾的 filename 中記錄 (entry) 或清除 (entry=None) 此區塊的項目；清空時刪除檔案。"""
+    directory = os.path.dirname(srt_path) or "."
+    path = os.path.join(directory, filename)
+    name = os.path.basename(srt_path)
+    with _CHUNK_MANIFEST_LOCK:
+        if entry is None and not os.path.exists(path):
+            return
+        data = load_chunk_manifest(directory, filename)
+        if entry is None:
+            if data.pop(name, None) is None:
+                return
+        else:
+            data[name] = entry
+        try:
+            if data:
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False, indent=1)
+            else:
+                os.remove(path)
+        except OSError as e:
+            logging.warning(f"無法寫入區塊記錄 {path}: {e}")
+
+def load_degraded_manifest(directory):
+    """讀取 _degraded_chunks.json，回傳 {SRT 檔名: 記錄}。"""
+    return load_chunk_manifest(directory, DEGRADED_MANIFEST_FILENAME)
+
+def update_degraded_manifest(srt_path, entry=None):
+    """記錄 (entry) 或清除 (entry=None) 此區塊的降級標記。"""
+    update_chunk_manifest(DEGRADED_MANIFEST_FILENAME, srt_path, entry)
+
+def log_fallback_model_chunks(directory, srt_names, primary_model):
+    """任務結束時列出由備援模型 (非 primary_model) 完成的區塊，回傳其檔名清單。"""
+    manifest = load_chunk_manifest(directory, CHUNK_MODELS_FILENAME)
+    fallback = [name for name in srt_names if name in manifest and manifest[name].get("model") != primary_model]
+    if fallback:
+        logging.warning(f"[FAILOVER] 以下 {len(fallback)} 個區塊由備援模型完成 (記錄於 {CHUNK_MODELS_FILENAME})："
+                        + ", ".join(f"{name} ({manifest[name].get('model')})" for name in fallback))
+    return fallback
+
+def log_degraded_chunks(directory, srt_names):
+    """任務結束時列出本次區塊中被標記為降級 (採用最佳嘗試) 的 SRT，回傳其檔名清單。"""
+    manifest = load_degraded_manifest(directory)
+    degraded = [name for name in srt_names if name in manifest]
+    if degraded:
+        logging.warning(f"[DEGRADED] 以下 {len(degraded)} 個區塊的所有嘗試皆未通過品質門檻，已改用最佳嘗試的結果，建議人工檢查 (或刪除該 SRT 後以 --resume 重跑)："
+                        + ", ".join(f"{name} (嚴重修正 {manifest[name].get('severe_corrections')} 次)" for name in degraded))
+    return degraded
+
+BATCH_TERMINAL_STATES = ("JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED")
+
+def _batch_state(batch_job):
+    state = getattr(batch_job, "state", None)
+    return str(getattr(state, "name", state) or "")
+
+def _cancel_batch_job(client, batch_name):
+    try:
+        client.batches.cancel(name=batch_name)
+        logging.info(f"[BATCH] 已要求取消批次工作 {batch_name}。")
+    except Exception as e:
+        logging.warning(f"[BATCH] 取消批次工作 {batch_name} 失敗: {e}")
+
+def transcribe_chunks_batch(client, items, prompt_text, model_name, correction_threshold, overlap_tolerance,
+                            truncation_threshold, ffmpeg_executable, poll_interval=60,
+                            upload_timeout=0, degenerate_repeat=12, degenerate_stall=20, display_name="",
+                            batch_timeout=0, cancel_event=None):
+    """以 Batch API 一次送出多個區塊的轉錄請求，輪詢完成後沿用 check_and_correct_response 寫入 SRT。
+
+    items: [(key, audio_path, chunk_duration, is_last_chunk), ...]
+    回傳 {key: (srt_path 或 None, (total, input, output))}；未成功的區塊由呼叫端改走一般請求。
+    批次請求不佔即時 RPM，因此上傳不經過限速器。
+    batch_timeout: 等待批次完成的總秒數上限 (0 為不限)；逾時或 cancel_event 被設定時取消批次工作並放棄等待。
+    """
+    results = {key: (None, (0, 0, 0)) for key, *_ in items}
+    overlap_tolerance_td = timedelta(seconds=overlap_tolerance)
+    uploaded = [] # (item, uploaded_file)
+    try:
+        for item in items:
+            key, audio_path, _, _ = item
+            upload_copy_path = None
+            try:
+                upload_copy_path = _make_api_upload_copy(audio_path)
+                uploaded_file = call_with_deadline(
+                    lambda: client.files.upload(file=upload_copy_path), upload_timeout, "files.upload",
+                    on_late_result=lambda f: client.files.delete(name=f.name),
+                )
+                uploaded.append((item, uploaded_file))
+            except Exception as e:
+                logging.warning(f"[BATCH] 上傳 '{os.path.basename(audio_path)}' 失敗，此區塊將改走一般請求: {e}")
+            finally:
+                if upload_copy_path and os.path.exists(upload_copy_path):
+                    try:
+                        os.remove(upload_copy_path)
+                    except OSError as cp_e:
+                        logging.warning(f"刪除上傳用安全副本失敗: {upload_copy_path} ({cp_e})")
+        if not uploaded:
+            return results
+
+        requests = [{
+            "contents": [{"role": "user", "parts": [
+                {"text": prompt_text},
+                {"file_data": {"file_uri": uploaded_file.uri, "mime_type": uploaded_file.mime_type}},
+            ]}],
+        } for _, uploaded_file in uploaded]
+        try:
+            batch_job = client.batches.create(model=model_name, src=requests, config={"display_name": display_name[:100]})
+        except Exception as e:
+            logging.error(f"[BATCH] 建立批次工作失敗，所有區塊將改走一般請求: {e}")
+            return results
+        logging.info(f"[BATCH] 已送出批次工作 {batch_job.name}：{len(requests)} 個區塊，每 {poll_interval} 秒輪詢一次。")
+
+        state = _batch_state(batch_job)
+        last_logged_state = None
+        deadline = time.monotonic() + batch_timeout if batch_timeout and batch_timeout > 0 else None
+        while state not in BATCH_TERMINAL_STATES:
+            if state != last_logged_state:
+                logging.info(f"[BATCH] {batch_job.name} 狀態: {state}")
+                last_logged_state = state
+            wait_seconds = poll_interval if deadline is None else max(0.0, min(poll_interval, deadline - time.monotonic()))
+            if cancel_event is not None and cancel_event.wait(wait_seconds):
+                logging.warning(f"[BATCH] 任務已取消，停止等待批次工作 {batch_job.name}。")
+                _cancel_batch_job(client, batch_job.name)
+                return results
+            if cancel_event is None:
+                time.sleep(wait_seconds)
+            if deadline is not None and time.monotonic() >= deadline:
+                logging.error(f"[BATCH] 批次工作 {batch_job.name} 超過 {batch_timeout} 秒仍未完成 (狀態: {state})，將取消並改走一般請求。")
+                _cancel_batch_job(client, batch_job.name)
+                return results
+            try:
+                batch_job = client.batches.get(name=batch_job.name)
+            except Exception as e:
+                logging.warning(f"[BATCH] 查詢批次狀態失敗，稍後重試: {e}")
+                continue
+            state = _batch_state(batch_job)
+        logging.info(f"[BATCH] {batch_job.name} 結束，狀態: {state}")
+        if state != "JOB_STATE_SUCCEEDED":
+            logging.error(f"[BATCH] 批次工作未成功 ({state})，所有區塊將改走一般請求。")
+            return results
+
+        responses = list(getattr(getattr(batch_job, "dest", None), "inlined_responses", None) or [])
+        for (item, _), inlined in itertools.zip_longest(uploaded, responses[:len(uploaded)]):
+            key, audio_path, chunk_duration, is_last_chunk = item
+            file_basename = os.path.basename(audio_path)
+            response = getattr(inlined, "response", None)
+            if response is None:
+                error = getattr(inlined, "error", None)
+                logging.warning(f"[BATCH] 區塊 '{file_basename}' 沒有回應，將改走一般請求: {getattr(error, 'message', error)}")
+                continue
+            tokens = _usage_to_tokens(getattr(response, "usage_metadata", None)) or (0, 0, 0)
+            if _finish_reason(response) == "MAX_TOKENS":
+                logging.warning(f"[BATCH] 區塊 '{file_basename}' 的回應因輸出 token 上限被截斷，將改走一般請求 (可續寫)。")
+                results[key] = (None, tokens)
+                continue
+            srt_path = os.path.splitext(audio_path)[0] + ".srt"
+            try:
+                corrected_srt = check_and_correct_response(
+                    response.text, audio_path, file_basename, os.path.splitext(srt_path)[0] + ".raw.txt",
+                    correction_threshold, overlap_tolerance_td, chunk_duration, truncation_threshold, ffmpeg_executable,
+                    is_last_chunk=is_last_chunk, degenerate_repeat=degenerate_repeat, degenerate_stall=degenerate_stall,
+                )
+            except Exception as e:
+                logging.warning(f"[BATCH] 區塊 '{file_basename}' 的回應未通過檢查 [類別: {classify_retry_error(e)}]，將改走一般請求: {e}")
+                results[key] = (None, tokens)
+                continue
+            with open(srt_path, 'w', encoding='utf-8') as f: f.write(corrected_srt)
+            logging.info(f"[BATCH] 成功！已將修正後的字幕儲存至: {os.path.basename(srt_path)} (Input: {tokens[1]}, Output: {tokens[2]})")
+            results[key] = (srt_path, tokens)
+        return results
+    finally:
+        for _, uploaded_file in uploaded:
+            try:
+                client.files.delete(name=uploaded_file.name)
+            except Exception as del_e:
+                logging.warning(f"刪除遠端檔案 '{uploaded_file.name}' 失敗: {del_e}")
+
 # CHANGED: 整個函式已更新
 def transcribe_audio(client, audio_path, prompt_text, model_name,
                      correction_threshold, overlap_tolerance, chunk_duration,
                      truncation_threshold, ffmpeg_executable, is_last_chunk=False,
-                     max_retries=3, rate_limiter=None, retry_base=65, retry_cap=250):
+                     max_retries=3, rate_limiter=None, retry_base=65, retry_cap=250,
+                     upload_timeout=0, generate_timeout=0,
+                     cancel_event=None, claim_result=None, attempt_label="", stream=False,
+                     degenerate_repeat=12, degenerate_stall=20, prompt_cache=None, response_cache=None,
+                     circuit_board=None, repair_ranges=True, repair_margin=REPAIR_MARGIN_SECONDS, repair_max_fraction=0.4,
+                     keep_best_attempt=True, continue_truncated=True, bisect_min_seconds=0, bisect_retries=2,
+                     strict_truncation=False, model_failover=None):
+    # 子段請求 (局部修補、續寫、對半切割) 沿用本次請求的全部設定，只覆寫各自需要的項目
+    request_options = SimpleNamespace(**{k: v for k, v in locals().items() if k not in _CHUNK_SPECIFIC_ARGS})
     srt_path = os.path.splitext(audio_path)[0] + ".srt"
     file_basename = os.path.basename(audio_path)
+    # NEW: 對沖請求使用獨立的 raw 檔與日誌標記；最終 SRT 只由 claim_result() 勝出者寫入
+    raw_suffix = f".{attempt_label}.raw.txt" if attempt_label else ".raw.txt"
+    raw_path = os.path.splitext(srt_path)[0] + raw_suffix
+    if attempt_label:
+        file_basename = f"{file_basename}#{attempt_label}"
     
     # NEW: 初始化三種 token 計數器
     tokens_total, tokens_input, tokens_output = 0, 0, 0
@@ -451,92 +2118,281 @@ def transcribe_audio(client, audio_path, prompt_text, model_name,
     upload_copy_path = None
     
     overlap_tolerance_td = timedelta(seconds=overlap_tolerance)
-
-    for attempt in range(max_retries):
+    repair_budget = (repair_margin, chunk_duration * repair_max_fraction) if repair_ranges else None
+    best_attempt = None # ((嚴重修正次數, -字幕數), 校正後 SRT)：分數越小越好
+
+    def _record_model():
+        """啟用備援模型時記錄此區塊實際使用的模型。"""
+        if model_failover is not None:
+            update_chunk_manifest(CHUNK_MODELS_FILENAME, srt_path, {"model": model_name})
+
+    def _use_best_attempt(attempts_made):
+        """重試用盡時改用嚴重修正最少的一次結果並標記為降級；沒有可用結果時回傳 None。"""
+        if best_attempt is None or (claim_result is not None and not claim_result()):
+            return None
+        (severe_count, neg_cues), best_srt = best_attempt
+        with open(srt_path, 'w', encoding='utf-8') as f: f.write(best_srt)
+        update_degraded_manifest(srt_path, {
+            "severe_corrections": severe_count, "cues": -neg_cues, "threshold": correction_threshold,
+            "attempts": attempts_made, "model": model_name, "recorded_at": datetime.now().isoformat(timespec="seconds"),
+        })
+        _record_model()
+        logging.warning(f"[DEGRADED] '{file_basename}' 的 {attempts_made} 次嘗試皆未通過品質門檻，改用嚴重修正最少的一次結果 "
+                        f"({severe_count} 次 > 閾值 {correction_threshold}，{-neg_cues} 條字幕) 寫入 {os.path.basename(srt_path)}，"
+                        f"已記錄於 {DEGRADED_MANIFEST_FILENAME}，建議人工檢查。")
+        return srt_path
+
+    def _bisect_fallback():
+        """重試用盡時對半切割重新轉錄；回傳 (srt_path 或 None, tokens)。"""
+        audio_seconds = chunk_duration
+        if is_last_chunk:
+            audio_seconds = min(chunk_duration, get_media_duration(audio_path, ffmpeg_executable) or chunk_duration)
+        if audio_seconds / 2 < bisect_min_seconds:
+            return None, (0, 0, 0)
+        bisected_srt, bisect_tokens = bisect_transcribe(
+            client, audio_path, prompt_text, model_name, correction_threshold, overlap_tolerance, audio_seconds,
+            truncation_threshold, ffmpeg_executable, file_basename, request_options,
+            is_last_chunk=is_last_chunk, attempt_label=attempt_label,
+        )
+        if bisected_srt is None or not is_final_srt_valid(bisected_srt):
+            return None, bisect_tokens
+        if claim_result is not None and not claim_result():
+            return None, bisect_tokens
+        with open(srt_path, 'w', encoding='utf-8') as f: f.write(bisected_srt)
+        update_degraded_manifest(srt_path)
+        _record_model()
+        logging.info(f"[BISECT | {file_basename}] 成功！已將對半切割後接回的字幕儲存至: {os.path.basename(srt_path)}")
+        return srt_path, bisect_tokens
+
+    if model_failover is not None:
+        model_name = model_failover.current() or model_name
+
+    # NEW: 上傳前先查詢本機回應快取；命中且通過目前的檢查門檻即不再呼叫 API
+    cache_key = None
+    cache_model = model_name
+    if response_cache is not None:
+        try:
+            cache_key = response_cache.key_for(audio_path, prompt_text, model_name)
+        except OSError as e:
+            logging.warning(f"[RESPONSE CACHE] 無法計算 '{file_basename}' 的快取鍵，略過快取: {e}")
+        cached = response_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            try:
+                corrected_srt = check_and_correct_response(
+                    cached.get("text"), audio_path, file_basename, raw_path, correction_threshold,
+                    overlap_tolerance_td, chunk_duration, truncation_threshold, ffmpeg_executable,
+                    is_last_chunk=is_last_chunk, degenerate_repeat=degenerate_repeat, degenerate_stall=degenerate_stall,
+                    strict_truncation=strict_truncation,
+                )
+            except Exception as e:
+                logging.warning(f"[RESPONSE CACHE] '{file_basename}' 的快取回應未通過目前的檢查，已捨棄並改為呼叫 API: {e}")
+                response_cache.discard(cache_key)
+            else:
+                if claim_result is not None and not claim_result():
+                    return None, (0, 0, 0)
+                with open(srt_path, 'w', encoding='utf-8') as f: f.write(corrected_srt)
+                update_degraded_manifest(srt_path)
+                _record_model()
+                response_cache.record_hit(cached.get("tokens") or (0, 0, 0))
+                logging.info(f"[RESPONSE CACHE] 命中快取，未呼叫 API。已將字幕儲存至: {os.path.basename(srt_path)}")
+                return srt_path, (0, 0, 0)
+
+    attempt = 0
+    while attempt < max_retries:
+        if cancel_event is not None and cancel_event.is_set():
+            logging.info(f"[{file_basename}] 已被取消，停止後續嘗試。")
+            return None, (tokens_total, tokens_input, tokens_output)
+        if model_failover is not None:
+            # NEW: 其他區塊可能已將目前的模型標記為額度用盡
+            current_model = model_failover.current()
+            if current_model is None:
+                logging.error(f"[FAILOVER] 所有模型的每日額度皆已用盡，'{file_basename}' 未送出。")
+                return (_use_best_attempt(attempt) if keep_best_attempt else None), (tokens_total, tokens_input, tokens_output)
+            if current_model != model_name:
+                logging.info(f"[FAILOVER] '{file_basename}' 改用模型 '{current_model}'。")
+                model_name = current_model
+        cache_name = None
+        probe = None
         try:
+            if circuit_board is not None:
+                probe = circuit_board.acquire(model_name, file_basename, cancel_event)
             logging.info(f"[{file_basename} | 嘗試 {attempt+1}/{max_retries}] 正在建立上傳副本...")
             upload_copy_path = _make_api_upload_copy(audio_path, attempt=attempt+1)
             logging.info(f"[{file_basename}] 上傳副本： {os.path.basename(upload_copy_path)}")
             if rate_limiter: rate_limiter.wait()
-            uploaded_file = client.files.upload(file=upload_copy_path)
+            uploaded_file = call_with_deadline(
+                lambda: client.files.upload(file=upload_copy_path), upload_timeout, "files.upload",
+                on_late_result=lambda f: client.files.delete(name=f.name), cancel_event=cancel_event,
+            )
 
             logging.info(f"檔案已上傳。正在向模型 '{model_name}' 發送轉錄請求...")
             if rate_limiter: rate_limiter.wait()
-            response = client.models.generate_content(model=model_name, contents=[prompt_text, uploaded_file])
-
-            # CHANGED: 獲取並記錄詳細的 token 用量
-            if hasattr(response, 'usage_metadata') and response.usage_metadata:
-                tokens_input = response.usage_metadata.prompt_token_count
-                tokens_output = response.usage_metadata.candidates_token_count
-                tokens_total = response.usage_metadata.total_token_count
-                # NEW: 在日誌中立即顯示本次區塊的 Token 用量
-                logging.info(f"[Token Usage | {file_basename}] Input: {tokens_input}, Output: {tokens_output}, Total: {tokens_total}")
-
-            if not response.text:
-                raise EmptyResponseError("API 回應為空值 (empty response)。")
-
-            with open(os.path.splitext(srt_path)[0] + ".raw.txt", 'w', encoding='utf-8') as f: f.write(response.text)
-            
+            current_upload = uploaded_file
+            # NEW: 有提示詞快取時只傳送音訊，提示詞改以 cached_content 引用
+            # 提示詞快取綁定建立時的模型，換用備援模型後改為直接傳送提示詞
+            cache_name = prompt_cache.get() if prompt_cache is not None and prompt_cache.model_name == model_name else None
+            if cache_name:
+                contents, generate_config = [current_upload], {"cached_content": cache_name}
+            else:
+                contents, generate_config = [prompt_text, current_upload], None
             chunk_duration_td = timedelta(seconds=chunk_duration)
-            corrected_srt, severe_correction_count, last_subtitle_end_td = format_srt_from_text_v16(response.text, file_basename, overlap_tolerance_td, chunk_duration_td)
-            
-            if not is_final_srt_valid(corrected_srt):
-                raise ValueError("校正後的 SRT 檔案結構驗證失敗 (序列號與時間戳數量不匹配)，觸發重試。")
-
-            if corrected_srt and truncation_threshold > 0:
-                effective_duration_td = timedelta(seconds=chunk_duration)
-                duration_source_msg = f"標準分段時長 {chunk_duration}s"
-                if is_last_chunk:
-                    actual_duration_seconds = get_media_duration(audio_path, ffmpeg_executable)
-                    if actual_duration_seconds is not None:
-                        logging.info(f"正在為最後一個區塊 '{file_basename}' 獲取精確音訊時長: {actual_duration_seconds:.2f}s")
-                        effective_duration_td = timedelta(seconds=actual_duration_seconds)
-                        duration_source_msg = f"音訊實際長度 {actual_duration_seconds:.2f}s"
-                    else:
-                        logging.warning(f"無法獲取最後一個區塊 '{file_basename}' 的精確時長，將退回使用標準分段時長。")
-                
-                end_gap_seconds = (effective_duration_td - last_subtitle_end_td).total_seconds()
-                
-                if end_gap_seconds > truncation_threshold:
-                    log_msg = (
-                        f"SRT截斷警告: 區塊 '{file_basename}' 的結尾偵測到超過 {truncation_threshold} 秒的空白 "
-                        f"({end_gap_seconds:.1f}s)。(基於 {duration_source_msg})。"
-                        " 回應可能不完整，請手動檢查。"
+            stream_parser = None
+            if stream:
+                # NEW: 串流模式，邊接收邊解析；嚴重修正過多時提前中止
+                stream_parser = IncrementalSRTParser(file_basename, overlap_tolerance_td, chunk_duration_td,
+                                                     detector=_make_degenerate_detector(degenerate_repeat, degenerate_stall))
+                stream_state = {"usage": None, "finish_reason": ""}
+                stop_stream = threading.Event()
+                try:
+                    response_text = call_with_deadline(
+                        lambda: _stream_generate_content(client, model_name, contents, stream_parser,
+                                                         raw_path, correction_threshold, file_basename, stream_state, stop_stream,
+                                                         generate_config=generate_config, repair_budget=repair_budget),
+                        generate_timeout, "generate_content_stream", cancel_event=cancel_event,
                     )
-                    logging.warning(log_msg)
-
-            if severe_correction_count > correction_threshold:
-                raise ValueError(f"SRT嚴重錯誤: 偵測到 {severe_correction_count} 次嚴重修正，超過閾值 {correction_threshold}。")
+                finally:
+                    stop_stream.set()
+                    finish_reason = stream_state["finish_reason"]
+                    usage_metadata = stream_state["usage"]
+                    usage_tokens = _usage_to_tokens(usage_metadata)
+                    if usage_tokens:
+                        tokens_total, tokens_input, tokens_output = usage_tokens
+                        logging.info(f"[Token Usage | {file_basename}] Input: {tokens_input}, Output: {tokens_output}, Total: {tokens_total}")
+                    if prompt_cache is not None:
+                        prompt_cache.record_usage(usage_metadata)
+            else:
+                response = call_with_deadline(
+                    lambda: client.models.generate_content(model=model_name, contents=contents, config=generate_config),
+                    generate_timeout, "generate_content", cancel_event=cancel_event,
+                )
+                response_text = response.text
+                finish_reason = _finish_reason(response)
+                if prompt_cache is not None:
+                    prompt_cache.record_usage(getattr(response, 'usage_metadata', None))
+
+                # CHANGED: 獲取並記錄詳細的 token 用量
+                if hasattr(response, 'usage_metadata') and response.usage_metadata:
+                    tokens_input = response.usage_metadata.prompt_token_count
+                    tokens_output = response.usage_metadata.candidates_token_count
+                    tokens_total = response.usage_metadata.total_token_count
+                    # NEW: 在日誌中立即顯示本次區塊的 Token 用量
+                    logging.info(f"[Token Usage | {file_basename}] Input: {tokens_input}, Output: {tokens_output}, Total: {tokens_total}")
+
+            # 只快取模型的原始回應，命中時會重新執行完整檢查；續寫接回或局部修補的結果不是單一回應，不快取
+            cache_text = response_text
+            raw_text, prior_severe = None, None
+            if continue_truncated and finish_reason == "MAX_TOKENS" and response_text:
+                # NEW: 因輸出 token 上限被截斷時只續寫剩餘音訊，接回後再整體檢查
+                stitched_srt, continuation_tokens, prefix_severe = continue_truncated_response(
+                    client, audio_path, response_text, prompt_text, model_name, correction_threshold, overlap_tolerance,
+                    chunk_duration, ffmpeg_executable, file_basename, request_options,
+                    is_last_chunk=is_last_chunk, attempt_label=attempt_label, repair_budget=repair_budget,
+                )
+                tokens_total, tokens_input, tokens_output = (
+                    a + b for a, b in zip((tokens_total or 0, tokens_input or 0, tokens_output or 0), continuation_tokens))
+                if stitched_srt is not None:
+                    # raw 檔保存模型的原始輸出而非接回後的 SRT
+                    raw_text, prior_severe = response_text, prefix_severe
+                    response_text, stream_parser, cache_text = stitched_srt, None, None
+            try:
+                corrected_srt = check_and_correct_response(
+                    response_text, audio_path, file_basename, raw_path, correction_threshold,
+                    overlap_tolerance_td, chunk_duration, truncation_threshold, ffmpeg_executable,
+                    is_last_chunk=is_last_chunk, degenerate_repeat=degenerate_repeat, degenerate_stall=degenerate_stall,
+                    stream_parser=stream_parser, strict_truncation=strict_truncation,
+                    raw_text=raw_text, prior_severe=prior_severe,
+                )
+            except SevereCorrectionError as severe:
+                if not repair_ranges or not severe.corrected_srt:
+                    raise
+                # NEW: 嚴重修正集中在少數範圍時，只重新轉錄這些範圍並替換回區塊 SRT
+                repaired_srt, repair_tokens = repair_severe_ranges(
+                    client, audio_path, severe, prompt_text, model_name, correction_threshold, overlap_tolerance,
+                    chunk_duration, ffmpeg_executable, file_basename, request_options, attempt_label=attempt_label,
+                )
+                tokens_total, tokens_input, tokens_output = (
+                    a + b for a, b in zip((tokens_total or 0, tokens_input or 0, tokens_output or 0), repair_tokens))
+                if repaired_srt is None:
+                    raise
+                corrected_srt, cache_text = repaired_srt, None
+            if circuit_board is not None:
+                circuit_board.record_success(model_name, probe)
+            if claim_result is not None and not claim_result():
+                logging.info(f"[HEDGE] '{file_basename}' 的另一個請求已先取得有效結果，捨棄本次結果。")
+                return None, (tokens_total, tokens_input, tokens_output)
+            if cache_key and cache_text:
+                if model_name != cache_model:
+                    cache_key, cache_model = response_cache.key_for(audio_path, prompt_text, model_name), model_name
+                response_cache.put(cache_key, model_name, cache_text, (tokens_total, tokens_input, tokens_output))
             with open(srt_path, 'w', encoding='utf-8') as f: f.write(corrected_srt)
+            update_degraded_manifest(srt_path)
+            _record_model()
             logging.info(f"成功！已將修正後的字幕儲存至: {os.path.basename(srt_path)}")
             
             # CHANGED: 回傳包含三種 token 數值的元組
             return srt_path, (tokens_total, tokens_input, tokens_output)
 
         except Exception as e:
-            if isinstance(e, (EmptyResponseError, SRTContentParseError)):
-                logging.warning(f"處理 '{file_basename}' 時捕獲到轉錄或解析異常，將觸發重試: {e}")
+            if isinstance(e, CircuitOpenError):
+                logging.error(f"[CIRCUIT] '{file_basename}' 未送出: {e}")
+                return (_use_best_attempt(attempt) if keep_best_attempt else None), (tokens_total, tokens_input, tokens_output)
+            if isinstance(e, CallCancelledError) or (cancel_event is not None and cancel_event.is_set()):
+                logging.info(f"[{file_basename}] 請求已取消: {e}")
+                if circuit_board is not None:
+                    circuit_board.release(probe)
+                return None, (tokens_total, tokens_input, tokens_output)
+            error_class = classify_retry_error(e)
+            if keep_best_attempt and isinstance(e, SevereCorrectionError) and e.corrected_srt and e.severe_count is not None:
+                score = (e.severe_count, -e.corrected_srt.count('-->'))
+                if best_attempt is None or score < best_attempt[0]:
+                    best_attempt = (score, e.corrected_srt)
+            if circuit_board is not None:
+                circuit_board.record_failure(error_class, model_name, probe)
+            if model_failover is not None and is_daily_quota_error(e):
+                next_model = model_failover.mark_exhausted(model_name)
+                if next_model is not None:
+                    # 換模型後立即重送，不計入重試次數 (最多換完清單中的模型)
+                    logging.warning(f"[FAILOVER] '{file_basename}' 遇到每日額度用盡，改用 '{next_model}' 重新送出: {e}")
+                    continue
+            if circuit_board is not None:
+                if probe is not None and error_class in circuit_board.classes:
+                    # 探測失敗代表故障仍在持續，不計入本區塊的重試次數；下一輪會在 acquire() 中繼續等待
+                    logging.info(f"[CIRCUIT] '{file_basename}' 的探測請求失敗，不計入重試次數。")
+                    continue
+            if cache_name and PromptCacheManager.is_cache_error(e):
+                logging.warning(f"[CACHE] '{file_basename}' 引用的提示詞快取已失效，下次嘗試將重新建立。")
+                prompt_cache.invalidate(cache_name)
+            if error_class in ("empty", "parse", "severe", "degenerate"):
+                logging.warning(f"處理 '{file_basename}' 時捕獲到轉錄或解析異常 [類別: {error_class}]，將觸發重試: {e}")
+            elif error_class != "other":
+                logging.warning(f"處理 '{file_basename}' 時捕獲到 API 異常 [類別: {error_class}]，將觸發重試: {e}")
             else:
                 logging.warning(f"處理 '{file_basename}' 時捕獲到未預期異常，將觸發重試: {e}", exc_info=True)
 
             if attempt < max_retries - 1:
-                retry_after = None
-                try:
-                    retry_after = getattr(getattr(e, "response", None), "headers", {}).get("Retry-After")
-                except Exception:
-                    pass
-                if retry_after and str(retry_after).isdigit():
-                    delay = int(retry_after)
-                    logging.info(f"偵測到 Retry-After: {delay}s，暫停後重試...")
-                    time.sleep(delay)
+                hint = extract_retry_delay_hint(e)
+                delay = compute_retry_delay(error_class, attempt, retry_base=retry_base, retry_cap=retry_cap, hint=hint)
+                if hint is not None:
+                    logging.info(f"偵測到伺服器重試提示 {hint:g}s [類別: {error_class}]，將等待 {delay:.1f} 秒後重試 (第 {attempt+1} 次)...")
                 else:
-                    logging.info(f"將等待 {retry_base} 秒 + 0~15 秒隨機抖動後重試 (第 {attempt+1} 次)...")
-                    sleep_with_base_jitter(base=retry_base, jitter=15)
+                    logging.info(f"[類別: {error_class}] 將等待 {delay:.1f} 秒後重試 (第 {attempt+1} 次)...")
+                if cancel_event is not None:
+                    cancel_event.wait(delay)
+                else:
+                    time.sleep(delay)
+                attempt += 1
                 continue
             else:
                 logging.error(f"已達最大重試次數，轉錄 '{file_basename}' 失敗。")
-                # CHANGED: 即使失敗，也回傳元組
-                return None, (tokens_total, tokens_input, tokens_output)
+                # NEW: 品質或逾時類的失敗先嘗試對半切割，小段通常較容易通過
+                if bisect_min_seconds and error_class in BISECT_ERROR_CLASSES:
+                    bisected_path, bisect_tokens = _bisect_fallback()
+                    tokens_total, tokens_input, tokens_output = (
+                        a + b for a, b in zip((tokens_total or 0, tokens_input or 0, tokens_output or 0), bisect_tokens))
+                    if bisected_path:
+                        return bisected_path, (tokens_total, tokens_input, tokens_output)
+                # CHANGED: 即使失敗，也回傳元組；有保留的最佳嘗試時改用其結果 (降級)
+                return (_use_best_attempt(attempt + 1) if keep_best_attempt else None), (tokens_total, tokens_input, tokens_output)
 
         finally:
             if uploaded_file:
@@ -557,6 +2413,66 @@ def transcribe_audio(client, audio_path, prompt_text, model_name,
     # CHANGED: 確保函式在所有路徑都有回傳
     return None, (tokens_total, tokens_input, tokens_output)
 
+class TierStats:
+    """依模型層級 (draft / pro) 累計區塊數、通過數、token 與每個區塊的處理時間，任務結束時回報。"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tiers = {}
+
+    def record(self, tier, model_name, seconds, tokens, ok):
+        with self.lock:
+            entry = self.tiers.setdefault(tier, {"model": model_name, "chunks": 0, "passed": 0,
+                                                 "tokens": [0, 0, 0], "latencies": []})
+            entry["chunks"] += 1
+            entry["passed"] += 1 if ok else 0
+            entry["tokens"] = [a + (b or 0) for a, b in zip(entry["tokens"], tokens)]
+            entry["latencies"].append(seconds)
+
+    def log_summary(self):
+        with self.lock:
+            for tier, entry in self.tiers.items():
+                latencies = sorted(entry["latencies"])
+                p90 = latencies[max(0, math.ceil(0.9 * len(latencies)) - 1)] if latencies else 0.0
+                mean = sum(latencies) / len(latencies) if latencies else 0.0
+                total, inp, out = entry["tokens"]
+                logging.info(f"[TIER {tier} | {entry['model']}] 區塊: {entry['chunks']}，通過: {entry['passed']}，"
+                             f"Token: {total} (輸入: {inp}, 輸出: {out})，延遲 平均 {mean:.1f}s / p90 {p90:.1f}s")
+
+def make_tier_stats(config):
+    """設定 --draft_model 時建立 TierStats，否則回傳 None。"""
+    return TierStats() if getattr(config, 'draft_model', None) else None
+
+def transcribe_with_escalation(client, audio_path, prompt_text, model_name, *args, draft_model=None, draft_retries=1,
+                               draft_prompt_cache=None, tier_stats=None, **kwargs):
+    """分層轉錄：先以 draft_model 產生草稿，未通過品質門檻 (嚴重修正、結尾截斷) 才升級到 model_name。
+
+    其餘參數原樣轉給 transcribe_audio；未設定 draft_model (或與 model_name 相同) 時等同直接呼叫 transcribe_audio。
+    草稿層不使用最佳嘗試與對半切割，失敗即交給主模型。
+    """
+    draft_tokens = (0, 0, 0)
+    if draft_model and draft_model != model_name:
+        draft_kwargs = dict(kwargs, max_retries=draft_retries, prompt_cache=draft_prompt_cache,
+                            keep_best_attempt=False, bisect_min_seconds=0, strict_truncation=True, model_failover=None)
+        started = time.monotonic()
+        srt_path, draft_tokens = transcribe_audio(client, audio_path, prompt_text, draft_model, *args, **draft_kwargs)
+        draft_tokens = tuple(t or 0 for t in draft_tokens)
+        if tier_stats is not None:
+            tier_stats.record("draft", draft_model, time.monotonic() - started, draft_tokens, bool(srt_path))
+        if srt_path:
+            if kwargs.get("model_failover") is not None:
+                update_chunk_manifest(CHUNK_MODELS_FILENAME, srt_path, {"model": draft_model})
+            return srt_path, draft_tokens
+        cancel_event = kwargs.get("cancel_event")
+        if cancel_event is not None and cancel_event.is_set():
+            return None, draft_tokens
+        logging.warning(f"[ESCALATE | {os.path.basename(audio_path)}] 草稿模型 '{draft_model}' 未通過品質門檻，升級至 '{model_name}' 重新轉錄。")
+    started = time.monotonic()
+    srt_path, tokens = transcribe_audio(client, audio_path, prompt_text, model_name, *args, **kwargs)
+    tokens = tuple(t or 0 for t in tokens)
+    if tier_stats is not None:
+        tier_stats.record("pro", model_name, time.monotonic() - started, tokens, bool(srt_path))
+    return srt_path, tuple(a + b for a, b in zip(draft_tokens, tokens))
+
 def get_media_duration(file_path, ffmpeg_executable):
     command = [ffmpeg_executable, '-i', file_path]
     try:
@@ -627,30 +2543,17 @@ def merge_srts(srt_files, final_srt_path, chunk_duration_seconds):
     chunk_duration_td = timedelta(seconds=chunk_duration_seconds)
     with open(final_srt_path, 'w', encoding='utf-8') as outfile:
         sorted_srts = sorted(srt_files)
-        for i, srt_file in enumerate(sorted(sorted_srts)):
+        for i, srt_file in enumerate(sorted_srts):
             try:
-                with open(srt_file, 'r', encoding='utf-8') as infile:
-                    content = infile.read().strip()
-                    if not content:
-                        if i < len(sorted_srts) - 1: global_offset += chunk_duration_td
-                        continue
-                    for entry in content.split('\n\n'):
-                        if not entry.strip(): continue
-                        lines = entry.split('\n')
-                        if len(lines) < 2 or '-->' not in lines[1]: continue
-                        start_str, end_str = [t.strip() for t in lines[1].split('-->')]
-                        start_td, end_td = parse_time_v10(start_str), parse_time_v10(end_str)
-                        if start_td is None or end_td is None: continue
-                        adjusted_start, adjusted_end = start_td + global_offset, end_td + global_offset
-                        outfile.write(f"{entry_counter}\n{format_timedelta_v7(adjusted_start)} --> {format_timedelta_v7(adjusted_end)}\n" + '\n'.join(lines[2:]) + '\n\n')
-                        entry_counter += 1
-                if i < len(sorted_srts) - 1: global_offset += chunk_duration_td
+                offset_ms = timedelta_to_ms(global_offset)
+                for block in format_srt_cues(iter_srt_cues(srt_file), entry_counter, offset_ms):
+                    outfile.write(block)
+                    entry_counter += 1
             except FileNotFoundError:
                 logging.warning(f"找不到要合併的 SRT 檔案: {srt_file}，將以空白時段取代。")
-                if i < len(sorted_srts) - 1: global_offset += chunk_duration_td
             except Exception as e:
                 logging.error(f"合併 SRT '{os.path.basename(srt_file)}' 時發生錯誤: {e}")
-                if i < len(sorted_srts) - 1: global_offset += chunk_duration_td
+            if i < len(sorted_srts) - 1: global_offset += chunk_duration_td
 
 # CHANGED: 整個函式已更新
 def create_transcription_report(log_filepath, client, model_name, log_queue=None):
@@ -703,33 +2606,270 @@ def create_transcription_report(log_filepath, client, model_name, log_queue=None
         if log_queue: log_queue.put(f"[RETRY_REPORT]{log_filepath}")
         else: print(f"[RETRY_REPORT]{log_filepath}")
 
-# CHANGED: 整個函式已更新
-def run_transcription_task(config, log_queue=None):
-    exit_code = 0
-    prompt_filepath = None
+SCHEDULE_POLICIES = ("index", "longest", "history", "pinned")
+CHUNK_HISTORY_FILENAME = "_chunk_history.json"
+
 
-    empty_lock = Lock()
-    empty_consecutive = {"n": 0}
+class ChunkHistory:
+    """記錄各區塊過去的處理時間與失敗次數，供 history 排程使用。以區塊檔名為鍵，存於暫存資料夾。"""
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    loaded = json.load(f)
+                if isinstance(loaded, dict):
+                    self.data = loaded
+            except (OSError, ValueError) as e:
+                logging.warning(f"[排程] 無法讀取區塊歷史記錄 {path}: {e}")
+
+    def record(self, name, seconds, ok):
+        with self.lock:
+            entry = self.data.setdefault(name, {"latency": None, "failures": 0, "runs": 0})
+            entry["runs"] += 1
+            if not ok:
+                entry["failures"] += 1
+            if seconds is not None:
+                prev = entry.get("latency")
+                entry["latency"] = round(seconds if prev is None else (prev + seconds) / 2, 2)
+
+    def cost(self, name, default_latency):
+        """預估成本：過去延遲 × (1 + 失敗次數)；沒有記錄的區塊使用 default_latency。"""
+        entry = self.data.get(name) or {}
+        latency = entry.get("latency") or default_latency
+        return latency * (1 + entry.get("failures", 0))
+
+    def known_latencies(self):
+        return [e["latency"] for e in self.data.values() if isinstance(e, dict) and e.get("latency")]
+
+    def save(self):
+        if not self.path:
+            return
+        with self.lock:
+            try:
+                with open(self.path, 'w', encoding='utf-8') as f:
+                    json.dump(self.data, f, ensure_ascii=False, indent=1)
+            except OSError as e:
+                logging.warning(f"[排程] 無法寫入區塊歷史記錄 {self.path}: {e}")
 
-    def _reset_empty_counter():
-        with empty_lock:
-            if empty_consecutive["n"] > 0:
-                logging.info(f"[EMPTY] API 回應恢復正常，連續空回應計數已歸零。")
-                empty_consecutive["n"] = 0
 
-    def _mark_empty_and_maybe_abort():
-        with empty_lock:
-            empty_consecutive["n"] += 1
-            n = empty_consecutive["n"]
-        
-        thr = getattr(config, "empty_abort_threshold", 5)
-        
-        logging.warning(f"[EMPTY] 連續空回應次數 = {n} / {thr if thr > 0 else '∞'}")
+def parse_pinned_chunks(value):
+    """將 '3,7,12' 之類的字串轉為從 1 起算的區塊編號清單；無效項目略過。"""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        items = re.split(r"[,\s]+", str(value))
+    pinned = []
+    for item in items:
+        try:
+            n = int(item)
+        except (TypeError, ValueError):
+            continue
+        if n > 0 and n not in pinned:
+            pinned.append(n)
+    return pinned
+
 
-        if thr > 0 and n >= thr:
-            abort_msg = f"連續空回應已達門檻 {n} 次，強制終止整個流程。"
-            logging.critical(f"[ABORT] {abort_msg}")
-            raise RuntimeError(abort_msg)
+def order_chunk_jobs(jobs, policy="index", durations=None, history=None, names=None, pinned=None):
+    """依排程策略排序區塊工作 [(key, payload), ...]，回傳新清單 (ThreadPoolExecutor 依此順序開始)。
+
+    index   : 依區塊編號 (原本行為)
+    longest : 音訊越長越先送出，避免長區塊最後才開始
+    history : 依 ChunkHistory 預估成本，過去較慢或常失敗的區塊先送出
+    pinned  : 只依 pinned 指定的順序優先，其餘依編號
+    pinned 清單 (key + 1，即從 1 起算的區塊編號) 在任何策略下都會排在最前面。
+    """
+    durations = durations or {}
+    names = names or {}
+    jobs = sorted(jobs, key=lambda job: job[0])
+    if policy == "longest":
+        jobs.sort(key=lambda job: -float(durations.get(job[0], 0) or 0))
+    elif policy == "history" and history is not None:
+        known = sorted(history.known_latencies())
+        default_latency = known[len(known) // 2] if known else 1.0
+        jobs.sort(key=lambda job: -history.cost(names.get(job[0], str(job[0])), default_latency))
+    elif policy not in SCHEDULE_POLICIES:
+        logging.warning(f"[排程] 未知的排程策略 '{policy}'，改用 index。")
+    pin_rank = {n - 1: rank for rank, n in enumerate(pinned or [])}
+    if pin_rank:
+        jobs.sort(key=lambda job: pin_rank.get(job[0], len(pin_rank)))
+    return jobs
+
+
+def schedule_chunk_jobs(config, jobs, durations, names):
+    """依 config.schedule / config.pin_chunks 排序工作並記錄日誌，回傳 (排序後工作, ChunkHistory)。"""
+    schedule = getattr(config, "schedule", "index") or "index"
+    history = ChunkHistory(os.path.join(config.temp_dir, CHUNK_HISTORY_FILENAME))
+    pinned = parse_pinned_chunks(getattr(config, "pin_chunks", None))
+    ordered_jobs = order_chunk_jobs(jobs, schedule, durations=durations, history=history, names=names, pinned=pinned)
+    logging.info(f"[排程] 策略: {schedule}{'，優先區塊: ' + ','.join(map(str, pinned)) if pinned else ''}；送出順序: "
+                 + ", ".join(str(key + 1) for key, _ in ordered_jobs[:30]) + (" ..." if len(ordered_jobs) > 30 else ""))
+    return ordered_jobs, history
+
+
+class _ChunkRace:
+    """同一區塊的主要請求與對沖請求共用：第一個寫入有效結果者勝出，其餘請求會被取消。"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.winner = None
+        self.cancel_events = {}
+
+    def new_attempt(self, tag):
+        event = threading.Event()
+        with self.lock:
+            self.cancel_events[tag] = event
+        return event
+
+    def claim(self, tag):
+        with self.lock:
+            if self.winner is None:
+                self.winner = tag
+                for other_tag, event in self.cancel_events.items():
+                    if other_tag != tag:
+                        event.set()
+            return self.winner == tag
+
+
+class ChunkTaskRunner:
+    """區塊轉錄的併發執行器：ThreadPoolExecutor + 可選的尾端對沖請求 (hedging)。
+
+    job_fn(payload, cancel_event, claim_result, tag) 必須回傳 (srt_path, (tokens_t, tokens_i, tokens_o))。
+    run() 回傳 {key: (srt_path, (tokens_t, tokens_i, tokens_o))}，token 為該區塊所有請求 (含對沖) 的總和。
+    cancel_event 被設定時取消所有請求 (尚未開始的區塊會立即結束)；on_progress(完成數, 總數) 在每個區塊結束時呼叫。
+    """
+    HEDGE_TAG = "hedge"
+
+    def __init__(self, workers, rate_limiter=None, hedge=False, hedge_quantile=0.9, hedge_min_samples=3, poll_interval=1.0,
+                 cancel_event=None, on_progress=None):
+        self.workers = max(1, int(workers))
+        self.cancel_event = cancel_event
+        self.on_progress = on_progress
+        self.rate_limiter = rate_limiter
+        self.hedge = bool(hedge)
+        self.hedge_quantile = min(max(float(hedge_quantile), 0.0), 1.0)
+        self.hedge_min_samples = max(1, int(hedge_min_samples))
+        self.poll_interval = poll_interval
+        self.latencies = []
+        self.chunk_times = {}
+
+    def latency_threshold(self):
+        """已完成區塊延遲的分位數 (預設 p90)；樣本不足時回傳 None。"""
+        if len(self.latencies) < self.hedge_min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        idx = max(0, math.ceil(self.hedge_quantile * len(ordered)) - 1)
+        return ordered[idx]
+
+    def run(self, jobs, job_fn):
+        payloads = dict(jobs)
+        races = {key: _ChunkRace() for key, _ in jobs}
+        results = {key: [None, [0, 0, 0]] for key, _ in jobs}
+        started = {}
+        not_started = set(payloads)
+        hedged = set()
+        finished = set()
+        cancelled = False
+        state_lock = threading.Lock()
+        pending = {}
+
+        def _wrapped(key, tag, cancel_event):
+            with state_lock:
+                started[(key, tag)] = time.time()
+                if not tag:
+                    not_started.discard(key)
+            race = races[key]
+            return job_fn(payloads[key], cancel_event, lambda: race.claim(tag), tag)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as ex:
+            for key, _ in jobs:
+                event = races[key].new_attempt("")
+                pending[ex.submit(_wrapped, key, "", event)] = (key, "")
+
+            while pending:
+                done, _ = wait(list(pending), timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    key, tag = pending.pop(fut)
+                    try:
+                        srt_path, (tokens_t, tokens_i, tokens_o) = fut.result()
+                    except Exception as exc:
+                        logging.error(f"任務 {key}{'#' + tag if tag else ''} 在取得結果時產生例外: {exc}")
+                        srt_path, (tokens_t, tokens_i, tokens_o) = None, (0, 0, 0)
+                    entry = results[key]
+                    with state_lock:
+                        t_primary = started.get((key, ""))
+                    if t_primary is not None and (srt_path or not entry[0]):
+                        self.chunk_times[key] = (time.time() - t_primary, bool(srt_path or entry[0]))
+                    entry[1][0] += tokens_t or 0
+                    entry[1][1] += tokens_i or 0
+                    entry[1][2] += tokens_o or 0
+                    if srt_path:
+                        entry[0] = srt_path
+                        with state_lock:
+                            t0 = started.get((key, tag))
+                        if t0 is not None:
+                            self.latencies.append(time.time() - t0)
+                        if tag:
+                            logging.info(f"[HEDGE] 區塊 {key} 由對沖請求先完成。")
+                    if key not in finished and (srt_path or all(k != key for k, _ in pending.values())):
+                        finished.add(key)
+                        if self.on_progress is not None:
+                            self.on_progress(len(finished), len(payloads))
+                if not cancelled and self.cancel_event is not None and self.cancel_event.is_set():
+                    cancelled = True
+                    logging.warning("任務已取消，停止所有尚未完成的區塊請求。")
+                    for race in races.values():
+                        with race.lock:
+                            events = list(race.cancel_events.values())
+                        for event in events:
+                            event.set()
+                if self.hedge and pending and not cancelled:
+                    self._maybe_hedge(ex, pending, races, started, not_started, hedged, state_lock, _wrapped)
+
+        return {key: (entry[0], tuple(entry[1])) for key, entry in results.items()}
+
+    def _maybe_hedge(self, ex, pending, races, started, not_started, hedged, state_lock, wrapped):
+        with state_lock:
+            if not_started:
+                return
+            running = [(key, tag, started.get((key, tag))) for key, tag in pending.values()]
+        if len(running) >= self.workers:
+            return
+        threshold = self.latency_threshold()
+        if threshold is None:
+            return
+        now = time.time()
+        for key, tag, t0 in sorted(running, key=lambda r: r[2] or now):
+            if len(pending) >= self.workers:
+                break
+            if tag or key in hedged or t0 is None or races[key].winner is not None:
+                continue
+            elapsed = now - t0
+            if elapsed <= threshold:
+                continue
+            # 對沖請求需要上傳 + 生成兩次額度，只使用空餘的 RPM
+            if self.rate_limiter is not None and self.rate_limiter.available() < 2:
+                logging.debug(f"[HEDGE] RPM 額度不足，暫不對區塊 {key} 發出對沖請求。")
+                break
+            hedged.add(key)
+            event = races[key].new_attempt(self.HEDGE_TAG)
+            pending[ex.submit(wrapped, key, self.HEDGE_TAG, event)] = (key, self.HEDGE_TAG)
+            logging.info(f"[HEDGE] 區塊 {key} 已執行 {elapsed:.1f}s，超過 p{round(self.hedge_quantile * 100)} 延遲 {threshold:.1f}s，送出對沖請求。")
+
+
+# CHANGED: 整個函式已更新
+def run_transcription_task(config, log_queue=None):
+    exit_code = 0
+    prompt_filepath = None
+    prompt_cache = None
+    draft_prompt_cache = None
+    tier_stats = None
+    model_failover = None
+    response_cache = None
+    circuit_board = None
 
     try:
         file_basename = os.path.splitext(os.path.basename(config.input_file))[0]
@@ -766,13 +2906,13 @@ def run_transcription_task(config, log_queue=None):
             return 0
         client = None
         try:
-            ensure_genai_available()
-            api_key = config.api_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
-            client = genai.Client(api_key=api_key)
+            client = get_task_client(config)
             logging.info(f"成功建立 API 用戶端。將使用模型: {config.model_name}")
         except Exception as e:
             logging.error(f"建立 API 用戶端失敗: {e}")
             raise SystemExit(1)
+        http_stats = shared_http_stats(client)
+        http_since = http_stats.snapshot() if http_stats is not None else None
         
         chunk_mp3_files = split_audio(config.input_file, config.temp_dir, config.chunk_duration, config.ffmpeg_path, config.recreate)
         transcription_was_performed = False
@@ -794,44 +2934,98 @@ def run_transcription_task(config, log_queue=None):
             rate_limiter = MinuteRateLimiter(getattr(config, "rpm", 3))
             workers = max(1, getattr(config, "workers", 2))
 
+            # NEW: 批次模式先以 Batch API 處理全部區塊，失敗者再交給下方的一般請求流程
+            if to_process and getattr(config, "batch_mode", False):
+                transcription_was_performed = True
+                last_index = len(chunk_mp3_files) - 1
+                batch_results = transcribe_chunks_batch(
+                    client, [(i, p, config.chunk_duration, i == last_index) for i, p in to_process], prompt_text,
+                    config.model_name, config.correction_threshold, config.overlap_tolerance,
+                    getattr(config, 'truncation_threshold', 60), config.ffmpeg_path,
+                    poll_interval=getattr(config, "batch_poll_interval", 60),
+                    upload_timeout=getattr(config, "upload_timeout", 300),
+                    degenerate_repeat=getattr(config, "degenerate_repeat", 12),
+                    degenerate_stall=getattr(config, "degenerate_stall", 20),
+                    display_name=f"{file_basename}_batch",
+                    batch_timeout=getattr(config, "batch_timeout", 86400),
+                    cancel_event=getattr(config, "cancel_event", None),
+                )
+                raise_if_task_cancelled(config)
+                for srt_path, (tokens_t, tokens_i, tokens_o) in batch_results.values():
+                    total_tokens_used += tokens_t
+                    total_tokens_input += tokens_i
+                    total_tokens_output += tokens_o
+                to_process = [(i, p) for i, p in to_process if not batch_results[i][0]]
+                if to_process:
+                    logging.warning(f"[BATCH] {len(to_process)} 個區塊未能由批次完成，改以一般請求處理。")
+
             if to_process:
                 transcription_was_performed = True
                 last_index = len(chunk_mp3_files) - 1
                 logging.info(f"啟動併發處理：workers={workers}, rpm={rate_limiter.rpm}（單程序共用）")
-
-                def _job(i, path):
+                prompt_cache = make_prompt_cache(config, client, prompt_text, f"{file_basename}_prompt")
+                response_cache = make_response_cache(config)
+                circuit_board = make_circuit_board(config)
+                model_failover = make_model_failover(config)
+                tier_stats = make_tier_stats(config)
+                if tier_stats is not None:
+                    draft_prompt_cache = make_prompt_cache(config, client, prompt_text, f"{file_basename}_draft_prompt", model_name=config.draft_model)
+                    logging.info(f"[TIER] 已啟用分層轉錄：草稿模型 '{config.draft_model}'，未通過品質門檻的區塊升級至 '{config.model_name}'。")
+
+                def _job(payload, cancel_event=None, claim_result=None, tag=""):
+                    i, path = payload
                     is_last = (i == last_index)
-                    try:
-                        # CHANGED: 接收詳細的 token 元組
-                        srt_path, (tokens_t, tokens_i, tokens_o) = transcribe_audio(
-                            client, path, prompt_text, config.model_name,
-                            config.correction_threshold, config.overlap_tolerance, config.chunk_duration,
-                            getattr(config, 'truncation_threshold', 60), config.ffmpeg_path, is_last_chunk=is_last,
-                            max_retries=getattr(config, "max_retries", 3), rate_limiter=rate_limiter,
-                            retry_base=getattr(config, "retry_base", 65), retry_cap=getattr(config, "retry_cap", 250),
-                        )
-                        _reset_empty_counter()
-                        # CHANGED: 回傳詳細的 token 元組
-                        return (i, srt_path, (tokens_t, tokens_i, tokens_o))
-                    except EmptyResponseError:
-                        _mark_empty_and_maybe_abort()
-                        return (i, None, (0, 0, 0)) # 回傳 0 值的元組
-                    except SRTContentParseError:
-                        _mark_empty_and_maybe_abort()
-                        return (i, None, (0, 0, 0)) # 回傳 0 值的元組
+                    # CHANGED: 空回應 / 解析失敗的連續計數改由斷路器處理，不再以 RuntimeError 中止整個任務
+                    return transcribe_with_escalation(
+                        client, path, prompt_text, config.model_name,
+                        config.correction_threshold, config.overlap_tolerance, config.chunk_duration,
+                        getattr(config, 'truncation_threshold', 60), config.ffmpeg_path, is_last_chunk=is_last,
+                        max_retries=getattr(config, "max_retries", 3), rate_limiter=rate_limiter,
+                        retry_base=getattr(config, "retry_base", 65), retry_cap=getattr(config, "retry_cap", 250),
+                        upload_timeout=getattr(config, "upload_timeout", 300), generate_timeout=getattr(config, "generate_timeout", 900),
+                        cancel_event=cancel_event, claim_result=claim_result, attempt_label=tag,
+                        stream=getattr(config, "stream", False),
+                        degenerate_repeat=getattr(config, "degenerate_repeat", 12),
+                        degenerate_stall=getattr(config, "degenerate_stall", 20),
+                        prompt_cache=prompt_cache, response_cache=response_cache, circuit_board=circuit_board,
+                        repair_ranges=getattr(config, "range_repair", True),
+                        repair_margin=getattr(config, "repair_margin", REPAIR_MARGIN_SECONDS),
+                        repair_max_fraction=getattr(config, "repair_max_fraction", 0.4),
+                        keep_best_attempt=getattr(config, "best_attempt", True),
+                        continue_truncated=getattr(config, "continuation", True),
+                        bisect_min_seconds=getattr(config, "bisect_min", 120),
+                        bisect_retries=getattr(config, "bisect_retries", 2),
+                        draft_model=getattr(config, "draft_model", None), draft_retries=getattr(config, "draft_retries", 1),
+                        draft_prompt_cache=draft_prompt_cache, tier_stats=tier_stats, model_failover=model_failover,
+                    )
 
+                runner = ChunkTaskRunner(
+                    workers, rate_limiter=rate_limiter,
+                    hedge=getattr(config, "hedge", False), hedge_quantile=getattr(config, "hedge_quantile", 0.9),
+                    cancel_event=getattr(config, "cancel_event", None), on_progress=getattr(config, "progress_callback", None),
+                )
+                if runner.hedge:
+                    logging.info(f"[HEDGE] 已啟用尾端對沖請求：p{round(runner.hedge_quantile * 100)} 延遲門檻，僅使用空餘 RPM。")
+
+                # NEW: 依排程策略決定送出順序
+                names = {i: os.path.basename(p) for i, p in to_process}
+                durations = {i: config.chunk_duration for i, p in to_process}
+                if getattr(config, "schedule", "index") == "longest" and last_index in durations:
+                    last_duration = get_media_duration(chunk_mp3_files[last_index], config.ffmpeg_path)
+                    if last_duration is not None:
+                        durations[last_index] = last_duration
+                ordered_jobs, history = schedule_chunk_jobs(config, [(i, (i, p)) for i, p in to_process], durations, names)
                 try:
-                    with ThreadPoolExecutor(max_workers=workers) as ex:
-                        futures = [ex.submit(_job, i, p) for i, p in to_process]
-                        for fut in as_completed(futures):
-                            try:
-                                # CHANGED: 解包詳細的 token 元組並累加
-                                i, srt_path, (tokens_t, tokens_i, tokens_o) = fut.result()
-                                total_tokens_used += tokens_t
-                                total_tokens_input += tokens_i
-                                total_tokens_output += tokens_o
-                            except Exception as exc:
-                                logging.error(f'任務 {i} 在取得結果時產生例外: {exc}')
+                    results = runner.run(ordered_jobs, _job)
+                    for i, (seconds, ok) in runner.chunk_times.items():
+                        history.record(names[i], seconds, ok)
+                    history.save()
+                    for i, (srt_path, (tokens_t, tokens_i, tokens_o)) in results.items():
+                        # CHANGED: 解包詳細的 token 元組並累加
+                        total_tokens_used += tokens_t
+                        total_tokens_input += tokens_i
+                        total_tokens_output += tokens_o
+                    raise_if_task_cancelled(config)
                 except RuntimeError as fatal:
                     logging.critical(f"任務因致命錯誤而中止: {fatal}")
                     raise SystemExit(1)
@@ -842,6 +3036,19 @@ def run_transcription_task(config, log_queue=None):
             # NEW: 在任務結束時，印出累加後的總 Token 用量
             logging.info("="*40)
             logging.info(f"[任務結束] Token 總用量: {total_tokens_used} (輸入: {total_tokens_input}, 輸出: {total_tokens_output})")
+            if prompt_cache is not None:
+                prompt_cache.log_summary()
+            if response_cache is not None:
+                response_cache.log_summary()
+            if circuit_board is not None:
+                circuit_board.log_summary()
+            if tier_stats is not None:
+                tier_stats.log_summary()
+            if http_stats is not None:
+                http_stats.log_summary(http_since)
+            log_degraded_chunks(config.temp_dir, [os.path.splitext(os.path.basename(p))[0] + ".srt" for p in chunk_mp3_files])
+            if model_failover is not None:
+                log_fallback_model_chunks(config.temp_dir, [os.path.splitext(os.path.basename(p))[0] + ".srt" for p in chunk_mp3_files], config.model_name)
             logging.info("="*40)
             
             all_chunk_srts = [os.path.splitext(p)[0] + ".srt" for p in chunk_mp3_files]
@@ -857,6 +3064,9 @@ def run_transcription_task(config, log_queue=None):
                 create_transcription_report(log_filename, client, config.model_name, log_queue)
             else:
                 logging.info("沒有執行新的轉錄，跳過 SRT轉錄情況報告的生成。")
+    except TaskCancelledError as e:
+        exit_code = TASK_CANCELLED_EXIT_CODE
+        logging.warning(str(e))
     except SystemExit as e:
         exit_code = e.code if e.code is not None else 1
         logging.error(f"任務因 SystemExit 中止 (退出碼: {exit_code})")
@@ -864,6 +3074,10 @@ def run_transcription_task(config, log_queue=None):
         exit_code = 1
         logging.error(f"任務發生未預期的嚴重錯誤: {e}", exc_info=True)
     finally:
+        if prompt_cache is not None:
+            prompt_cache.close()
+        if draft_prompt_cache is not None:
+            draft_prompt_cache.close()
         logging.info(f"任務執行完畢。退出碼: {exit_code}")
         if prompt_filepath and hasattr(config, 'keep_prompt_file') and not config.keep_prompt_file:
             try:
@@ -875,62 +3089,104 @@ def run_transcription_task(config, log_queue=None):
 
 
 def adjust_srt_content_with_offset(content, offset_td):
-    """將已轉錄 SRT 的時間軸加上指定 offset，回傳校正後內容。"""
-    adjusted_content = ""
-    for entry in content.strip().split('\n\n'):
-        if not entry.strip():
-            continue
-        lines = entry.split('\n')
-        if len(lines) < 2 or '-->' not in lines[1]:
-            adjusted_content += entry + '\n\n'
-            continue
-        try:
-            time_line = lines[1]
-            text_lines = '\n'.join(lines[2:])
-            start_str, end_str = [t.strip() for t in time_line.split('-->')]
-            entry_start_td = parse_time_v10(start_str)
-            entry_end_td = parse_time_v10(end_str)
-            if entry_start_td is None or entry_end_td is None:
-                raise ValueError("無法解析時間戳")
-            adjusted_start = entry_start_td + offset_td
-            adjusted_end = entry_end_td + offset_td
-            adjusted_content += f"{lines[0]}\n{format_timedelta_v7(adjusted_start)} --> {format_timedelta_v7(adjusted_end)}\n{text_lines}\n\n"
-        except Exception as e:
-            logging.warning(f"處理 SRT 條目時出錯，將保留原始條目: {e}\n原始條目:\n{entry}")
-            adjusted_content += entry + '\n\n'
-    return adjusted_content
+    """將已轉錄 SRT 的時間軸加上指定 offset 並重新編號，回傳校正後內容。"""
+    cues = CueTable.from_srt(content)
+    if cues.skipped:
+        logging.warning(f"調整時間軸時略過 {cues.skipped} 條無法解析的 SRT 條目。")
+    return cues.to_srt(offset_ms=timedelta_to_ms(offset_td))
 
 
-def merge_absolute_srts(srt_files, final_srt_path):
-    """合併已經是原始影片絕對時間軸的 SRT。只重新編號，不再加 chunk offset。"""
-    logging.info(f"[STATUS] 正在合併 {len(srt_files)} 個絕對時間軸 SRT 檔案...")
-    blocks = []
-    for srt_file in srt_files:
-        try:
-            with open(srt_file, 'r', encoding='utf-8') as infile:
-                content = infile.read().strip()
-            if not content:
+class _UnsortedSRTError(Exception):
+    """串流合併時發現某個 SRT 檔案本身未依時間排序。"""
+    pass
+
+
+def _sorted_srt_source(srt_path, file_index, skip=0):
+    """merge_absolute_srts 的單一檔案字幕串流，產生 (start_ms, end_ms, 檔案序號, 文字)。
+
+    skip 為略過開頭的條數 (已由 _first_srt_cue 讀出者)；生成器第一次被取值時才開啟檔案。
+    讀取失敗時記錄後結束；開始時間倒退時拋出 _UnsortedSRTError。
+    """
+    try:
+        previous = (-1, -1)
+        for start_ms, end_ms, text in iter_srt_cues(srt_path):
+            if (start_ms, end_ms) < previous:
+                raise _UnsortedSRTError(srt_path)
+            previous = (start_ms, end_ms)
+            if skip:
+                skip -= 1
                 continue
-            for entry in content.split('\n\n'):
-                if not entry.strip():
-                    continue
-                lines = entry.split('\n')
-                if len(lines) < 2 or '-->' not in lines[1]:
-                    continue
-                start_str, end_str = [t.strip() for t in lines[1].split('-->')]
-                start_td, end_td = parse_time_v10(start_str), parse_time_v10(end_str)
-                if start_td is None or end_td is None:
-                    continue
-                blocks.append((start_td, end_td, '\n'.join(lines[2:])))
-        except FileNotFoundError:
-            logging.warning(f"找不到要合併的 SRT 檔案: {srt_file}")
-        except Exception as e:
-            logging.error(f"合併 SRT '{os.path.basename(srt_file)}' 時發生錯誤: {e}")
+            yield start_ms, end_ms, file_index, text
+    except FileNotFoundError:
+        logging.warning(f"找不到要合併的 SRT 檔案: {srt_path}")
+    except _UnsortedSRTError:
+        raise
+    except Exception as e:
+        logging.error(f"合併 SRT '{os.path.basename(srt_path)}' 時發生錯誤: {e}")
 
-    blocks.sort(key=lambda x: (x[0], x[1]))
-    with open(final_srt_path, 'w', encoding='utf-8') as outfile:
-        for idx, (start_td, end_td, text_lines) in enumerate(blocks, start=1):
-            outfile.write(f"{idx}\n{format_timedelta_v7(start_td)} --> {format_timedelta_v7(end_td)}\n{text_lines}\n\n")
+
+def _first_srt_cue(srt_path, file_index):
+    """讀出單一檔案的第一條字幕 (讀完即關檔)，沒有任何字幕時回傳 None。"""
+    for cue in _sorted_srt_source(srt_path, file_index):
+        return cue
+    return None
+
+
+def _merge_sorted_streams(streams):
+    """k 路合併多個已排序的串流 (不同串流的元素不會相等)。
+
+    streams 為 (第一個元素, 其餘元素的 iterable) 的序列；其餘部分到第一個元素輸出後才開始取值，
+    以生成器傳入時尚未輪到的串流不佔用資源 (例如開啟的檔案)。
+    目前最小的串流會一路輸出到超過次小串流的開頭為止才放回 heap；
+    各區塊時間互不重疊時 (最常見的情況)，每條字幕只需一次比較。
+    """
+    heap = [(first, iter(rest)) for first, rest in streams]
+    heapq.heapify(heap)
+    while len(heap) > 1:
+        item, stream = heap[0]
+        limit = min(heap[1][0], heap[2][0]) if len(heap) > 2 else heap[1][0]
+        yield item
+        for item in stream:
+            if item > limit:
+                heapq.heapreplace(heap, (item, stream))
+                break
+            yield item
+        else:
+            heapq.heappop(heap)
+    if heap:
+        item, stream = heap[0]
+        yield item
+        yield from stream
+
+
+def merge_absolute_srts(srt_files, final_srt_path):
+    """合併已經是原始影片絕對時間軸的 SRT。只重新編號，不再加 chunk offset。
+
+    各檔案的字幕以 heap 做 k 路串流合併 (相同時間依檔案順序)，記憶體不隨字幕總數成長；
+    每個檔案先只讀第一條字幕，輪到時才重新開啟讀取其餘部分，各區塊時間互不重疊時同時只開啟一個檔案。
+    若有檔案本身未依時間排序，退回整體載入後排序。
+    """
+    logging.info(f"[STATUS] 正在合併 {len(srt_files)} 個絕對時間軸 SRT 檔案...")
+    try:
+        with open(final_srt_path, 'w', encoding='utf-8') as outfile:
+            # 檔案序號讓相同時間的字幕依檔案順序輸出，且永遠不必比較文字
+            heads = ((_first_srt_cue(srt_file, idx), srt_file, idx) for idx, srt_file in enumerate(srt_files))
+            merged = _merge_sorted_streams((first, _sorted_srt_source(srt_file, idx, skip=1))
+                                           for first, srt_file, idx in heads if first is not None)
+            outfile.writelines(format_srt_cues((start_ms, end_ms, text) for start_ms, end_ms, _, text in merged))
+    except _UnsortedSRTError as e:
+        logging.info(f"SRT '{os.path.basename(str(e))}' 未依時間排序，改為整體載入後排序合併。")
+        cues = CueTable()
+        for srt_file in srt_files:
+            try:
+                cues.extend(CueTable.read(srt_file))
+            except FileNotFoundError:
+                logging.warning(f"找不到要合併的 SRT 檔案: {srt_file}")
+            except Exception as e:
+                logging.error(f"合併 SRT '{os.path.basename(srt_file)}' 時發生錯誤: {e}")
+        cues.sort()
+        with open(final_srt_path, 'w', encoding='utf-8') as outfile:
+            cues.write(outfile)
     logging.info(f"絕對時間軸 SRT 合併完成：{final_srt_path}")
 
 
@@ -1024,6 +3280,12 @@ def run_multi_partial_transcription_task(config, log_queue=None):
     temp_audio_paths_for_cleanup = []
     prompt_filepath = None
     client = None
+    prompt_cache = None
+    draft_prompt_cache = None
+    tier_stats = None
+    model_failover = None
+    response_cache = None
+    circuit_board = None
     try:
         file_basename = os.path.splitext(os.path.basename(config.input_file))[0]
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -1077,30 +3339,32 @@ def run_multi_partial_transcription_task(config, log_queue=None):
             logging.warning("提示為空。")
 
         try:
-            ensure_genai_available()
-            api_key = config.api_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
-            client = genai.Client(api_key=api_key)
+            client = get_task_client(config)
             logging.info(f"成功建立 API 用戶端。將使用模型: {config.model_name}")
         except Exception as e:
             logging.error(f"建立 API 用戶端失敗: {e}")
             return 1
+        http_stats = shared_http_stats(client)
+        http_since = http_stats.snapshot() if http_stats is not None else None
 
         rate_limiter = MinuteRateLimiter(getattr(config, 'rpm', 3))
+        workers = max(1, int(getattr(config, 'workers', 1) or 1))
         chunk_duration_seconds = max(1, int(getattr(config, 'chunk_duration', 600)))
         total_tokens_used, total_tokens_input, total_tokens_output = 0, 0, 0
         failed_parts = []
         transcription_was_performed = False
 
+        # 先掃描所有小段：命中 Resume 的直接收錄，其餘排入併發佇列
+        parts_to_process = []
         for seg_order, (segment_start_td, segment_end_td, label, original_idx) in enumerate(parsed_segments, start=1):
             segment_duration_td = segment_end_td - segment_start_td
             logging.info("-"*60)
-            logging.info(f"[區段清單] 開始處理區段 {seg_order}/{len(parsed_segments)}：{format_timedelta_v7(segment_start_td)} --> {format_timedelta_v7(segment_end_td)} {label or ''}")
+            logging.info(f"[區段清單] 檢查區段 {seg_order}/{len(parsed_segments)}：{format_timedelta_v7(segment_start_td)} --> {format_timedelta_v7(segment_end_td)} {label or ''}")
 
             part_count = max(1, math.ceil(segment_duration_td.total_seconds() / chunk_duration_seconds))
             for part_idx in range(part_count):
                 part_start_td = segment_start_td + timedelta(seconds=part_idx * chunk_duration_seconds)
                 part_end_td = min(segment_end_td, part_start_td + timedelta(seconds=chunk_duration_seconds))
-                part_duration_td = part_end_td - part_start_td
 
                 temp_audio_path, partial_srt_path, raw_txt_path, adjusted_srt_path = _multi_part_paths(config, file_basename, seg_order, part_idx, part_start_td, part_end_td, label)
                 temp_audio_paths_for_cleanup.append(temp_audio_path)
@@ -1123,35 +3387,112 @@ def run_multi_partial_transcription_task(config, log_queue=None):
                     except Exception as e:
                         logging.warning(f"[區段清單] 既有 partial SRT 無法重建 absolute，將重新轉錄：{e}")
 
-                logging.info(f"[區段清單] 處理第 {part_idx+1}/{part_count} 個小段：{format_timedelta_v7(part_start_td)} --> {format_timedelta_v7(part_end_td)}")
-
-                if not (getattr(config, 'resume', False) and os.path.exists(temp_audio_path) and os.path.getsize(temp_audio_path) > 0):
-                    command = [
-                        config.ffmpeg_path,
-                        '-i', config.input_file,
-                        '-ss', str(part_start_td.total_seconds()),
-                        '-t', str(part_duration_td.total_seconds()),
-                        '-vn', '-acodec', 'libmp3lame', '-b:a', '192k', '-y',
-                        temp_audio_path
-                    ]
-                    try:
-                        subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
-                    except Exception as e:
-                        logging.error(f"使用 FFmpeg 切割區段音訊失敗: {e.stderr.decode(errors='ignore') if hasattr(e, 'stderr') else e}")
-                        failed_parts.append(os.path.basename(temp_audio_path))
-                        continue
+                parts_to_process.append((part_start_td, part_end_td, temp_audio_path, adjusted_srt_path))
+
+        def _cut_part(part):
+            """以 FFmpeg 預先切出小段音訊；成功回傳 True。"""
+            part_start_td, part_end_td, temp_audio_path, _ = part
+            if getattr(config, 'resume', False) and os.path.exists(temp_audio_path) and os.path.getsize(temp_audio_path) > 0:
+                logging.info(f"[區段清單] 偵測到已存在音訊小段，跳過切割：{os.path.basename(temp_audio_path)}")
+                return True
+            command = [
+                config.ffmpeg_path,
+                '-i', config.input_file,
+                '-ss', str(part_start_td.total_seconds()),
+                '-t', str((part_end_td - part_start_td).total_seconds()),
+                '-vn', '-acodec', 'libmp3lame', '-b:a', '192k', '-y',
+                temp_audio_path
+            ]
+            try:
+                subprocess.run(command, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, creationflags=subprocess.CREATE_NO_WINDOW if sys.platform == 'win32' else 0)
+                logging.info(f"[區段清單] 已預先切割小段：{os.path.basename(temp_audio_path)}")
+                return True
+            except Exception as e:
+                logging.error(f"使用 FFmpeg 切割區段音訊失敗: {e.stderr.decode(errors='ignore') if hasattr(e, 'stderr') else e}")
+                return False
+
+        def _write_absolute_srt(partial_srt_path, part_start_td, adjusted_srt_path):
+            with open(partial_srt_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+            adjusted_content = adjust_srt_content_with_offset(content, part_start_td)
+            with open(adjusted_srt_path, 'w', encoding='utf-8') as f:
+                f.write(adjusted_content)
+            logging.info(f"[區段清單] 已建立絕對時間軸 SRT：{adjusted_srt_path}")
+
+        # NEW: 批次模式先切出全部小段並以 Batch API 處理，失敗者再交給下方的併發流程
+        if parts_to_process and getattr(config, 'batch_mode', False):
+            transcription_was_performed = True
+            batch_items = [
+                (k, part[2], (part[1] - part[0]).total_seconds(), True)
+                for k, part in enumerate(parts_to_process) if _cut_part(part)
+            ]
+            batch_results = transcribe_chunks_batch(
+                client, batch_items, prompt_text, config.model_name, config.correction_threshold, config.overlap_tolerance,
+                getattr(config, 'truncation_threshold', 60), config.ffmpeg_path,
+                poll_interval=getattr(config, 'batch_poll_interval', 60),
+                upload_timeout=getattr(config, 'upload_timeout', 300),
+                degenerate_repeat=getattr(config, 'degenerate_repeat', 12),
+                degenerate_stall=getattr(config, 'degenerate_stall', 20),
+                display_name=f"{file_basename}_selected_batch",
+                batch_timeout=getattr(config, 'batch_timeout', 86400),
+                cancel_event=getattr(config, 'cancel_event', None),
+            )
+            raise_if_task_cancelled(config)
+            remaining_parts = []
+            for k, part in enumerate(parts_to_process):
+                partial_srt_path, (tokens_t, tokens_i, tokens_o) = batch_results.get(k, (None, (0, 0, 0)))
+                total_tokens_used += tokens_t
+                total_tokens_input += tokens_i
+                total_tokens_output += tokens_o
+                if partial_srt_path:
+                    _write_absolute_srt(partial_srt_path, part[0], part[3])
+                    adjusted_srt_paths.append(part[3])
                 else:
-                    logging.info(f"[區段清單] 偵測到已存在音訊小段，跳過切割：{os.path.basename(temp_audio_path)}")
-
-                transcription_was_performed = True
-                partial_srt_path, (tokens_t, tokens_i, tokens_o) = transcribe_audio(
+                    remaining_parts.append(part)
+            parts_to_process = remaining_parts
+            if parts_to_process:
+                logging.warning(f"[BATCH] {len(parts_to_process)} 個小段未能由批次完成，改以一般請求處理。")
+
+        if parts_to_process:
+            transcription_was_performed = True
+            jobs = [(k, k) for k in range(len(parts_to_process))]
+            names = {k: os.path.basename(part[2]) for k, part in enumerate(parts_to_process)}
+            durations = {k: (part[1] - part[0]).total_seconds() for k, part in enumerate(parts_to_process)}
+            ordered_jobs, history = schedule_chunk_jobs(config, jobs, durations, names)
+
+            # NEW: FFmpeg 預切與轉錄重疊：切割池依送出順序先行，轉錄工作只等待自己的小段
+            cut_workers = max(1, min(2, workers))
+            logging.info(f"[區段清單] 啟動併發處理：{len(parts_to_process)} 個小段，workers={workers}, rpm={rate_limiter.rpm}，FFmpeg 預切執行緒={cut_workers}")
+            cut_pool = ThreadPoolExecutor(max_workers=cut_workers)
+            cut_futures = {k: cut_pool.submit(_cut_part, parts_to_process[k]) for k, _ in ordered_jobs}
+            prompt_cache = make_prompt_cache(config, client, prompt_text, f"{file_basename}_selected_prompt")
+            response_cache = make_response_cache(config)
+            circuit_board = make_circuit_board(config)
+            model_failover = make_model_failover(config)
+            tier_stats = make_tier_stats(config)
+            if tier_stats is not None:
+                draft_prompt_cache = make_prompt_cache(config, client, prompt_text, f"{file_basename}_selected_draft_prompt", model_name=config.draft_model)
+                logging.info(f"[TIER] 已啟用分層轉錄：草稿模型 '{config.draft_model}'，未通過品質門檻的小段升級至 '{config.model_name}'。")
+
+            def _job(k, cancel_event=None, claim_result=None, tag=""):
+                part_start_td, part_end_td, temp_audio_path, adjusted_srt_path = parts_to_process[k]
+                cut_future = cut_futures[k]
+                # 等待預切時也回應取消，已排入的小段不必在取消後逐一等完 FFmpeg
+                while not cut_future.done():
+                    if cancel_event is not None and cancel_event.is_set():
+                        return (None, (0, 0, 0))
+                    wait([cut_future], timeout=0.2)
+                if cut_future.cancelled() or not cut_future.result():
+                    return (None, (0, 0, 0))
+                logging.info(f"[區段清單] 處理小段：{format_timedelta_v7(part_start_td)} --> {format_timedelta_v7(part_end_td)}")
+                partial_srt_path, tokens = transcribe_with_escalation(
                     client,
                     temp_audio_path,
                     prompt_text,
                     config.model_name,
                     config.correction_threshold,
                     config.overlap_tolerance,
-                    chunk_duration=part_duration_td.total_seconds(),
+                    chunk_duration=(part_end_td - part_start_td).total_seconds(),
                     truncation_threshold=getattr(config, 'truncation_threshold', 60),
                     ffmpeg_executable=config.ffmpeg_path,
                     is_last_chunk=True,
@@ -1159,26 +3500,69 @@ def run_multi_partial_transcription_task(config, log_queue=None):
                     rate_limiter=rate_limiter,
                     retry_base=getattr(config, 'retry_base', 65),
                     retry_cap=getattr(config, 'retry_cap', 250),
+                    upload_timeout=getattr(config, 'upload_timeout', 300),
+                    generate_timeout=getattr(config, 'generate_timeout', 900),
+                    cancel_event=cancel_event, claim_result=claim_result, attempt_label=tag,
+                    stream=getattr(config, 'stream', False),
+                    degenerate_repeat=getattr(config, 'degenerate_repeat', 12),
+                    degenerate_stall=getattr(config, 'degenerate_stall', 20),
+                    prompt_cache=prompt_cache, response_cache=response_cache, circuit_board=circuit_board,
+                    repair_ranges=getattr(config, 'range_repair', True),
+                    repair_margin=getattr(config, 'repair_margin', REPAIR_MARGIN_SECONDS),
+                    repair_max_fraction=getattr(config, 'repair_max_fraction', 0.4),
+                    keep_best_attempt=getattr(config, 'best_attempt', True),
+                    continue_truncated=getattr(config, 'continuation', True),
+                    bisect_min_seconds=getattr(config, 'bisect_min', 120),
+                    bisect_retries=getattr(config, 'bisect_retries', 2),
+                    draft_model=getattr(config, 'draft_model', None), draft_retries=getattr(config, 'draft_retries', 1),
+                    draft_prompt_cache=draft_prompt_cache, tier_stats=tier_stats, model_failover=model_failover,
                 )
+                if not partial_srt_path or not os.path.exists(partial_srt_path):
+                    return (None, tokens)
+                _write_absolute_srt(partial_srt_path, part_start_td, adjusted_srt_path)
+                return (adjusted_srt_path, tokens)
+
+            runner = ChunkTaskRunner(
+                workers, rate_limiter=rate_limiter,
+                hedge=getattr(config, 'hedge', False), hedge_quantile=getattr(config, 'hedge_quantile', 0.9),
+                cancel_event=getattr(config, 'cancel_event', None), on_progress=getattr(config, 'progress_callback', None),
+            )
+            try:
+                results = runner.run(ordered_jobs, _job)
+            finally:
+                # 任務取消時不再等待尚未開始的預切，只等進行中的 FFmpeg 結束
+                cut_pool.shutdown(wait=True, cancel_futures=True)
+            raise_if_task_cancelled(config)
+            for k, (seconds, ok) in runner.chunk_times.items():
+                history.record(names[k], seconds, ok)
+            history.save()
+
+            for k, part in enumerate(parts_to_process):
+                result_path, (tokens_t, tokens_i, tokens_o) = results[k]
                 total_tokens_used += tokens_t
                 total_tokens_input += tokens_i
                 total_tokens_output += tokens_o
-
-                if not partial_srt_path or not os.path.exists(partial_srt_path):
-                    logging.error(f"[區段清單] 轉錄失敗，未能生成 SRT：{os.path.basename(temp_audio_path)}")
-                    failed_parts.append(os.path.basename(temp_audio_path))
-                    continue
-
-                with open(partial_srt_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                adjusted_content = adjust_srt_content_with_offset(content, part_start_td)
-                with open(adjusted_srt_path, 'w', encoding='utf-8') as f:
-                    f.write(adjusted_content)
-                adjusted_srt_paths.append(adjusted_srt_path)
-                logging.info(f"[區段清單] 已建立絕對時間軸 SRT：{adjusted_srt_path}")
+                if result_path:
+                    adjusted_srt_paths.append(result_path)
+                else:
+                    logging.error(f"[區段清單] 轉錄失敗，未能生成 SRT：{os.path.basename(part[2])}")
+                    failed_parts.append(os.path.basename(part[2]))
 
         logging.info("="*40)
         logging.info(f"[區段清單任務結束] Token 總用量: {total_tokens_used} (輸入: {total_tokens_input}, 輸出: {total_tokens_output})")
+        if prompt_cache is not None:
+            prompt_cache.log_summary()
+        if response_cache is not None:
+            response_cache.log_summary()
+        if circuit_board is not None:
+            circuit_board.log_summary()
+        if tier_stats is not None:
+            tier_stats.log_summary()
+        if http_stats is not None:
+            http_stats.log_summary(http_since)
+        log_degraded_chunks(config.temp_dir, [os.path.splitext(os.path.basename(p))[0] + ".srt" for p in temp_audio_paths_for_cleanup])
+        if model_failover is not None:
+            log_fallback_model_chunks(config.temp_dir, [os.path.splitext(os.path.basename(p))[0] + ".srt" for p in temp_audio_paths_for_cleanup], config.model_name)
         logging.info("="*40)
 
         if not adjusted_srt_paths:
@@ -1199,10 +3583,17 @@ def run_multi_partial_transcription_task(config, log_queue=None):
             else:
                 logging.info("沒有執行新的轉錄，跳過 SRT轉錄情況報告的生成。")
 
+    except TaskCancelledError as e:
+        exit_code = TASK_CANCELLED_EXIT_CODE
+        logging.warning(str(e))
     except Exception as e:
         exit_code = 1
         logging.error(f"區段清單轉錄任務發生未預期的嚴重錯誤: {e}", exc_info=True)
     finally:
+        if prompt_cache is not None:
+            prompt_cache.close()
+        if draft_prompt_cache is not None:
+            draft_prompt_cache.close()
         if not getattr(config, 'keep_partial_audio', False):
             for temp_audio_path in temp_audio_paths_for_cleanup:
                 if temp_audio_path and os.path.exists(temp_audio_path):
@@ -1271,9 +3662,7 @@ def run_partial_transcription_task(config, log_queue=None):
         # 建立 API 用戶端
         client = None
         try:
-            ensure_genai_available()
-            api_key = config.api_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
-            client = genai.Client(api_key=api_key)
+            client = get_task_client(config)
             logging.info(f"成功建立 API 用戶端，將使用模型: {config.model_name}")
         except Exception as e:
             logging.error(f"建立 API 用戶端失敗: {e}")
@@ -1292,8 +3681,24 @@ def run_partial_transcription_task(config, log_queue=None):
             truncation_threshold=0, # 局部轉錄不檢查結尾空白
             ffmpeg_executable=config.ffmpeg_path,
             is_last_chunk=True, # 視為單一的最後區塊
-            max_retries=config.max_retries if hasattr(config, 'max_retries') else 3
+            max_retries=config.max_retries if hasattr(config, 'max_retries') else 3,
+            upload_timeout=getattr(config, 'upload_timeout', 300),
+            generate_timeout=getattr(config, 'generate_timeout', 900),
+            stream=getattr(config, 'stream', False),
+            degenerate_repeat=getattr(config, 'degenerate_repeat', 12),
+            degenerate_stall=getattr(config, 'degenerate_stall', 20),
+            response_cache=make_response_cache(config),
+            repair_ranges=getattr(config, 'range_repair', True),
+            repair_margin=getattr(config, 'repair_margin', REPAIR_MARGIN_SECONDS),
+            repair_max_fraction=getattr(config, 'repair_max_fraction', 0.4),
+            keep_best_attempt=getattr(config, 'best_attempt', True),
+            continue_truncated=getattr(config, 'continuation', True),
+            bisect_min_seconds=getattr(config, 'bisect_min', 120),
+            bisect_retries=getattr(config, 'bisect_retries', 2),
+            model_failover=make_model_failover(config),
+            cancel_event=getattr(config, 'cancel_event', None),
         )
+        raise_if_task_cancelled(config)
 
         if not partial_srt_path or not os.path.exists(partial_srt_path):
             logging.error("局部轉錄失敗，未能生成 SRT 檔案。")
@@ -1315,6 +3720,9 @@ def run_partial_transcription_task(config, log_queue=None):
         
         logging.info(f"時間軸校正完成！最終局部 SRT 檔案儲存於: {final_srt_path}")
 
+    except TaskCancelledError as e:
+        exit_code = TASK_CANCELLED_EXIT_CODE
+        logging.warning(str(e))
     except Exception as e:
         exit_code = 1
         logging.error(f"局部轉錄任務發生未預期的嚴重錯誤: {e}", exc_info=True)
@@ -1333,9 +3741,7 @@ def run_summarize_only_task(config, log_queue=None):
     try:
         setup_logging(config.log_file, config.verbose, log_queue)
         logging.info("【僅摘要模式】啟動...")
-        ensure_genai_available()
-        api_key = config.api_key or os.environ.get("GEMINI_API_KEY") or os.environ.get("GOOGLE_API_KEY")
-        client = genai.Client(api_key=api_key)
+        client = get_task_client(config)
         logging.info(f"成功建立 API 用戶端。將使用模型: {config.model_name}")
         create_transcription_report(config.log_file, client, config.model_name, log_queue)
         logging.info("僅摘要模式完成。")
@@ -1345,6 +3751,132 @@ def run_summarize_only_task(config, log_queue=None):
     finally:
         return exit_code
 
+# ==============================================================================
+#  常駐後端工作程序 (供 GUI 使用)
+# ==============================================================================
+def backend_worker_main(job_queue, event_queue):
+    """常駐工作程序的主迴圈：主執行緒接收指令，任務在單一工作執行緒中依序執行。
+
+    指令：("run", job_id, task_func, config)、("cancel", job_id)、("warm", config)、("stop",)。
+    task_func 為 run_*_task 之一 (或任何可 pickle 的同型函式)，呼叫方式與獨立程序相同：task_func(config, event_queue)。
+    """
+    jobs = queue.Queue()
+    cancel_events = {}
+
+    def _run_jobs():
+        while True:
+            item = jobs.get()
+            if item is None:
+                return
+            job_id, task_func, config = item
+            cancel_event = cancel_events[job_id]
+            if cancel_event.is_set():
+                cancel_events.pop(job_id, None)
+                event_queue.put(('TASK_COMPLETE', TASK_CANCELLED_EXIT_CODE, job_id))
+                continue
+            event_queue.put(('JOB_STARTED', job_id))
+            config.cancel_event = cancel_event
+            config.progress_callback = lambda done, total, job_id=job_id: event_queue.put(('JOB_PROGRESS', job_id, done, total))
+            try:
+                config.genai_client = get_shared_genai_client(config)
+            except Exception:
+                config.genai_client = None # 由任務自行建立並記錄錯誤
+            try:
+                exit_code = task_func(config, event_queue)
+            except SystemExit as e:
+                exit_code = e.code
+            except Exception as e:
+                event_queue.put(f"FATAL ERROR in backend worker: {e}")
+                exit_code = 1
+            finally:
+                cancel_events.pop(job_id, None)
+            event_queue.put(('TASK_COMPLETE', exit_code if isinstance(exit_code, int) else 1, job_id))
+
+    runner = threading.Thread(target=_run_jobs, name="backend-job", daemon=True)
+    runner.start()
+    while True:
+        message = job_queue.get()
+        kind = message[0]
+        if kind == "run":
+            cancel_events[message[1]] = threading.Event()
+            jobs.put(message[1:])
+        elif kind == "cancel":
+            event = cancel_events.get(message[1])
+            if event is not None:
+                event.set()
+        elif kind == "warm":
+            try:
+                get_shared_genai_client(message[1])
+            except Exception as e:
+                event_queue.put(f"[WORKER] 預先建立 API 用戶端失敗 (將於任務開始時重試): {e}")
+        elif kind == "stop":
+            jobs.put(None)
+            runner.join()
+            return
+
+class BackendWorker:
+    """GUI 持有的常駐後端工作程序。
+
+    事件一律放入 event_queue：日誌字串、('JOB_STARTED', job_id)、('JOB_PROGRESS', job_id, 完成數, 總數)、
+    ('TASK_COMPLETE', exit_code, job_id)；工作程序意外結束時為 ('WORKER_EXITED', exitcode)。
+    """
+    def __init__(self, event_queue):
+        self.event_queue = event_queue
+        self.job_queue = None
+        self.process = None
+        self._job_ids = itertools.count(1)
+        self._stopping = False
+
+    def is_alive(self):
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        if self.is_alive():
+            return
+        self._stopping = False
+        self.job_queue = multiprocessing.Queue()
+        self.process = multiprocessing.Process(target=backend_worker_main, args=(self.job_queue, self.event_queue), daemon=True)
+        self.process.start()
+        threading.Thread(target=self._watch, args=(self.process,), daemon=True).start()
+
+    def _watch(self, process):
+        process.join()
+        if not self._stopping:
+            self.event_queue.put(('WORKER_EXITED', process.exitcode))
+
+    def warm(self, config):
+        """預先建立 API 用戶端，讓第一個任務不必等待。"""
+        self.start()
+        self.job_queue.put(("warm", config))
+
+    def submit(self, task_func, config):
+        """送出任務並回傳 job_id；工作程序尚未啟動 (或已結束) 時會自動啟動。"""
+        self.start()
+        job_id = next(self._job_ids)
+        self.job_queue.put(("run", job_id, task_func, config))
+        return job_id
+
+    def cancel(self, job_id):
+        if self.is_alive():
+            self.job_queue.put(("cancel", job_id))
+
+    def stop(self, timeout=5.0):
+        """等待目前的任務結束後關閉工作程序；逾時則強制終止。"""
+        if not self.is_alive():
+            return
+        self._stopping = True
+        self.job_queue.put(("stop",))
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.terminate()
+
+    def terminate(self):
+        if self.process is None:
+            return
+        self._stopping = True
+        self.process.terminate()
+        self.process.join(timeout=2)
+
 def main_cli():
     force_utf8_encoding()
     start_time = time.time()
@@ -1373,9 +3905,41 @@ def main_cli():
     parser.add_argument("--workers", type=int, default=1, help="併發處理的工作執行緒數（建議 2~4）。")
     parser.add_argument("--rpm", type=int, default=3, help="單程序每分鐘允許的最大請求數。")
     parser.add_argument("--max_retries", type=int, default=3, help="單個區塊的最大重試次數。")
-    parser.add_argument("--retry_base", type=int, default=65, help="重試基礎等待秒數；實際等待為此秒數 + 0~15 秒隨機抖動。")
-    parser.add_argument("--retry_cap", type=int, default=250, help="保留相容舊參數；v5_6_77 起不再使用。")
-    parser.add_argument("--empty_abort_threshold", type=int, default=5, help="連續空回應達到此次數就終止整個流程；0=關閉。")
+    parser.add_argument("--retry_base", type=int, default=65, help="配額 (429) 與未分類錯誤的重試基礎等待秒數；實際等待為此秒數 + 0~15 秒隨機抖動。伺服器提供 retryDelay 時以提示為準。")
+    parser.add_argument("--retry_cap", type=int, default=250, help="伺服器錯誤與逾時類別逐次加倍等待時的上限秒數。")
+    parser.add_argument("--upload_timeout", type=float, default=300, help="單次檔案上傳的期限秒數，逾時即放棄並重試；0=不限制。")
+    parser.add_argument("--generate_timeout", type=float, default=900, help="單次 generate_content 請求的期限秒數，逾時即放棄並重試；0=不限制。")
+    parser.add_argument("--stream", action='store_true', help="使用串流生成：邊接收邊解析字幕，嚴重修正超過閾值時提前中止並重試。")
+    parser.add_argument("--degenerate_repeat", type=int, default=12, help="同一句 (或最多 4 句的句組) 連續重複達此次數、且開始時間停滯或平均間隔小於 0.5 秒時，判定輸出陷入迴圈並重試。0 為停用。")
+    parser.add_argument("--degenerate_stall", type=int, default=20, help="連續多少條字幕的開始時間未前進即判定輸出陷入迴圈並重試。0 為停用。")
+    parser.add_argument("--no_context_cache", dest="context_cache", action='store_false', help="停用提示詞內容快取，每次請求都直接傳送完整提示詞。")
+    parser.add_argument("--cache_ttl", type=int, default=3600, help="提示詞內容快取的 TTL (秒)，任務進行中會自動延長。預設: 3600")
+    parser.add_argument("--response_cache_mb", type=float, default=512, help="本機回應快取 (_response_cache) 的容量上限 (MB)，以 LRU 淘汰。0 為停用。預設: 512")
+    parser.add_argument("--no_range_repair", dest="range_repair", action='store_false', help="停用局部重新轉錄：嚴重修正超過閾值時一律整段重試。")
+    parser.add_argument("--repair_margin", type=float, default=REPAIR_MARGIN_SECONDS, help="局部重新轉錄時，每個受損範圍前後額外包含的秒數。預設: 5")
+    parser.add_argument("--repair_max_fraction", type=float, default=0.4, help="受損範圍合計超過區塊時長的此比例時改為整段重試 (0~1)。預設: 0.4")
+    parser.add_argument("--no_best_attempt", dest="best_attempt", action='store_false', help="重試用盡時不採用最佳嘗試的結果 (該區塊留空)。")
+    parser.add_argument("--no_continuation", dest="continuation", action='store_false', help="回應因輸出 token 上限被截斷時不送出續寫請求 (只記錄截斷警告)。")
+    parser.add_argument("--http_pool", type=int, default=0, help="HTTP 連線池上限；0 表示依 workers 自動設定 (workers × 2 + 2)。")
+    parser.add_argument("--http_keepalive", type=float, default=HTTP_KEEPALIVE_SECONDS, help="閒置連線保留秒數，避免每個區塊重新做 TLS 交握 (預設: 120)。")
+    parser.add_argument("--no_http2", dest="http2", action='store_false', help="停用 HTTP/2 (預設在已安裝 h2 套件時啟用)。")
+    parser.add_argument("--fallback_models", default="", help="主模型每日額度用盡時依序改用的備援模型，以逗號分隔 (例如 gemini-2.5-flash,gemini-2.0-flash)。")
+    parser.add_argument("--draft_model", default=None, help="分層轉錄的草稿模型 (例如較快、較便宜的 flash 模型)；未通過品質門檻的區塊才升級至 --model_name。未設定時停用。")
+    parser.add_argument("--draft_retries", type=int, default=1, help="草稿模型每個區塊的最大嘗試次數。預設: 1")
+    parser.add_argument("--bisect_min", type=float, default=120, help="區塊用盡重試後對半切割重新轉錄，子段不短於此秒數。0 為停用。預設: 120")
+    parser.add_argument("--bisect_retries", type=int, default=2, help="對半切割後每個子段的最大嘗試次數。預設: 2")
+    parser.add_argument("--response_cache_bypass", action='store_true', help="略過回應快取查詢 (一律呼叫 API)，但仍寫入新的結果。")
+    parser.add_argument("--empty_abort_threshold", type=int, default=5, help="同一類錯誤 (空回應、解析失敗、伺服器錯誤、逾時、額度) 連續發生達此次數即開啟斷路器，暫停送出新請求。0 為停用。")
+    parser.add_argument("--circuit_cooldown", type=float, default=60, help="斷路器開啟後等待多久才放行探測請求 (秒)，探測失敗時加倍。預設: 60")
+    parser.add_argument("--circuit_max_probes", type=int, default=3, help="探測連續失敗達此次數即判定為持續性故障，其餘區塊直接標記失敗。預設: 3")
+    parser.add_argument("--batch_mode", action='store_true', help="以 Batch API 一次送出所有區塊 (費用較低但需等待批次完成，適合大量離線轉錄)；失敗的區塊改走一般請求。")
+    parser.add_argument("--batch_poll_interval", type=int, default=60, help="批次模式下查詢批次工作狀態的間隔 (秒)。預設: 60")
+    parser.add_argument("--batch_timeout", type=int, default=86400, help="批次模式下等待批次工作完成的總秒數上限，逾時即取消批次並改走一般請求。0 為不限。預設: 86400")
+    parser.add_argument("--standin", action='store_true', help="使用本機 Gemini 替身 (gemini_standin.py)，不連網、不消耗額度，僅供測試。")
+    parser.add_argument("--hedge", action='store_true', help="啟用尾端對沖請求：佇列清空後，對執行時間超過 p90 延遲的區塊再送一次請求，先完成者勝出。")
+    parser.add_argument("--hedge_quantile", type=float, default=0.9, help="觸發對沖請求的延遲分位數 (0~1)。")
+    parser.add_argument("--schedule", choices=SCHEDULE_POLICIES, default="index", help="區塊送出順序：index=依編號、longest=最長優先、history=過去較慢/常失敗優先、pinned=僅依 --pin_chunks 優先。")
+    parser.add_argument("--pin_chunks", help="優先處理的區塊編號 (從 1 起算)，以逗號分隔，例如 3,7。")
 
     # --- 局部轉錄模式參數 ---
     parser.add_argument("--partial_only", action='store_true', help="僅執行局部轉錄操作。")
@@ -1436,9 +4000,12 @@ def main_cli():
     sys.exit(exit_code)
 
 if __name__ == "__main__":
+    # 只檢查是否已安裝，不在啟動時載入整個 SDK
     try:
-        import google.genai
+        genai_installed = importlib.util.find_spec("google.genai") is not None
     except ImportError:
+        genai_installed = False
+    if not genai_installed:
         print("="*80 + "\n【重要環境配置錯誤】\n...")
         sys.exit(1)
     main_cli()